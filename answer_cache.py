@@ -0,0 +1,342 @@
+"""
+このファイルは、同じ質問に対する検索結果と回答を再利用するためのキャッシュのファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+import streamlit as st
+import constants as ct
+
+
+############################################################
+# 設定関連
+############################################################
+# 答えを左右する語として扱う、英数字の語（社員ID・年度・製品名など）とカタカナの語（顧客名・サービス名など）
+KEY_TERM_PATTERN = re.compile(r"[0-9a-z][0-9a-z_\-]*|[ァ-ヺ][ァ-ヺー・]*")
+
+
+############################################################
+# クラス定義
+############################################################
+
+class QueryResultCache:
+    """
+    (モード, 正規化した質問文, インデックスの世代番号)をキーに、検索結果のチャンクIDと回答を保持するLRUキャッシュ
+    """
+    def __init__(self, max_entries=ct.QUERY_CACHE_MAX_ENTRIES, ttl_seconds=ct.QUERY_CACHE_TTL_SECONDS):
+        """
+        Args:
+            max_entries: 保持する件数の上限（超過分は最も長く参照されていないものから削除）
+            ttl_seconds: 保持する秒数の上限
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # キャッシュ内の結果を作成したインデックスの世代番号
+        self._index_version = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        キャッシュから検索結果と回答を取得
+
+        Args:
+            key: 「create_cache_key」で作成したキー
+
+        Returns:
+            保存した値（存在しない、または期限切れの場合はNone）
+        """
+        with self._lock:
+            if not self._is_current(key):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry["created_at"] > self.ttl_seconds:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            # 参照されたものは、上限超過時に削除されにくいよう末尾に移動
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, key, value):
+        """
+        検索結果と回答をキャッシュに保存
+
+        Args:
+            key: 「create_cache_key」で作成したキー
+            value: 保存する値（検索結果のチャンクIDと回答の辞書）
+        """
+        with self._lock:
+            # 作り直し前のインデックスで作成した結果は保存しない
+            if not self._is_current(key):
+                return
+            self._entries[key] = {"value": value, "created_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        """
+        キャッシュの利用状況を取得
+
+        Returns:
+            ヒット数・ミス数・保持件数の辞書
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def _is_current(self, key):
+        """
+        キーが最新のインデックス世代のものかを確認
+        インデックスが作り直されていた場合は、古い世代の結果をすべて削除
+
+        Args:
+            key: 「create_cache_key」で作成したキー
+
+        Returns:
+            最新のインデックス世代のキーであればTrue
+        """
+        index_version = key[2]
+        if self._index_version is None or index_version > self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+        return index_version == self._index_version
+
+
+class SemanticAnswerCache:
+    """
+    質問文の埋め込みベクトルのコサイン類似度で、言い回しだけが異なる過去の質問の検索結果と回答を再利用するキャッシュ
+    埋め込みベクトルは部署名・顧客名などの違いに鈍いため、答えを左右する語が一致する質問に限って再利用する
+    """
+    def __init__(
+        self,
+        max_entries=ct.SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds=ct.QUERY_CACHE_TTL_SECONDS,
+        similarity_threshold=ct.SEMANTIC_CACHE_SIMILARITY_THRESHOLD
+    ):
+        """
+        Args:
+            max_entries: 保持する件数の上限（超過分は古いものから削除）
+            ttl_seconds: 保持する秒数の上限
+            similarity_threshold: 同じ質問とみなすコサイン類似度の下限
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        # 類似度は閾値以上だったが、答えを左右する語が異なるため再利用しなかった回数
+        self.rejections = 0
+        # 正規化した質問文の埋め込みベクトルを1行ずつ並べた行列と、各行に対応するエントリ
+        self._vectors = None
+        self._entries = []
+        # キャッシュ内の結果を作成したインデックスの世代番号
+        self._index_version = None
+        self._lock = threading.Lock()
+
+    def get(self, mode, vector, index_version, key_terms=frozenset()):
+        """
+        類似度が閾値以上で、答えを左右する語が一致する過去の質問のうち、最も近いものの検索結果と回答を取得
+
+        Args:
+            mode: 回答モード
+            vector: 質問文の埋め込みベクトル
+            index_version: 検索に使うインデックスの世代番号
+            key_terms: 「extract_key_terms」で取り出した、質問文の答えを左右する語
+
+        Returns:
+            (保存した値, コサイン類似度)（該当なしの場合はNone）
+        """
+        query = normalize_vector(vector)
+        with self._lock:
+            if not self._is_current(index_version) or not self._entries:
+                self.misses += 1
+                return None
+
+            # 件数が少ないため、全件との内積（正規化済みのためコサイン類似度）をまとめて計算する
+            similarities = self._vectors @ query
+            now = time.monotonic()
+            rejected = False
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.similarity_threshold:
+                    break
+                entry = self._entries[i]
+                if entry["mode"] != mode or now - entry["created_at"] > self.ttl_seconds:
+                    continue
+                # 「営業部の〜」と「開発部の〜」のように、言い回しが近くても対象が異なる質問は再利用しない
+                if entry["key_terms"] != key_terms:
+                    rejected = True
+                    continue
+                self.hits += 1
+                return entry["value"], float(similarities[i])
+
+            self.misses += 1
+            self.rejections += rejected
+            return None
+
+    def put(self, mode, vector, index_version, value, key_terms=frozenset()):
+        """
+        質問文の埋め込みベクトルと、検索結果・回答をキャッシュに保存
+
+        Args:
+            mode: 回答モード
+            vector: 質問文の埋め込みベクトル
+            index_version: 検索に使ったインデックスの世代番号
+            value: 保存する値（検索結果のチャンクIDと回答の辞書）
+            key_terms: 「extract_key_terms」で取り出した、質問文の答えを左右する語
+        """
+        row = normalize_vector(vector)[np.newaxis, :]
+        with self._lock:
+            # 作り直し前のインデックスで作成した結果は保存しない
+            if not self._is_current(index_version):
+                return
+            self._entries.append({"mode": mode, "key_terms": key_terms, "value": value, "created_at": time.monotonic()})
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            if len(self._entries) > self.max_entries:
+                overflow = len(self._entries) - self.max_entries
+                del self._entries[:overflow]
+                self._vectors = self._vectors[overflow:]
+
+    def get_stats(self):
+        """
+        キャッシュの利用状況を取得
+
+        Returns:
+            ヒット数・ミス数・ヒット率・答えを左右する語の違いで再利用しなかった回数・保持件数の辞書
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejections": self.rejections,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries)
+            }
+
+    def _is_current(self, index_version):
+        """
+        最新のインデックス世代かを確認
+        インデックスが作り直されていた場合は、古い世代の結果をすべて削除
+
+        Args:
+            index_version: インデックスの世代番号
+
+        Returns:
+            最新のインデックス世代であればTrue
+        """
+        if self._index_version is None or index_version > self._index_version:
+            self._entries = []
+            self._vectors = None
+            self._index_version = index_version
+
+        return index_version == self._index_version
+
+
+############################################################
+# 関数定義
+############################################################
+
+def normalize_question(question):
+    """
+    キャッシュのキーとして使うため、質問文の表記揺れを正規化
+
+    Args:
+        question: 質問文
+
+    Returns:
+        正規化した質問文
+    """
+    # 全角・半角、大文字・小文字、空白の違いと、文末の句読点・記号の違いは同じ質問として扱う
+    normalized = " ".join(unicodedata.normalize("NFKC", question).lower().split())
+    return re.sub(r"[。、.,!?！？\s]+$", "", normalized)
+
+
+def extract_key_terms(question, entity_terms=None):
+    """
+    類似質問のキャッシュで一致を求める、質問文の答えを左右する語を取り出す
+    （部署名・氏名、英数字の語（社員ID・年度など）、カタカナの語（顧客名・サービス名など））
+
+    Args:
+        question: 質問文
+        entity_terms: 質問文中の表記 → 部署名・氏名の辞書（長い表記から順に並べた、社員名簿の「entity_terms」）
+
+    Returns:
+        答えを左右する語の集合
+    """
+    normalized = unicodedata.normalize("NFKC", question).lower()
+
+    # 長い表記から順に照合し、照合した部分は取り除く（「営業部」の「営業」や「IT部」の「it」を重ねて拾わないため）
+    key_terms = set()
+    for term in entity_terms or {}:
+        if term in normalized:
+            key_terms.add(entity_terms[term])
+            normalized = normalized.replace(term, " ")
+
+    key_terms.update(KEY_TERM_PATTERN.findall(normalized))
+    return frozenset(key_terms)
+
+
+def normalize_vector(vector):
+    """
+    内積がコサイン類似度になるよう、埋め込みベクトルを長さ1に正規化
+
+    Args:
+        vector: 埋め込みベクトル
+
+    Returns:
+        正規化したベクトル（float32）
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def create_cache_key(mode, question, index_version):
+    """
+    キャッシュのキーを作成
+
+    Args:
+        mode: 回答モード
+        question: 会話履歴なしでも理解できる独立した質問文
+        index_version: 検索に使ったインデックスの世代番号
+
+    Returns:
+        キャッシュのキー
+    """
+    return (mode, normalize_question(question), index_version)
+
+
+@st.cache_resource
+def get_query_result_cache():
+    """
+    プロセス内の全セッションで共有するキャッシュを取得
+
+    Returns:
+        キャッシュ
+    """
+    return QueryResultCache()
+
+
+@st.cache_resource
+def get_semantic_answer_cache():
+    """
+    プロセス内の全セッションで共有する、類似質問のキャッシュを取得
+
+    Returns:
+        キャッシュ
+    """
+    return SemanticAnswerCache()
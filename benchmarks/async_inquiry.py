@@ -0,0 +1,198 @@
+"""
+このファイルは、LLMへの問い合わせを共有のイベントループで非同期に行った場合と、スレッドで同期的に行った場合の
+処理件数（1秒あたりの回答数）を比較するスクリプトです。
+
+使い方:
+    python benchmarks/async_inquiry.py [--requests 50 200 1000] [--workers 8] [--latency-ms 300]
+
+OpenAIのAPIは使わず、一定時間待ってから回答を返す（ストリーミングにも対応した）偽のLLMサーバーを手元で起動し、
+「utils.get_question_answer_chain」で作成した回答用のChainを使って、問い合わせ件数ごとに以下を計測します。
+- スレッドプール（画面処理のスレッド数の目安）から同期的に「invoke」した場合の所要時間
+- 共有のイベントループ（utils.get_event_loop）上で、すべての問い合わせを同時に「ainvoke」した場合の所要時間
+非同期の場合の同時実行数は、スレッド数ではなくHTTP接続数の上限（LLM_HTTP_MAX_CONNECTIONS）で決まります。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from langchain.schema import Document
+
+# リポジトリ直下のモジュールを読み込むため、読み込み先に追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import constants as ct
+import utils
+
+
+############################################################
+# 設定関連
+############################################################
+# 偽のLLMサーバーがストリーミングで返す回答の断片
+ANSWER_TOKENS = ["社内規程によると、", "経費精算の締め日は", "毎月25日です。"]
+# 回答用のChainに渡す入力
+CHAIN_INPUT = {
+    "input": "経費精算の締め日はいつですか？",
+    "chat_history": [],
+    "context": [Document(page_content="経費精算の締め日は毎月25日です。", metadata={"source": "規程.pdf"})]
+}
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_fake_llm_app(latency):
+    """
+    OpenAIのChat Completions APIと同じ形式で、一定時間待ってから回答を返す偽のLLMサーバーを作成
+
+    Args:
+        latency: 回答を返すまでの待ち時間（秒）
+
+    Returns:
+        aiohttpのアプリケーション
+    """
+    async def chat_completions(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for token in ANSWER_TOKENS:
+                chunk = {
+                    "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        return web.json_response({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(ANSWER_TOKENS)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+def start_fake_llm_server(latency):
+    """
+    偽のLLMサーバーを、専用のスレッドのイベントループで起動
+
+    Args:
+        latency: 回答を返すまでの待ち時間（秒）
+
+    Returns:
+        サーバーのベースURL
+    """
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_fake_llm_app(latency))
+    loop.run_until_complete(runner.setup())
+    # 空いているポートを使う
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    threading.Thread(target=loop.run_forever, name="fake-llm-server", daemon=True).start()
+
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def measure_threads(chain, requests, workers):
+    """
+    スレッドプールから同期的に問い合わせた場合の所要時間を計測
+
+    Args:
+        chain: 回答用のChain
+        requests: 問い合わせ件数
+        workers: スレッド数
+
+    Returns:
+        秒数
+    """
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: chain.invoke(CHAIN_INPUT), range(requests)))
+    return time.perf_counter() - start_time
+
+
+def measure_event_loop(chain, requests):
+    """
+    共有のイベントループ上で、すべての問い合わせを同時に非同期で行った場合の所要時間を計測
+
+    Args:
+        chain: 回答用のChain
+        requests: 問い合わせ件数
+
+    Returns:
+        秒数
+    """
+    async def run_all():
+        return await asyncio.gather(*[chain.ainvoke(CHAIN_INPUT) for _ in range(requests)])
+
+    start_time = time.perf_counter()
+    asyncio.run_coroutine_threadsafe(run_all(), utils.get_event_loop()).result()
+    return time.perf_counter() - start_time
+
+
+def main(argv=None):
+    """
+    問い合わせ件数ごとの計測結果を、1行に1件のJSONとして標準出力に出力
+
+    Args:
+        argv: コマンドライン引数のリスト（Noneの場合は実行時の引数）
+
+    Returns:
+        終了コード
+    """
+    parser = argparse.ArgumentParser(description="偽のLLMサーバーに対して、同期・非同期の問い合わせの処理件数を比較します。")
+    parser.add_argument("--requests", type=int, nargs="+", default=[50, 200, 1000], help="計測する問い合わせ件数")
+    parser.add_argument("--workers", type=int, default=8, help="同期的に問い合わせる場合のスレッド数")
+    parser.add_argument("--latency-ms", type=int, default=300, help="偽のLLMサーバーが回答を返すまでの待ち時間（ミリ秒）")
+    args = parser.parse_args(argv)
+
+    # 計測結果のみを出力するため、アプリのログは出力しない
+    logging.getLogger(ct.LOGGER_NAME).disabled = True
+    # 「streamlit run」以外から「st.cache_resource」の関数を呼び出した際の警告も出力しない
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    # 回答用のChainのLLMが、偽のLLMサーバーに接続するようにする
+    base_url = start_fake_llm_server(args.latency_ms / 1000)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    chain = utils.get_question_answer_chain(ct.ANSWER_MODE_2)
+    # 接続の確立を計測に含めないよう、1件問い合わせておく
+    chain.invoke(CHAIN_INPUT)
+
+    for requests in args.requests:
+        thread_seconds = measure_threads(chain, requests, args.workers)
+        loop_seconds = measure_event_loop(chain, requests)
+        print(json.dumps({
+            "requests": requests,
+            "latency_ms": args.latency_ms,
+            "threads": args.workers,
+            "thread_seconds": round(thread_seconds, 2),
+            "thread_requests_per_second": round(requests / thread_seconds, 1),
+            "event_loop_seconds": round(loop_seconds, 2),
+            "event_loop_requests_per_second": round(requests / loop_seconds, 1),
+            "max_connections": ct.LLM_HTTP_MAX_CONNECTIONS
+        }, ensure_ascii=False), flush=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+このファイルは、社員名簿の件数を増やしたときの、読み込み・一覧化・類似質問のキャッシュの照合にかかる時間を計測するスクリプトです。
+
+使い方:
+    python benchmarks/employee_directory.py [--sizes 50 1000 10000 100000] [--repeat 20]
+
+リポジトリ同梱の社員名簿をもとに、指定の件数の社員名簿を一時フォルダに作成し、件数ごとに以下を計測します。
+- 「utils.load_employee_csv」で部署ごとの統合ドキュメントを作成する時間
+- 従業員インデックス（employee_directory.EmployeeDirectory）を作成する時間
+- 一覧化を求める質問1件に、従業員インデックスから回答する時間
+- 類似質問のキャッシュで使う、質問文の答えを左右する語の取り出し1件の時間
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+# リポジトリ直下のモジュールを読み込むため、読み込み先に追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import constants as ct
+import answer_cache
+import employee_directory
+import utils
+
+
+############################################################
+# 設定関連
+############################################################
+SOURCE_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ct.EMPLOYEE_CSV_PATH)
+QUESTIONS = [
+    "人事部に所属している従業員情報を一覧化して",
+    "営業部の社員は何人？",
+    "正社員とインターンの一覧",
+    "山下涼平さんの保有資格は？",
+]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_roster(df, size):
+    """
+    同梱の社員名簿の行を繰り返して、指定の件数の社員名簿を作成
+    社員IDは行ごとに振り直し、氏名は姓と名の組み合わせを変えて同姓・同名の従業員が現実的な割合になるようにする
+
+    Args:
+        df: 同梱の社員名簿のデータフレーム
+        size: 作成する件数
+
+    Returns:
+        社員名簿のデータフレーム
+    """
+    roster = pd.concat([df] * (size // len(df) + 1), ignore_index=True).iloc[:size].copy()
+    names = df[ct.EMPLOYEE_NAME_COLUMN].str.split(" ", n=1, expand=True)
+    surnames, given_names = names[0].to_numpy(), names[1].fillna("").to_numpy()
+    positions = range(size)
+    roster[ct.EMPLOYEE_NAME_COLUMN] = [
+        f"{surnames[i % len(surnames)]} {given_names[(i // len(surnames)) % len(given_names)]}" for i in positions
+    ]
+    roster["社員ID"] = [f"EMP{i + 1:06d}" for i in positions]
+    return roster
+
+
+def measure(func, repeat=1):
+    """
+    関数の実行にかかる時間を計測
+
+    Args:
+        func: 計測する関数
+        repeat: 繰り返す回数
+
+    Returns:
+        (1回あたりの秒数, 最後の実行結果)
+    """
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start_time) / repeat, result
+
+
+def run(size, df, work_dir, repeat):
+    """
+    1つの件数について計測
+
+    Args:
+        size: 社員名簿の件数
+        df: 同梱の社員名簿のデータフレーム
+        work_dir: 作成した社員名簿の保存先フォルダ
+        repeat: 質問1件あたりの計測の繰り返し回数
+
+    Returns:
+        計測結果の辞書
+    """
+    path = os.path.join(work_dir, f"社員名簿_{size}.csv")
+    create_roster(df, size).to_csv(path, index=False, encoding="utf-8")
+
+    csv_seconds, docs = measure(lambda: utils.load_employee_csv(path))
+    build_seconds, directory = measure(lambda: employee_directory.EmployeeDirectory(
+        pd.read_csv(path, encoding="utf-8", dtype=str).fillna(""), path
+    ))
+    answer_seconds = sum(measure(lambda: directory.answer(question), repeat)[0] for question in QUESTIONS) / len(QUESTIONS)
+    key_terms_seconds = sum(
+        measure(lambda: answer_cache.extract_key_terms(question, directory.entity_terms), repeat)[0] for question in QUESTIONS
+    ) / len(QUESTIONS)
+
+    return {
+        "rows": size,
+        "documents": len(docs),
+        "load_employee_csv_seconds": round(csv_seconds, 3),
+        "directory_build_seconds": round(build_seconds, 3),
+        "entity_terms": len(directory.entity_terms),
+        "answer_ms": round(answer_seconds * 1000, 2),
+        "extract_key_terms_ms": round(key_terms_seconds * 1000, 2)
+    }
+
+
+def main(argv=None):
+    """
+    件数ごとの計測結果を、1行に1件のJSONとして標準出力に出力
+
+    Args:
+        argv: コマンドライン引数のリスト（Noneの場合は実行時の引数）
+
+    Returns:
+        終了コード
+    """
+    parser = argparse.ArgumentParser(description="社員名簿の件数ごとに、読み込み・一覧化にかかる時間を計測します。")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 1000, 10000, 100000], help="計測する社員名簿の件数")
+    parser.add_argument("--repeat", type=int, default=20, help="質問1件あたりの計測の繰り返し回数")
+    args = parser.parse_args(argv)
+
+    # 計測結果のみを出力するため、アプリのログは出力しない
+    logging.getLogger(ct.LOGGER_NAME).disabled = True
+    df = pd.read_csv(SOURCE_CSV_PATH, encoding="utf-8", dtype=str).fillna("")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            print(json.dumps(run(size, df, work_dir, args.repeat), ensure_ascii=False), flush=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+このファイルは、類似質問のキャッシュの閾値（SEMANTIC_CACHE_SIMILARITY_THRESHOLD）を調整するためのスクリプトです。
+
+使い方:
+    python benchmarks/semantic_cache_threshold.py [--pairs benchmarks/data/semantic_cache_pairs.jsonl]
+
+言い換え（paraphrase: 同じ回答を再利用してよい）と、取り違えやすい質問（near_miss: 再利用してはいけない）の組を
+設定中の埋め込みモデルで埋め込み、閾値ごとに言い換えの再利用率と取り違えの件数を、答えを左右する語の一致条件の有無別に出力します。
+取り違えが0件になる閾値のうち、言い換えの再利用率が最も高いものを推奨値として出力します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import os
+import sys
+import numpy as np
+from dotenv import load_dotenv
+
+# リポジトリ直下のモジュールを読み込むため、読み込み先に追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import constants as ct
+import answer_cache
+import embedding_pipeline
+import employee_directory
+
+
+############################################################
+# 設定関連
+############################################################
+# 「.env」ファイルで定義した環境変数の読み込み
+load_dotenv()
+
+PAIRS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "semantic_cache_pairs.jsonl")
+# 評価する閾値の範囲と刻み幅
+THRESHOLD_MIN = 0.90
+THRESHOLD_MAX = 0.995
+THRESHOLD_STEP = 0.005
+
+
+############################################################
+# 関数定義
+############################################################
+
+def load_pairs(path):
+    """
+    評価用の質問の組を読み込む
+
+    Args:
+        path: 1行に1組（question_a・question_b・label）を記録したJSON Linesファイルのパス
+
+    Returns:
+        質問の組のリスト
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compute_similarities(pairs, embeddings):
+    """
+    質問の組ごとに、埋め込みベクトルのコサイン類似度を計算
+
+    Args:
+        pairs: 質問の組のリスト
+        embeddings: 埋め込みモデル
+
+    Returns:
+        コサイン類似度の配列
+    """
+    vectors_a = embeddings.embed_documents([pair["question_a"] for pair in pairs])
+    vectors_b = embeddings.embed_documents([pair["question_b"] for pair in pairs])
+    return np.array([
+        float(answer_cache.normalize_vector(a) @ answer_cache.normalize_vector(b))
+        for a, b in zip(vectors_a, vectors_b)
+    ])
+
+
+def evaluate(pairs, similarities, key_terms_match):
+    """
+    閾値ごとに、言い換えの再利用率と取り違えの件数を集計
+
+    Args:
+        pairs: 質問の組のリスト
+        similarities: 質問の組ごとのコサイン類似度
+        key_terms_match: 質問の組ごとの、答えを左右する語が一致するか
+
+    Returns:
+        閾値ごとの集計結果のリスト
+    """
+    labels = np.array([pair["label"] for pair in pairs])
+    paraphrases = labels == "paraphrase"
+    near_misses = labels == "near_miss"
+
+    results = []
+    for threshold in np.arange(THRESHOLD_MIN, THRESHOLD_MAX + 1e-9, THRESHOLD_STEP):
+        hits = similarities >= threshold
+        guarded_hits = hits & key_terms_match
+        results.append({
+            "threshold": round(float(threshold), 3),
+            "paraphrase_hit_rate": round(float(hits[paraphrases].mean()), 3),
+            "near_miss_hits": int(hits[near_misses].sum()),
+            "guarded_paraphrase_hit_rate": round(float(guarded_hits[paraphrases].mean()), 3),
+            "guarded_near_miss_hits": int(guarded_hits[near_misses].sum())
+        })
+
+    return results
+
+
+def main(argv=None):
+    """
+    閾値ごとの集計結果と推奨値を標準出力に出力
+
+    Args:
+        argv: コマンドライン引数のリスト（Noneの場合は実行時の引数）
+
+    Returns:
+        終了コード
+    """
+    parser = argparse.ArgumentParser(description="類似質問のキャッシュの閾値を、言い換え・取り違えやすい質問の組で評価します。")
+    parser.add_argument("--pairs", default=PAIRS_PATH, help="評価用の質問の組のファイル")
+    args = parser.parse_args(argv)
+
+    pairs = load_pairs(args.pairs)
+    similarities = compute_similarities(pairs, embedding_pipeline.get_embeddings())
+
+    directory = employee_directory.get_employee_directory()
+    entity_terms = directory.entity_terms if directory else None
+    key_terms_match = np.array([
+        answer_cache.extract_key_terms(pair["question_a"], entity_terms)
+        == answer_cache.extract_key_terms(pair["question_b"], entity_terms)
+        for pair in pairs
+    ])
+
+    for pair, similarity in zip(pairs, similarities):
+        print(f"{similarity:.4f}\t{pair['label']}\t{pair['question_a']} / {pair['question_b']}")
+
+    results = evaluate(pairs, similarities, key_terms_match)
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+
+    # 取り違えが0件の閾値のうち、言い換えの再利用率が最も高い（同率なら低い）ものを推奨値とする
+    safe = [result for result in results if result["guarded_near_miss_hits"] == 0]
+    if safe:
+        best = max(safe, key=lambda result: (result["guarded_paraphrase_hit_rate"], -result["threshold"]))
+        print(f"推奨する閾値: {best['threshold']}（モデル: {ct.EMBEDDING_MODEL}、現在の設定: {ct.SEMANTIC_CACHE_SIMILARITY_THRESHOLD}）")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
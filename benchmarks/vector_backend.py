@@ -0,0 +1,240 @@
+"""
+このファイルは、チャンク数を増やしたときの「numpy」形式のベクターストア（vector_backend.NumpyVectorStore）の
+作成・差分保存・検索にかかる時間と書き込み量を計測するスクリプトです。
+
+使い方:
+    python benchmarks/vector_backend.py [--sizes 50 1000 10000 100000] [--dim 1536] [--dtype float32] [--change-ratio 0.01]
+
+埋め込みAPIは使わず、クラスタ状に分布する乱数のベクトルをチャンクの埋め込みベクトルとして使います。件数ごとに以下を計測します。
+- 全チャンクを登録して保存する時間と、保存したファイルのサイズ
+- 前の世代を引き継ぎ、一定割合のチャンクを差し替えて保存する時間と、新しく書き込んだファイルのサイズ
+- 全件検索・IVF検索のクエリ1件あたりの時間と、全件検索に対するIVF検索の再現率
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# リポジトリ直下のモジュールを読み込むため、読み込み先に追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import constants as ct
+import vector_backend
+
+
+############################################################
+# 設定関連
+############################################################
+# 乱数のベクトルを作る際のクラスタ数と、計測に使うクエリ数・取得件数
+CLUSTER_COUNT = 64
+QUERY_COUNT = 20
+TOP_K = 10
+# 登録時に一度に追加するチャンク数
+UPSERT_BATCH_ROWS = 10000
+
+
+############################################################
+# クラス定義
+############################################################
+
+class QueryVectorEmbeddings(Embeddings):
+    """
+    クエリの文字列（「q0」など）に対応する、あらかじめ作成したベクトルを返す埋め込みモデルの代わり
+    """
+    def __init__(self, query_vectors):
+        self.query_vectors = query_vectors
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.query_vectors[int(text[1:])].tolist()
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_vectors(rng, centroids, count):
+    """
+    クラスタの中心の周りに分布する乱数のベクトルを作成
+
+    Args:
+        rng: 乱数生成器
+        centroids: クラスタの中心の行列
+        count: 作成する件数
+
+    Returns:
+        ベクトルの行列（float32）
+    """
+    labels = rng.integers(0, len(centroids), count)
+    noise = rng.standard_normal((count, centroids.shape[1]), dtype=np.float32) * 0.5
+    return centroids[labels] + noise
+
+
+def upsert_rows(db, rng, centroids, ids):
+    """
+    チャンクIDごとに乱数のベクトルを作成し、まとめて登録
+
+    Args:
+        db: ベクターストア
+        rng: 乱数生成器
+        centroids: クラスタの中心の行列
+        ids: チャンクIDのリスト
+    """
+    for start in range(0, len(ids), UPSERT_BATCH_ROWS):
+        batch = ids[start:start + UPSERT_BATCH_ROWS]
+        vectors = create_vectors(rng, centroids, len(batch))
+        db.upsert(batch, vectors, [f"チャンク{chunk_id}" for chunk_id in batch], [{"source": "benchmark"} for _ in batch])
+
+
+def get_new_bytes(generation_path):
+    """
+    前の世代からハードリンクで引き継いだファイルを除いた、新しく書き込んだファイルの合計サイズを取得
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+
+    Returns:
+        バイト数
+    """
+    sizes = [os.stat(os.path.join(generation_path, name)) for name in os.listdir(generation_path)]
+    return sum(stat.st_size for stat in sizes if stat.st_nlink == 1)
+
+
+def measure_search(db, k):
+    """
+    クエリ1件あたりの検索時間と、検索結果のチャンクIDを取得
+
+    Args:
+        db: ベクターストア
+        k: 取得件数
+
+    Returns:
+        (1件あたりの秒数, クエリごとのチャンクIDの集合のリスト)
+    """
+    start_time = time.perf_counter()
+    results = [
+        {doc.metadata["chunk_id"] for doc in db.similarity_search(f"q{i}", k)}
+        for i in range(QUERY_COUNT)
+    ]
+    return (time.perf_counter() - start_time) / QUERY_COUNT, results
+
+
+def build_generation(generation_path, size, dim, dtype, search_type):
+    """
+    乱数のベクトルで全チャンクを登録したインデックス世代を作成（同じ件数・次元数であれば、同じベクトルになる）
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        size: チャンク数
+        dim: 埋め込みベクトルの次元数
+        dtype: 行列の保存形式
+        search_type: 検索方式
+
+    Returns:
+        (ベクターストア, チャンクIDのリスト, 乱数生成器, クラスタの中心の行列, 登録と保存にかかった秒数)
+    """
+    rng = np.random.default_rng(0)
+    centroids = rng.standard_normal((CLUSTER_COUNT, dim), dtype=np.float32)
+    embeddings = QueryVectorEmbeddings(create_vectors(rng, centroids, QUERY_COUNT))
+    ids = [f"c{i}" for i in range(size)]
+
+    os.makedirs(generation_path)
+    start_time = time.perf_counter()
+    db = vector_backend.NumpyVectorStore(generation_path, embeddings, dtype=dtype, search_type=search_type)
+    upsert_rows(db, rng, centroids, ids)
+    db.persist()
+
+    return db, ids, rng, centroids, time.perf_counter() - start_time
+
+
+def run(size, args, work_dir):
+    """
+    1つの件数について計測
+
+    Args:
+        size: チャンク数
+        args: コマンドライン引数の解析結果
+        work_dir: インデックス世代の保存先フォルダ
+
+    Returns:
+        計測結果の辞書
+    """
+    # 全チャンクの登録と保存
+    first_path = os.path.join(work_dir, f"{size}-1")
+    db, ids, rng, centroids, full_seconds = build_generation(first_path, size, args.dim, args.dtype, "exact")
+    embeddings = db.embeddings
+    full_bytes = get_new_bytes(first_path)
+    exact_seconds, exact_results = measure_search(db, TOP_K)
+
+    # 前の世代を引き継ぎ、一定割合のチャンクを差し替えて保存
+    second_path = os.path.join(work_dir, f"{size}-2")
+    start_time = time.perf_counter()
+    vector_backend.clone_generation(first_path, second_path)
+    db = vector_backend.NumpyVectorStore(second_path, embeddings, dtype=args.dtype, search_type="exact")
+    changed_ids = list(rng.choice(ids, max(1, int(size * args.change_ratio)), replace=False))
+    upsert_rows(db, rng, centroids, changed_ids)
+    db.persist()
+    delta_seconds = time.perf_counter() - start_time
+    delta_bytes = get_new_bytes(second_path)
+
+    # 同じベクトルでIVFのクラスタを学習した世代を作成し、全件検索の結果と比べる
+    # （IVFは「VECTOR_IVF_MIN_ROWS」以上の行数のセグメントのみで使われ、それ未満は全件検索になる）
+    ivf_db, _, _, _, ivf_build_seconds = build_generation(os.path.join(work_dir, f"{size}-ivf"), size, args.dim, args.dtype, "ivf")
+    ivf_seconds, ivf_results = measure_search(ivf_db, TOP_K)
+    recall = np.mean([len(ivf & exact) / TOP_K for ivf, exact in zip(ivf_results, exact_results)])
+
+    return {
+        "chunks": size,
+        "full_persist_seconds": round(full_seconds, 3),
+        "full_bytes": full_bytes,
+        "changed_chunks": len(changed_ids),
+        "delta_persist_seconds": round(delta_seconds, 3),
+        "delta_bytes": delta_bytes,
+        "exact_search_ms": round(exact_seconds * 1000, 2),
+        "ivf_persist_seconds": round(ivf_build_seconds, 3),
+        "ivf_search_ms": round(ivf_seconds * 1000, 2),
+        "ivf_recall_at_10": round(float(recall), 3)
+    }
+
+
+def main(argv=None):
+    """
+    件数ごとの計測結果を、1行に1件のJSONとして標準出力に出力
+
+    Args:
+        argv: コマンドライン引数のリスト（Noneの場合は実行時の引数）
+
+    Returns:
+        終了コード
+    """
+    parser = argparse.ArgumentParser(description="チャンク数ごとに、ベクターストアの保存・検索にかかる時間を計測します。")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 1000, 10000, 100000], help="計測するチャンク数")
+    parser.add_argument("--dim", type=int, default=1536, help="埋め込みベクトルの次元数（text-embedding-ada-002は1536）")
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default=ct.VECTOR_DTYPE, help="行列の保存形式")
+    parser.add_argument("--change-ratio", type=float, default=0.01, help="差分保存で差し替えるチャンクの割合")
+    args = parser.parse_args(argv)
+
+    # 計測結果のみを出力するため、アプリのログは出力しない
+    logging.getLogger(ct.LOGGER_NAME).disabled = True
+    # 前の世代の引き継ぎ（clone_generation）を、「numpy」形式のハードリンクで行う
+    ct.VECTOR_BACKEND = "numpy"
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            print(json.dumps(run(size, args, work_dir), ensure_ascii=False), flush=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
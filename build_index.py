@@ -0,0 +1,120 @@
+"""
+このファイルは、RAGのインデックスを画面表示とは切り離して事前に作成するためのコマンドラインツールです。
+
+使い方:
+    python build_index.py [--data-dir ./data] [--output-dir ./.vectorstore] [--full-rebuild]
+
+作成したインデックス世代（ベクトル・チャンク・マニフェスト・作成時の統計）を出力先フォルダに保存し、
+公開中の世代として記録します。アプリは既定で起動時にこの世代を読み込むのみで、作成・更新は行いません。
+起動中のアプリは、画面の再実行のたびに公開中の世代を確認し、このツールで新しい世代を公開すると次の操作から切り替わります。
+公開中の世代がない状態で起動すると、検索を受け付けずにエラーを表示するため、アプリの起動前に実行してください。
+開発時など、画面読み込み時に作成・更新も行いたい場合は、環境変数「INDEX_BUILD_ON_STARTUP」を「true」にして起動します。
+Webページの定期的な取得し直しと、参照先フォルダの変更の監視も、この場合のみ行います（既定では、このツールを定期的に実行してください）。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import logging
+import sys
+from dotenv import load_dotenv
+import constants as ct
+
+
+############################################################
+# 設定関連
+############################################################
+# 「.env」ファイルで定義した環境変数の読み込み
+load_dotenv()
+
+
+############################################################
+# 関数定義
+############################################################
+
+def parse_args(argv=None):
+    """
+    コマンドライン引数の解析
+
+    Args:
+        argv: コマンドライン引数のリスト（Noneの場合は実行時の引数）
+
+    Returns:
+        解析結果
+    """
+    parser = argparse.ArgumentParser(description="RAGのインデックスを作成し、公開中の世代として保存します。")
+    parser.add_argument("--data-dir", default=ct.RAG_TOP_FOLDER_PATH, help="読み込み対象のデータソースのフォルダ")
+    parser.add_argument("--output-dir", default=ct.VECTOR_STORE_DIR_PATH, help="インデックス世代の保存先フォルダ")
+    parser.add_argument("--full-rebuild", action="store_true", help="公開中の世代を使わず、すべてのデータソースを読み込み直す")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=ct.VECTOR_BACKEND, help="ベクターストアの種類")
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default=ct.VECTOR_DTYPE, help="「numpy」の場合の行列の保存形式")
+    parser.add_argument("--search-type", choices=["exact", "ivf"], default=ct.VECTOR_SEARCH_TYPE, help="「numpy」の場合の検索方式")
+
+    return parser.parse_args(argv)
+
+
+def initialize_logger():
+    """
+    ログ出力の設定（コマンドラインからの実行時は、標準エラー出力に出力）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    if logger.hasHandlers():
+        return
+
+    log_handler = logging.StreamHandler(sys.stderr)
+    log_handler.setFormatter(logging.Formatter("[%(levelname)s] %(asctime)s: %(message)s"))
+    logger.setLevel(logging.INFO)
+    logger.addHandler(log_handler)
+
+
+def main(argv=None):
+    """
+    インデックスを作成し、作成時の統計を標準出力に出力
+
+    Args:
+        argv: コマンドライン引数のリスト（Noneの場合は実行時の引数）
+
+    Returns:
+        終了コード
+    """
+    args = parse_args(argv)
+
+    # 設定はインデックスの作成処理から参照されるため、読み込む前に上書きする
+    ct.RAG_TOP_FOLDER_PATH = args.data_dir
+    ct.VECTOR_STORE_DIR_PATH = args.output_dir
+    ct.VECTOR_BACKEND = args.backend
+    ct.VECTOR_DTYPE = args.dtype
+    ct.VECTOR_SEARCH_TYPE = args.search_type
+
+    initialize_logger()
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    # 画面側と同じ読み込み・チャンク分割・埋め込みの処理を使って作成する
+    # （引数の既定値に設定を使う関数があるため、設定を上書きした後に読み込む）
+    import initialize
+    import index_manager
+
+    try:
+        result = initialize.build_vectorstore(
+            loaded_generation_path=None if args.full_rebuild else index_manager.get_current_generation_path(),
+            full_rebuild=args.full_rebuild
+        )
+    except Exception as e:
+        logger.error({"message": ct.INDEX_BUILD_ERROR_MESSAGE, "error": f"{type(e).__name__}: {e}"})
+        return 1
+
+    # 変更がなかった場合は、公開中の世代の統計を出力
+    generation_path = result[2] if result else index_manager.get_current_generation_path()
+    if not result:
+        logger.info({"message": "データソースに変更がないため、公開中の世代をそのまま使います。", "generation": generation_path})
+
+    stats = index_manager.load_build_stats(generation_path) or {"generation": generation_path}
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
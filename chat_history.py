@@ -0,0 +1,187 @@
+"""
+このファイルは、LLMとのやりとりに使う会話履歴を、トークン数の上限内に収めて管理するファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+import constants as ct
+import context_packer
+
+
+############################################################
+# 設定関連
+############################################################
+# 古い会話の要約を、回答の表示を待たせずに裏で作成するためのスレッドプール（全セッションで共有）
+summary_executor = ThreadPoolExecutor(max_workers=ct.CHAT_HISTORY_SUMMARY_WORKERS)
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ChatHistory:
+    """
+    直近の会話はトークン数の上限まで原文で保持し、それより古い会話は要約に順次まとめていく会話履歴
+    """
+    def __init__(self, summarize):
+        """
+        Args:
+            summarize: (これまでの要約, 要約に追加する会話のメッセージのリスト)を受け取り、新しい要約を返す関数
+        """
+        self.summarize = summarize
+        # 原文で保持する直近の会話（(ユーザー入力, 回答, トークン数)のリスト）
+        self._turns = []
+        # 要約待ちの会話（要約が完成するまでは原文のまま履歴に含める）
+        self._pending_turns = []
+        # これまでの会話の要約
+        self._summary = ""
+        self._summary_tokens = 0
+        # 利用状況
+        self.total_turns = 0
+        self.summarized_turns = 0
+        self.summary_calls = 0
+        self.truncated_messages = 0
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        """
+        会話履歴があるかどうか（会話履歴がない場合の判定を、従来のリストと同じように書けるようにする）
+        """
+        with self._lock:
+            return bool(self._summary or self._pending_turns or self._turns)
+
+    def add_turn(self, chat_message, answer):
+        """
+        1往復分の会話を追加し、上限を超えた古い会話を要約にまとめる
+
+        Args:
+            chat_message: ユーザー入力値
+            answer: LLMからの回答
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+
+        # 大きな表などを含む回答は、履歴としては先頭部分のみを残す
+        answer = self._truncate(answer)
+        tokens = context_packer.count_tokens(chat_message) + context_packer.count_tokens(answer)
+
+        with self._lock:
+            self._turns.append((chat_message, answer, tokens))
+            self.total_turns += 1
+
+            # 上限を超えた場合は、上限の半分になるまで古い会話を要約待ちに移す
+            # （1往復ごとに要約を作り直さないよう、まとめて要約する）
+            if self._get_window_tokens() > ct.CHAT_HISTORY_TOKEN_BUDGET:
+                while len(self._turns) > 1 and self._get_window_tokens() > ct.CHAT_HISTORY_TOKEN_BUDGET // 2:
+                    self._pending_turns.append(self._turns.pop(0))
+
+            start_summary = bool(self._pending_turns) and not self._summarizing
+            if start_summary:
+                self._summarizing = True
+
+        if start_summary:
+            summary_executor.submit(self._update_summary)
+
+        logger.info({"message": "会話履歴を更新しました。", **self.get_stats()})
+
+    def get_messages(self):
+        """
+        LLMに渡す会話履歴のメッセージを取得
+
+        Returns:
+            メッセージのリスト（これまでの要約、要約待ちの会話、直近の会話の順）
+        """
+        with self._lock:
+            messages = []
+            if self._summary:
+                messages.append(SystemMessage(content=f"これまでの会話の要約:\n{self._summary}"))
+            for chat_message, answer, _ in self._pending_turns + self._turns:
+                messages.extend([HumanMessage(content=chat_message), AIMessage(content=answer)])
+
+            return messages
+
+    def get_stats(self):
+        """
+        会話履歴の利用状況を取得
+
+        Returns:
+            会話数・原文で保持している会話数とトークン数・要約済みの会話数と要約のトークン数などの辞書
+        """
+        with self._lock:
+            return {
+                "total_turns": self.total_turns,
+                "window_turns": len(self._turns),
+                "window_tokens": self._get_window_tokens(),
+                "pending_turns": len(self._pending_turns),
+                "summarized_turns": self.summarized_turns,
+                "summary_tokens": self._summary_tokens,
+                "summary_calls": self.summary_calls,
+                "truncated_messages": self.truncated_messages,
+                "history_tokens": self._summary_tokens + sum(turn[2] for turn in self._pending_turns + self._turns)
+            }
+
+    def _update_summary(self):
+        """
+        要約待ちの会話を、これまでの要約にまとめる（要約待ちの会話がなくなるまで繰り返す）
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+
+        while True:
+            with self._lock:
+                turns = list(self._pending_turns)
+                summary = self._summary
+                if not turns:
+                    self._summarizing = False
+                    return
+
+            messages = []
+            for chat_message, answer, _ in turns:
+                messages.extend([HumanMessage(content=chat_message), AIMessage(content=answer)])
+            try:
+                new_summary = self.summarize(summary, messages)
+            except Exception as e:
+                # 要約に失敗した場合は、要約待ちの会話を原文のまま残し、次の会話の追加時に再試行する
+                logger.warning({"message": "会話履歴の要約に失敗しました。", "error": str(e)})
+                with self._lock:
+                    self._summarizing = False
+                return
+
+            with self._lock:
+                self._summary = new_summary
+                self._summary_tokens = context_packer.count_tokens(new_summary)
+                del self._pending_turns[:len(turns)]
+                self.summarized_turns += len(turns)
+                self.summary_calls += 1
+
+    def _truncate(self, text):
+        """
+        1件のメッセージを、履歴として保持するトークン数の上限までに切り詰める
+
+        Args:
+            text: メッセージ
+
+        Returns:
+            切り詰めたメッセージ
+        """
+        encoding = context_packer.get_encoding()
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= ct.CHAT_HISTORY_MAX_MESSAGE_TOKENS:
+            return text
+
+        with self._lock:
+            self.truncated_messages += 1
+        return encoding.decode(tokens[:ct.CHAT_HISTORY_MAX_MESSAGE_TOKENS]) + "\n（以下省略）"
+
+    def _get_window_tokens(self):
+        """
+        原文で保持している直近の会話のトークン数を取得（ロックを取得した状態で呼び出す）
+
+        Returns:
+            トークン数
+        """
+        return sum(turn[2] for turn in self._turns)
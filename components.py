@@ -8,6 +8,9 @@
 import streamlit as st
 import utils
 import constants as ct
+import index_manager
+import index_builder
+import initialize
 
 
 ############################################################
@@ -49,6 +52,72 @@ def display_select_mode():
     st.sidebar.code("【入力例】\n人事部に所属している従業員情報を一覧化して", language=None)
 
 
+def display_index_status():
+    """
+    RAGのインデックスの作成状況をサイドバーに表示
+    作成中は、一定間隔で進捗の表示のみを更新する
+    """
+    with st.sidebar:
+        if index_builder.get_index_builder().is_running():
+            display_index_progress()
+        else:
+            render_index_status()
+
+
+@st.fragment(run_every=ct.INDEX_STATUS_REFRESH_SECONDS)
+def display_index_progress():
+    """
+    インデックスの作成の進捗を表示（一定間隔で再実行）
+    """
+    # 作成が終わったら画面全体を再実行し、チャット欄の有効化と定期的な再実行の停止を行う
+    if not index_builder.get_index_builder().is_running():
+        st.rerun()
+
+    render_index_status()
+
+
+def render_index_status():
+    """
+    インデックスの作成状況の表示
+    """
+    builder = index_builder.get_index_builder()
+    status = builder.progress.get_status()
+    index_ready = index_manager.get_shared_index().is_ready()
+
+    if status["state"] == "running":
+        # 変更がないかの確認のみで終わる場合は、表示しない
+        if index_ready and not status["sources_total"]:
+            return
+        if status["eta_seconds"] is None:
+            eta_text = "残り時間を計算中"
+        else:
+            eta_text = f"残り約{int(status['eta_seconds']) + 1}秒"
+        st.markdown("## インデックスの作成状況")
+        st.progress(
+            status["sources_done"] / status["sources_total"] if status["sources_total"] else 0.0,
+            text=f"データソース {status['sources_done']}/{status['sources_total']}件・チャンク {status['chunks_added']}件（{eta_text}）"
+        )
+        st.caption(ct.INDEX_PREVIOUS_GENERATION_MESSAGE if index_ready else ct.INDEX_BUILDING_MESSAGE)
+        st.markdown("---")
+
+    elif status["state"] == "failed":
+        st.markdown("## インデックスの作成状況")
+        st.error(utils.build_error_message(ct.INDEX_BUILD_ERROR_MESSAGE), icon=ct.ERROR_ICON)
+        if index_ready:
+            st.caption("前回作成したインデックスをもとに回答します。")
+        # 作成処理を再実行（失敗の原因となったデータソースを修正した後などに使う）
+        if st.button("インデックスを再作成"):
+            builder.start(initialize.rebuild_retriever)
+            st.rerun()
+        st.markdown("---")
+
+    elif not index_ready:
+        # 作成済みのインデックスを読み込むのみの構成で、インデックスが見つからない場合
+        st.markdown("## インデックスの作成状況")
+        st.error(utils.build_error_message(ct.INDEX_NOT_FOUND_MESSAGE), icon=ct.ERROR_ICON)
+        st.markdown("---")
+
+
 def display_initial_ai_message():
     """
     AIメッセージの初期表示
@@ -277,18 +346,22 @@ def display_search_llm_response(llm_response):
     return content
 
 
-def display_contact_llm_response(llm_response):
+def display_contact_llm_response(llm_response, res_box=None):
     """
     「社内問い合わせ」モードにおけるLLMレスポンスを表示
 
     Args:
         llm_response: LLMからの回答
+        res_box: ストリーミング表示に使ったエリア（指定した場合、同じエリアに完成した回答を表示）
 
     Returns:
         LLMからの回答を画面表示用に整形した辞書データ
     """
-    # LLMからの回答を表示
-    st.markdown(llm_response["answer"])
+    # LLMからの回答を表示（ストリーミング表示していた場合は、生成途中の表示を完成した回答で置き換え）
+    if res_box is not None:
+        res_box.markdown(llm_response["answer"])
+    else:
+        st.markdown(llm_response["answer"])
 
     # ユーザーの質問・要望に適切な回答を行うための情報が、社内文書のデータベースに存在しなかった場合
     if llm_response["answer"] != ct.INQUIRY_NO_MATCH_ANSWER:
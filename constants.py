@@ -5,8 +5,9 @@
 ############################################################
 # ライブラリの読み込み
 ############################################################
-from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader
+from langchain_community.document_loaders import Docx2txtLoader, TextLoader
 from langchain_community.document_loaders.csv_loader import CSVLoader
+from pdf_loader import PdfLoader
 
 
 ############################################################
@@ -41,6 +42,38 @@ APP_BOOT_MESSAGE = "アプリが起動されました。"
 # ==========================================
 MODEL = "gpt-4o-mini"
 TEMPERATURE = 0.5
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# LLMとのHTTP接続プールの設定（接続を維持したまま使い回す）
+LLM_HTTP_MAX_CONNECTIONS = 50
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+LLM_HTTP_KEEPALIVE_EXPIRY = 120
+LLM_REQUEST_TIMEOUT = 120
+
+
+# ==========================================
+# 埋め込みキャッシュ系
+# ==========================================
+EMBEDDING_CACHE_PATH = "./.cache/embeddings.sqlite3"
+# キャッシュに保持する、モデルごとの埋め込みベクトルの上限件数（超過分は最終参照日時が古いものから削除）
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+# 上限件数を超えた際に、上限からさらにまとめて削除する件数の割合
+EMBEDDING_CACHE_EVICTION_RATIO = 0.05
+
+
+# ==========================================
+# 埋め込みステージ系
+# ==========================================
+# バッチのトークン数を数える際に使うエンコーディング
+EMBEDDING_TOKEN_ENCODING = "cl100k_base"
+# 1バッチに含めるトークン数・テキスト数の上限
+EMBEDDING_BATCH_MAX_TOKENS = 100000
+EMBEDDING_BATCH_MAX_SIZE = 128
+# 同時に送信するバッチ数の上限
+EMBEDDING_MAX_CONCURRENCY = 4
+# 一時的なエラー（429など）の場合の再試行回数と待機時間
+EMBEDDING_MAX_RETRIES = 6
+EMBEDDING_RETRY_BASE_SECONDS = 1.0
+EMBEDDING_RETRY_MAX_SECONDS = 60.0
 
 
 # ==========================================
@@ -48,7 +81,13 @@ TEMPERATURE = 0.5
 # ==========================================
 RAG_TOP_FOLDER_PATH = "./data"
 SUPPORTED_EXTENSIONS = {
-    ".pdf": PyMuPDFLoader,
+    ".pdf": lambda path, file_hash=None: PdfLoader(
+        path,
+        cache_dir=PDF_PAGE_CACHE_DIR_PATH,
+        max_workers=PDF_LOAD_MAX_WORKERS,
+        parallel_min_pages=PDF_PARALLEL_MIN_PAGES,
+        file_hash=file_hash
+    ),
     ".docx": Docx2txtLoader,
     ".csv": lambda path: CSVLoader(path, encoding="utf-8"),
     ".txt": lambda path: TextLoader(path, encoding="utf-8")
@@ -56,6 +95,65 @@ SUPPORTED_EXTENSIONS = {
 WEB_URL_LOAD_TARGETS = [
     "https://generative-ai.web-camp.io/"
 ]
+# Webページの取得結果（本文とETag・Last-Modified）のキャッシュの保存先フォルダ
+WEB_CACHE_DIR_PATH = "./.cache/web"
+# Webページを取得し直す間隔（秒）。この間隔ごとにインデックスの更新も行う（「INDEX_BUILD_ON_STARTUP」がTrueの場合のみ）
+WEB_REFRESH_INTERVAL_SECONDS = 6 * 60 * 60
+# 同時に取得するWebページ数の上限と、1ページあたりのタイムアウト（秒）
+WEB_LOAD_MAX_CONCURRENCY = 8
+WEB_LOAD_TIMEOUT_SECONDS = 10
+# Webページの取得時に送るUser-Agent（環境変数「USER_AGENT」が設定されている場合はそちらを使う）
+WEB_LOAD_USER_AGENT = "company-inner-search-app"
+# ファイルの読み込み方式（"process": プロセスプールで並列に読み込む、"serial": 1ファイルずつ読み込む）
+FILE_LOAD_MODE = "process"
+# 並列読み込み時のプロセス数（Noneの場合はCPUコア数）
+FILE_LOAD_MAX_WORKERS = None
+# 並列読み込み時に、同時に読み込み中・結果待ちにしておくファイル数の上限（メモリ使用量の上限になる）
+FILE_LOAD_MAX_IN_FLIGHT = 16
+# PDFファイルから抽出したページのテキストのキャッシュの保存先フォルダ（ファイルの中身のハッシュ値ごとに保存）
+PDF_PAGE_CACHE_DIR_PATH = "./.cache/pdf_pages"
+# ページを分割して並列に抽出する最小のページ数と、その際のプロセス数の上限
+# ページの分割は、読み込むファイルが1つの場合（ファイルの変更の反映など）か、「FILE_LOAD_MODE」が"serial"の場合のみ行う。
+# 複数ファイルをプロセスプールで読み込む場合は、各プロセス内では分割せずに1プロセスで抽出する
+# （ファイル単位の並列化ですでにCPUコアを使い切っているため、ページ数の多いPDFファイルもファイル1つ分の並列度で抽出される）
+PDF_PARALLEL_MIN_PAGES = 64
+PDF_LOAD_MAX_WORKERS = 4
+# 参照先フォルダの変更を監視し、変更されたファイルをインデックスに反映するかどうか（「INDEX_BUILD_ON_STARTUP」がTrueの場合のみ）
+FILE_WATCH_ENABLED = True
+# 連続した変更をまとめてから反映するまでの待ち時間（ミリ秒）
+FILE_WATCH_DEBOUNCE_MS = 2000
+# OSの変更通知を使わず、一定間隔でフォルダを確認するかどうか（Noneの場合は環境変数「WATCHFILES_FORCE_POLLING」に従う）
+FILE_WATCH_FORCE_POLLING = None
+# フォルダを確認する方式の場合の確認間隔（ミリ秒）
+FILE_WATCH_POLL_INTERVAL_MS = 1000
+
+# ==========================================
+# 社員名簿の検索系
+# ==========================================
+EMPLOYEE_CSV_PATH = f"{RAG_TOP_FOLDER_PATH}/社員について/社員名簿.csv"
+# 絞り込み条件として質問文から探す列と、そのうち「, 」区切りで複数の値を持つ列
+EMPLOYEE_FILTER_COLUMNS = ["部署", "役職", "従業員区分", "スキルセット", "保有資格"]
+EMPLOYEE_MULTI_VALUE_COLUMNS = ["スキルセット", "保有資格"]
+# 類似質問のキャッシュで、値が異なれば別の質問とみなす列（氏名・部署）
+EMPLOYEE_NAME_COLUMN = "氏名（フルネーム）"
+EMPLOYEE_DEPARTMENT_COLUMN = "部署"
+# 一覧表に含める列
+EMPLOYEE_TABLE_COLUMNS = ["氏名（フルネーム）", "社員ID", "部署", "役職", "従業員区分", "年齢", "入社日"]
+# 部署ごとの統合ドキュメントに加えて、詳細・表形式・簡潔な名前リストのドキュメントも作成する部署
+EMPLOYEE_DETAILED_DEPARTMENTS = ["人事部"]
+# 部署ごとの統合ドキュメントに追加する、部署固有の検索キーワード
+EMPLOYEE_DEPARTMENT_KEYWORDS = {
+    "人事部": ["人事", "HR", "人材管理", "採用", "労務", "給与", "人事担当", "人事スタッフ", "HR部門", "人材管理部門"]
+}
+# 従業員の一覧化を求める質問と判定するための言葉
+EMPLOYEE_LIST_INTENT_KEYWORDS = ["一覧", "リスト", "名簿", "全員", "誰", "だれ", "何人", "何名", "人数"]
+EMPLOYEE_NOUN_KEYWORDS = ["従業員", "社員", "スタッフ", "メンバー"]
+EMPLOYEE_AFFILIATION_KEYWORDS = ["所属", "在籍"]
+# 一覧化を求める質問に含まれていても、質問の対象を変えない言葉
+# （これら以外の内容（「会議」「研修」など）を含む質問は、社内文書の検索で回答する）
+EMPLOYEE_QUERY_FILLER_WORDS = [
+    "教えて", "見せて", "出して", "表示", "出力", "作成", "表形式", "表", "化", "全", "情報", "詳細", "下さい"
+]
 
 # ==========================================
 # RAGのチャンク分割・検索設定系
@@ -63,6 +161,98 @@ WEB_URL_LOAD_TARGETS = [
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
 RETRIEVER_SEARCH_COUNT = 5
+# 会話履歴がある場合に、質問文を独立した入力テキストに書き換える判定条件
+# - 前の会話を指す言葉を含む場合
+# - 入力が指定の文字数未満の場合
+QUERY_REWRITE_CONTEXT_KEYWORDS = [
+    "それ", "その", "あれ", "あの", "これ", "この", "上記", "前述", "先ほど", "さきほど", "さっき",
+    "同じ", "他に", "ほかに", "もっと", "詳しく", "続き", "さらに", "彼", "彼女", "前の", "今の"
+]
+QUERY_REWRITE_MIN_LENGTH = 6
+# 「社内文書検索」モードで、検索結果として扱う関連度スコアの下限（0〜1）
+# ログに出力される検索結果のスコアの分布を見て調整する
+DOC_SEARCH_SCORE_THRESHOLD = 0.65
+# キーワード検索（BM25）のパラメーター
+BM25_K1 = 1.5
+BM25_B = 0.75
+# キーワード検索で、入力をそのまま含むチャンクを優先して返す対象とする入力の最大文字数
+LEXICAL_EXACT_MATCH_MAX_LENGTH = 30
+# キーワード検索とベクトル検索それぞれで取得する候補数と、順位統合（RRF）の定数
+HYBRID_CANDIDATE_COUNT = 20
+HYBRID_RRF_K = 60
+# クエリの文字列をそのまま含むチャンクの検索結果を、順位統合する際の重み
+HYBRID_EXACT_MATCH_WEIGHT = 2.0
+# 同じ質問に対する検索結果・回答のキャッシュの保持件数と保持秒数
+QUERY_CACHE_MAX_ENTRIES = 1000
+QUERY_CACHE_TTL_SECONDS = 60 * 60
+# 言い回しだけが異なる質問を同じ質問とみなす、質問文の埋め込みベクトルのコサイン類似度の下限と保持件数
+# 「text-embedding-ada-002」は無関係な文同士でも0.7以上になり、部署名・顧客名だけが異なる質問は0.95を超えることがあるため、
+# 閾値は高めに設定した上で、答えを左右する語（数字・英字・カタカナの語、部署名・氏名）が一致することも条件とする
+# （埋め込みモデルを変更した場合は「benchmarks/semantic_cache_threshold.py」で言い換え・取り違えやすい質問の組から調整する）
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD = 0.97
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+# 「社内問い合わせ」モードで検索するチャンク数と、そこからLLMに渡す文脈のトークン数の上限
+CONTEXT_CANDIDATE_COUNT = 10
+CONTEXT_TOKEN_BUDGET = 3000
+# 文脈のトークン数を数える際に使うエンコーディング（MODELに合わせる）
+CONTEXT_TOKEN_ENCODING = "o200k_base"
+# LLMに渡す会話履歴のうち、原文で保持する直近の会話のトークン数の上限（超えた分は要約にまとめる）
+CHAT_HISTORY_TOKEN_BUDGET = 2000
+# 会話履歴として保持する1件のメッセージのトークン数の上限（大きな表などを含む回答は先頭部分のみを残す）
+CHAT_HISTORY_MAX_MESSAGE_TOKENS = 500
+# 古い会話の要約のトークン数の目安と、要約を作成するスレッド数
+CHAT_HISTORY_SUMMARY_MAX_TOKENS = 300
+CHAT_HISTORY_SUMMARY_WORKERS = 2
+# インデックス作成時に、まとめて埋め込み・追加するチャンク数
+INGEST_BATCH_SIZE = 512
+
+
+# ==========================================
+# RAGのインデックス保存系
+# ==========================================
+VECTOR_STORE_DIR_PATH = "./.vectorstore"
+VECTOR_STORE_COLLECTION_NAME = "company_inner_docs"
+# 公開中のインデックス世代名を記録するファイル
+INDEX_CURRENT_FILE = "CURRENT"
+# インデックス作成時点のデータソースの状態を記録するファイル
+INDEX_MANIFEST_FILE = "manifest.json"
+# インデックス作成時の統計（件数・所要時間など）を記録するファイル
+INDEX_STATS_FILE = "stats.json"
+# キーワード検索用の転置インデックスを保存するファイル
+LEXICAL_INDEX_FILE = "lexical_index.pkl"
+# 公開中の世代に加えて残しておく、過去のインデックス世代の数
+# （起動中のアプリは、次の画面の再実行時に公開中の世代へ切り替えるため、切り替え前の検索で使う1つ前の世代を残す）
+INDEX_KEEP_GENERATIONS = 1
+# ベクターストアの種類（"chroma": Chroma、"numpy": メモリマップしたNumPyの行列）
+# 差分更新で書き込み量が変更量に比例するのは"numpy"の場合のみ。"chroma"の場合は、差分更新（ファイルの変更の反映を含む）のたびに
+# 公開中の世代のベクターストア全体を複製するため、コーパスが大きい場合や参照先フォルダの変更を監視する場合は"numpy"を使う
+# （変更すると保存形式が変わるため、次回の作成時にすべてのデータソースを読み込み直す）
+VECTOR_BACKEND = "chroma"
+# 「numpy」の場合の行列の保存形式（"float32"、"float16"、"int8"）と検索方式（"exact": 全件、"ivf": クラスタ単位）
+VECTOR_DTYPE = "float32"
+VECTOR_SEARCH_TYPE = "exact"
+# 検索・書き出し時に、一度に展開する行数
+VECTOR_SEARCH_BLOCK_ROWS = 65536
+# IVF検索のクラスタ数（Noneの場合は行数の平方根）、検索するクラスタ数、IVFを使う最小の行数
+VECTOR_IVF_LISTS = None
+VECTOR_IVF_PROBES = 8
+VECTOR_IVF_MIN_ROWS = 10000
+# IVF検索のクラスタの中心を求める際に使う行数と、繰り返し回数
+VECTOR_IVF_TRAIN_SAMPLE = 50000
+VECTOR_IVF_TRAIN_ITERATIONS = 10
+# 「numpy」の場合に、1つにまとめ直す（圧縮する）セグメント数と、削除済みの行の割合の上限
+VECTOR_MAX_SEGMENTS = 8
+VECTOR_COMPACTION_DELETED_RATIO = 0.2
+# キーワード検索用の転置インデックスで、差分の記録を本体にまとめ直す、差分の件数の割合（全チャンク数に対する割合）
+LEXICAL_COMPACTION_RATIO = 0.2
+# 画面読み込み時にインデックスの作成・更新を行うかどうか（環境変数「INDEX_BUILD_ON_STARTUP」で上書きできる）
+# Falseの場合は「build_index.py」で作成・公開済みの世代を読み込むのみで、画面の再実行のたびに公開中の世代（CURRENT）を確認し、
+# 「build_index.py」が新しい世代を公開していれば切り替える。
+# 別スレッドでの作成・更新、Webページの定期的な取得し直し、参照先フォルダの変更の監視は、Trueの場合のみ行う
+INDEX_BUILD_ON_STARTUP = False
+INDEX_BUILD_ON_STARTUP_ENV = "INDEX_BUILD_ON_STARTUP"
+# インデックスの作成中に、画面の進捗表示を更新する間隔（秒）
+INDEX_STATUS_REFRESH_SECONDS = 2
 
 
 # ==========================================
@@ -70,6 +260,14 @@ RETRIEVER_SEARCH_COUNT = 5
 # ==========================================
 SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT = "会話履歴と最新の入力をもとに、会話履歴なしでも理解できる独立した入力テキストを生成してください。"
 
+SYSTEM_PROMPT_SUMMARIZE_HISTORY = """
+    これまでの会話の要約と、その後に続く会話をもとに、会話全体の新しい要約を作成してください。
+    ユーザーが知りたがっていること、回答で示された固有名詞・数値・結論を優先して残し、{max_tokens}トークン程度に収めてください。
+
+    【これまでの会話の要約】
+    {summary}
+"""
+
 SYSTEM_PROMPT_DOC_SEARCH = """
     あなたは社内の文書検索アシスタントです。
     以下の条件に基づき、ユーザー入力に対して回答してください。
@@ -122,6 +320,10 @@ NO_DOC_MATCH_ANSWER = "該当資料なし"
 # ==========================================
 COMMON_ERROR_MESSAGE = "このエラーが繰り返し発生する場合は、管理者にお問い合わせください。"
 INITIALIZE_ERROR_MESSAGE = "初期化処理に失敗しました。"
+INDEX_BUILD_ERROR_MESSAGE = "社内文書のインデックスの作成に失敗しました。"
+INDEX_BUILDING_MESSAGE = "社内文書のインデックスを作成中です。作成が完了すると、チャット欄からメッセージを送信できます。"
+INDEX_NOT_FOUND_MESSAGE = "社内文書のインデックスが見つかりません。「build_index.py」でインデックスを作成するか、環境変数「INDEX_BUILD_ON_STARTUP」を「true」にして起動してください。"
+INDEX_PREVIOUS_GENERATION_MESSAGE = "作成が完了するまでは、前回作成したインデックスをもとに回答します。"
 NO_DOC_MATCH_MESSAGE = """
     入力内容と関連する社内文書が見つかりませんでした。\n
     入力内容を変更してください。
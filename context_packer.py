@@ -0,0 +1,214 @@
+"""
+このファイルは、検索結果のチャンクをトークン数の上限に収まるよう整理して、LLMに渡す文脈を組み立てるファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import logging
+import tiktoken
+from langchain.schema import Document
+import constants as ct
+
+
+############################################################
+# 設定関連
+############################################################
+# トークン数を数えるエンコーディング（読み込みに時間がかかるため、最初に使う時に一度だけ読み込む）
+_encoding = None
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_encoding():
+    """
+    トークン数を数えるエンコーディングを取得
+
+    Returns:
+        エンコーディング
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(ct.CONTEXT_TOKEN_ENCODING)
+
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    テキストのトークン数を取得
+
+    Args:
+        text: テキスト
+
+    Returns:
+        トークン数
+    """
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def pack_context(docs, max_tokens=ct.CONTEXT_TOKEN_BUDGET):
+    """
+    検索結果のチャンクを、関連性が高い順にトークン数の上限まで詰めてLLMに渡す文脈を作成
+    - 同じ内容のチャンクは1つにまとめる
+    - 同じデータソース（同じページ）で連続するチャンクは、重複部分（CHUNK_OVERLAP）を除いて1つにつなげる
+
+    Args:
+        docs: チャンクのリスト（関連性が高い順）
+        max_tokens: 文脈のトークン数の上限
+
+    Returns:
+        (文脈に含めるドキュメントのリスト（関連性が高い順）, 文脈のトークン数)
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    blocks = merge_adjacent_chunks(dedupe_chunks(docs))
+
+    packed = []
+    total_tokens = 0
+    for doc in blocks:
+        tokens = count_tokens(doc.page_content)
+        if total_tokens + tokens <= max_tokens:
+            packed.append(doc)
+            total_tokens += tokens
+        elif not packed:
+            # 最も関連性が高いものが単独で上限を超える場合は、上限に収まる先頭部分のみを使う
+            doc = truncate_document(doc, max_tokens)
+            packed.append(doc)
+            total_tokens += count_tokens(doc.page_content)
+
+    logger.info({
+        "message": "LLMに渡す文脈を作成しました。",
+        "retrieved_chunks": len(docs),
+        "merged_blocks": len(blocks),
+        "packed_blocks": len(packed),
+        "context_tokens": total_tokens,
+        "token_budget": max_tokens
+    })
+
+    return packed, total_tokens
+
+
+def dedupe_chunks(docs):
+    """
+    同じチャンク、または同じ内容のチャンクを除去
+
+    Args:
+        docs: チャンクのリスト（関連性が高い順）
+
+    Returns:
+        重複を除いたチャンクのリスト（関連性が高い順）
+    """
+    seen = set()
+    unique_docs = []
+    for doc in docs:
+        key = " ".join(doc.page_content.split())
+        chunk_id = doc.metadata.get("chunk_id")
+        if key in seen or (chunk_id is not None and chunk_id in seen):
+            continue
+        seen.add(key)
+        if chunk_id is not None:
+            seen.add(chunk_id)
+        unique_docs.append(doc)
+
+    return unique_docs
+
+
+def merge_adjacent_chunks(docs):
+    """
+    同じデータソース（同じページ）で連続するチャンクを、重複部分を除いて1つのドキュメントにつなげる
+
+    Args:
+        docs: チャンクのリスト（関連性が高い順）
+
+    Returns:
+        ドキュメントのリスト（つなげたものは、含まれるチャンクのうち最も関連性が高い順位に置く）
+    """
+    # データソース・ページごとに、(順位, チャンク)をまとめる
+    groups = {}
+    for rank, doc in enumerate(docs):
+        if "chunk_index" not in doc.metadata:
+            groups[("", rank)] = [(rank, doc)]
+            continue
+        key = (doc.metadata.get("source", ""), doc.metadata.get("page"))
+        groups.setdefault(key, []).append((rank, doc))
+
+    blocks = []
+    for members in groups.values():
+        members.sort(key=lambda member: member[1].metadata.get("chunk_index", 0))
+        run = [members[0]]
+        for member in members[1:]:
+            if member[1].metadata["chunk_index"] == run[-1][1].metadata["chunk_index"] + 1:
+                run.append(member)
+            else:
+                blocks.append(join_chunks(run))
+                run = [member]
+        blocks.append(join_chunks(run))
+
+    blocks.sort(key=lambda block: block[0])
+
+    return [doc for _, doc in blocks]
+
+
+def join_chunks(run):
+    """
+    連続するチャンクを、重複部分を除いて1つのドキュメントにつなげる
+
+    Args:
+        run: chunk_indexの順に並んだ(順位, チャンク)のリスト
+
+    Returns:
+        (含まれるチャンクのうち最も高い順位, つなげたドキュメント)
+    """
+    rank = min(member_rank for member_rank, _ in run)
+    if len(run) == 1:
+        return rank, run[0][1]
+
+    text = run[0][1].page_content
+    for _, doc in run[1:]:
+        overlap = find_overlap(text, doc.page_content)
+        text = text + doc.page_content[overlap:] if overlap else text + "\n" + doc.page_content
+
+    metadata = dict(run[0][1].metadata)
+    metadata["chunk_ids"] = [doc.metadata["chunk_id"] for _, doc in run if "chunk_id" in doc.metadata]
+
+    return rank, Document(page_content=text, metadata=metadata)
+
+
+def find_overlap(previous_text, next_text):
+    """
+    前のチャンクの末尾と次のチャンクの先頭で重複している文字数を取得
+
+    Args:
+        previous_text: 前のチャンクのテキスト
+        next_text: 次のチャンクのテキスト
+
+    Returns:
+        重複している文字数（重複がない場合は0）
+    """
+    # チャンク分割時の重複はCHUNK_OVERLAP文字以内のため、それ以上は探さない
+    max_length = min(len(previous_text), len(next_text), ct.CHUNK_OVERLAP)
+    for length in range(max_length, 0, -1):
+        if previous_text.endswith(next_text[:length]):
+            return length
+
+    return 0
+
+
+def truncate_document(doc, max_tokens):
+    """
+    ドキュメントを、先頭からトークン数の上限までに切り詰める
+
+    Args:
+        doc: ドキュメント
+        max_tokens: トークン数の上限
+
+    Returns:
+        切り詰めたドキュメント
+    """
+    encoding = get_encoding()
+    tokens = encoding.encode(doc.page_content, disallowed_special=())
+
+    return Document(page_content=encoding.decode(tokens[:max_tokens]), metadata=dict(doc.metadata))
@@ -0,0 +1,238 @@
+"""
+このファイルは、チャンクの埋め込みベクトルをローカルに保存して再利用するキャッシュのファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import logging
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from langchain_core.embeddings import Embeddings
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class CachedEmbeddings(Embeddings):
+    """
+    (モデル名, 正規化したテキストのハッシュ値)をキーに、埋め込みベクトルをSQLiteに保存して再利用する埋め込みモデル
+    """
+    def __init__(self, embeddings, model_name, cache_path=ct.EMBEDDING_CACHE_PATH, max_entries=ct.EMBEDDING_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            embeddings: キャッシュにないテキストの埋め込みに使う埋め込みモデル
+            model_name: キャッシュのキーに含めるモデル名
+            cache_path: キャッシュを保存するSQLiteファイルのパス
+            max_entries: キャッシュに保持する埋め込みベクトルの上限件数
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        # ヒット・ミス・重複除去の件数
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+        # 複数のセッション・スレッドから同じ接続を使うため、ロックで排他制御する
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        # 上限件数の超過分はモデルごとに削除するため、モデル名と最終参照日時の索引を使う
+        self._conn.execute("DROP INDEX IF EXISTS idx_embeddings_last_access")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_model_last_access ON embeddings (model, last_access)")
+        self._conn.commit()
+        # 保存のたびに全件を数えないよう、このモデルの保存件数を保持しておく
+        self._entry_count = self._count_entries()
+
+    def embed_documents(self, texts):
+        """
+        複数テキストの埋め込みベクトルを取得
+
+        Args:
+            texts: 埋め込み対象のテキストのリスト
+
+        Returns:
+            埋め込みベクトルのリスト
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+
+        # 同じ内容のテキストは1回だけ埋め込むよう、ハッシュ値ごとにまとめる
+        text_hashes = [create_text_hash(text) for text in texts]
+        unique_texts = dict(zip(text_hashes, texts))
+
+        # キャッシュから取得できたベクトル
+        vectors = self._get_vectors(list(unique_texts))
+        missing_hashes = [text_hash for text_hash in unique_texts if text_hash not in vectors]
+
+        # キャッシュにないテキストのみ埋め込みモデルで埋め込み、キャッシュに保存
+        if missing_hashes:
+            new_vectors = self.embeddings.embed_documents([unique_texts[text_hash] for text_hash in missing_hashes])
+            new_vectors = dict(zip(missing_hashes, new_vectors))
+            self._put_vectors(new_vectors)
+            vectors.update(new_vectors)
+
+        with self._lock:
+            self.hits += len(unique_texts) - len(missing_hashes)
+            self.misses += len(missing_hashes)
+            self.deduplicated += len(texts) - len(unique_texts)
+        logger.info({"message": "埋め込みキャッシュを参照しました。", "texts": len(texts), "embedded": len(missing_hashes), **self.get_stats()})
+
+        return [list(vectors[text_hash]) for text_hash in text_hashes]
+
+    def embed_query(self, text):
+        """
+        検索クエリの埋め込みベクトルを取得
+
+        Args:
+            text: 検索クエリ
+
+        Returns:
+            埋め込みベクトル
+        """
+        text_hash = create_text_hash(text)
+        vectors = self._get_vectors([text_hash])
+        if text_hash in vectors:
+            with self._lock:
+                self.hits += 1
+            return list(vectors[text_hash])
+
+        vector = self.embeddings.embed_query(text)
+        self._put_vectors({text_hash: vector})
+        with self._lock:
+            self.misses += 1
+
+        return vector
+
+    def get_stats(self):
+        """
+        キャッシュの利用状況を取得
+
+        Returns:
+            ヒット数・ミス数・重複除去数・保存件数の辞書
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "entries": self._entry_count,
+            }
+
+    def _count_entries(self):
+        """
+        このモデルの埋め込みベクトルの保存件数を数える
+
+        Returns:
+            保存件数
+        """
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+
+    def _get_vectors(self, text_hashes):
+        """
+        キャッシュから埋め込みベクトルを取得
+
+        Args:
+            text_hashes: テキストのハッシュ値のリスト
+
+        Returns:
+            ハッシュ値をキー、埋め込みベクトルを値とする辞書（キャッシュにあったもののみ）
+        """
+        vectors = {}
+        with self._lock:
+            # SQLiteのプレースホルダー数の上限を超えないよう、分割して問い合わせる
+            for i in range(0, len(text_hashes), 500):
+                batch = text_hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vectors[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            # 参照されたベクトルは、上限超過時に削除されにくいよう最終参照日時を更新
+            if vectors:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, text_hash) for text_hash in vectors]
+                )
+                self._conn.commit()
+
+        return vectors
+
+    def _put_vectors(self, vectors):
+        """
+        埋め込みベクトルをキャッシュに保存し、このモデルの上限件数を超えた場合は古いものから削除
+
+        Args:
+            vectors: ハッシュ値をキー、埋め込みベクトルを値とする辞書
+        """
+        now = time.time()
+        with self._lock:
+            # float32のバイト列として保存し、ファイルサイズを抑える
+            # （同じモデル・テキストのベクトルは同じため、別のスレッドが先に保存したものはそのまま使い、追加した件数のみを数える）
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [
+                    (self.model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for text_hash, vector in vectors.items()
+                ]
+            )
+            self._entry_count += cursor.rowcount
+
+            # 上限件数を超えた場合、このモデルの中で最終参照日時が古いものから削除
+            if self._entry_count > self.max_entries:
+                # 他のプロセス（build_index.pyなど）も同じファイルに保存・削除するため、削除する前に数え直す
+                self._entry_count = self._count_entries()
+            if self._entry_count > self.max_entries:
+                # 保存のたびに削除・数え直しをしないよう、上限より一定割合少なくなるまでまとめて削除
+                evict_count = self._entry_count - int(self.max_entries * (1 - ct.EMBEDDING_CACHE_EVICTION_RATIO))
+                self._conn.execute(
+                    """
+                    DELETE FROM embeddings WHERE rowid IN (
+                        SELECT rowid FROM embeddings WHERE model = ? ORDER BY last_access LIMIT ?
+                    )
+                    """,
+                    (self.model_name, evict_count)
+                )
+                self._entry_count -= evict_count
+            self._conn.commit()
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_text_hash(text):
+    """
+    キャッシュのキーとして使う、正規化したテキストのハッシュ値を作成
+
+    Args:
+        text: テキスト
+
+    Returns:
+        SHA-256のハッシュ値
+    """
+    # 全角・半角の揺れや空白・改行の違いだけのテキストは、同じものとして扱う
+    normalized_text = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+
@@ -0,0 +1,223 @@
+"""
+このファイルは、チャンクをまとめて並列に埋め込む処理（埋め込みステージ）のファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import streamlit as st
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+import constants as ct
+import embedding_cache
+
+
+############################################################
+# クラス定義
+############################################################
+
+class BatchedEmbeddings(Embeddings):
+    """
+    トークン数の上限ごとにチャンクをバッチ化し、複数バッチを並列に埋め込む埋め込みモデル
+    レート制限（429）を受けた場合は、全バッチの送信を一時停止してから再試行する
+    """
+    def __init__(
+        self,
+        embeddings,
+        max_batch_tokens=ct.EMBEDDING_BATCH_MAX_TOKENS,
+        max_batch_size=ct.EMBEDDING_BATCH_MAX_SIZE,
+        max_concurrency=ct.EMBEDDING_MAX_CONCURRENCY,
+        max_retries=ct.EMBEDDING_MAX_RETRIES
+    ):
+        """
+        Args:
+            embeddings: 1バッチ分の埋め込みに使う埋め込みモデル
+            max_batch_tokens: 1バッチに含めるトークン数の上限
+            max_batch_size: 1バッチに含めるテキスト数の上限
+            max_concurrency: 同時に送信するバッチ数の上限
+            max_retries: 1バッチあたりの再試行回数の上限
+        """
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._encoding = tiktoken.get_encoding(ct.EMBEDDING_TOKEN_ENCODING)
+        # レート制限を受けた際に、全バッチの送信を再開してよい時刻
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        """
+        複数テキストの埋め込みベクトルを取得
+
+        Args:
+            texts: 埋め込み対象のテキストのリスト
+
+        Returns:
+            埋め込みベクトルのリスト（textsと同じ順序）
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+        if not texts:
+            return []
+
+        start_time = time.perf_counter()
+        batches = self._create_batches(texts)
+
+        # 同時に送信するバッチ数を上限までに抑えつつ、バッチごとに並列で埋め込む
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = list(executor.map(self._embed_batch, batches))
+
+        vectors = [vector for batch_vectors in results for vector in batch_vectors]
+        logger.info({
+            "message": "チャンクを埋め込みました。",
+            "texts": len(texts),
+            "batches": len(batches),
+            "elapsed_seconds": round(time.perf_counter() - start_time, 3)
+        })
+
+        return vectors
+
+    def embed_query(self, text):
+        """
+        検索クエリの埋め込みベクトルを取得
+
+        Args:
+            text: 検索クエリ
+
+        Returns:
+            埋め込みベクトル
+        """
+        return self._call_with_retry(lambda: self.embeddings.embed_query(text))
+
+    def _create_batches(self, texts):
+        """
+        テキストをトークン数・件数の上限ごとのバッチに分割
+
+        Args:
+            texts: 埋め込み対象のテキストのリスト
+
+        Returns:
+            バッチ（テキストのリスト）のリスト
+        """
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = len(self._encoding.encode(text, disallowed_special=()))
+            # 上限を超える場合は現在のバッチを確定し、新しいバッチを始める
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _embed_batch(self, batch):
+        """
+        1バッチ分のテキストを埋め込み
+
+        Args:
+            batch: テキストのリスト
+
+        Returns:
+            埋め込みベクトルのリスト
+        """
+        return self._call_with_retry(lambda: self.embeddings.embed_documents(batch))
+
+    def _call_with_retry(self, func):
+        """
+        埋め込みAPIの呼び出しを、一時的なエラーの場合に指数バックオフで再試行
+
+        Args:
+            func: 埋め込みAPIを呼び出す関数
+
+        Returns:
+            埋め込みAPIの呼び出し結果
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+
+        for attempt in range(self.max_retries + 1):
+            # 他のバッチがレート制限を受けている間は、送信を待機する
+            with self._lock:
+                wait_seconds = self._resume_at - time.monotonic()
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+
+            try:
+                return func()
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt >= self.max_retries:
+                    raise
+
+                # 待機時間はサーバーからの指定（Retry-After）を優先し、なければ指数バックオフ＋ゆらぎで決める
+                backoff_seconds = min(ct.EMBEDDING_RETRY_BASE_SECONDS * (2 ** attempt), ct.EMBEDDING_RETRY_MAX_SECONDS)
+                backoff_seconds += random.uniform(0, backoff_seconds / 2)
+                retry_after = get_retry_after_seconds(e)
+                if retry_after is not None:
+                    backoff_seconds = retry_after
+
+                # レート制限の場合は、全バッチの送信を止めて負荷を下げる
+                if isinstance(e, openai.RateLimitError):
+                    with self._lock:
+                        self._resume_at = max(self._resume_at, time.monotonic() + backoff_seconds)
+                else:
+                    time.sleep(backoff_seconds)
+
+                logger.warning({
+                    "message": "埋め込みAPIの呼び出しを再試行します。",
+                    "error": type(e).__name__,
+                    "attempt": attempt + 1,
+                    "backoff_seconds": round(backoff_seconds, 2)
+                })
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_retry_after_seconds(error):
+    """
+    エラーレスポンスのRetry-Afterヘッダーから、再試行までの待機秒数を取得
+
+    Args:
+        error: 埋め込みAPIの呼び出し時に発生したエラー
+
+    Returns:
+        待機秒数（取得できない場合はNone）
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    retry_after = response.headers.get("retry-after")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+
+@st.cache_resource
+def get_embeddings():
+    """
+    プロセス内で共有する埋め込みモデルを取得
+    埋め込みキャッシュにないチャンクのみを、バッチ化・並列化してAPIに送信する
+
+    Returns:
+        埋め込みモデル
+    """
+    # 再試行は埋め込みステージ側で制御するため、クライアント側の自動再試行は無効化
+    # 接続先は環境変数「OPENAI_API_BASE」で切り替えられるため、ローカルの疑似サーバーに向けて動作確認できる
+    embeddings = OpenAIEmbeddings(model=ct.EMBEDDING_MODEL, max_retries=0)
+    return embedding_cache.CachedEmbeddings(BatchedEmbeddings(embeddings), ct.EMBEDDING_MODEL)
@@ -0,0 +1,297 @@
+"""
+このファイルは、社員名簿をLLMを使わずに検索・一覧化するための、列指向の従業員インデックスのファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+import streamlit as st
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class EmployeeDirectory:
+    """
+    社員名簿の列ごとに、値 → 該当行のマスク（転置インデックス）を持つ従業員インデックス
+    絞り込みはマスク同士の論理演算のみで行うため、数千行の名簿でも一覧化はミリ秒単位で終わる
+    """
+    def __init__(self, df, source):
+        """
+        Args:
+            df: 社員名簿のデータフレーム
+            source: 社員名簿のファイルパス（回答の情報源として表示）
+        """
+        self.source = source
+        self.row_count = len(df)
+        # 列名 → 表示用の値の配列（列指向で保持）
+        self.columns = {column: df[column].astype(str).to_numpy() for column in df.columns}
+        # 絞り込み対象の列名 → {値: 該当行のマスク}
+        self.masks = {}
+        for column in ct.EMPLOYEE_FILTER_COLUMNS:
+            if column not in df.columns:
+                continue
+            values = df[column].fillna("").astype(str)
+            if column in ct.EMPLOYEE_MULTI_VALUE_COLUMNS:
+                # 「Python, Excel」のような複数値の列は、値ごとに分解してからマスクを作る
+                exploded = values.str.split(",").explode().str.strip()
+                exploded = exploded[exploded != ""]
+                column_masks = {}
+                for value, row_positions in exploded.groupby(exploded).groups.items():
+                    mask = np.zeros(self.row_count, dtype=bool)
+                    mask[row_positions] = True
+                    column_masks[value] = mask
+            else:
+                column_masks = {value: (values == value).to_numpy() for value in values.unique() if value}
+            self.masks[column] = column_masks
+
+        # 質問文中の値を探すための、正規化した値 → [(列名, 値)]の辞書
+        self._terms = {}
+        for column, column_masks in self.masks.items():
+            for value in column_masks:
+                self._terms.setdefault(normalize_text(value), []).append((column, value))
+
+        # 類似質問のキャッシュで答えを左右する語として扱う、質問文中の表記 → 部署名・氏名の辞書
+        self.entity_terms = create_entity_terms(self.columns)
+
+    def parse_filters(self, question):
+        """
+        質問文に含まれる部署・役職・従業員区分・スキル・資格の値を、絞り込み条件として取り出す
+
+        Args:
+            question: 質問文
+
+        Returns:
+            (列名, 値)のリストのリスト（内側のリストは同じ語に該当する条件で、いずれかに一致すればよい）
+        """
+        normalized_question = normalize_text(question)
+
+        # 質問文中の出現位置をすべて集め、長い語を優先して重ならないものだけを採用する
+        # （「プロジェクトマネージャー」に含まれる「マネージャー」などを誤って拾わないため）
+        matches = []
+        for term in self._terms:
+            for match in re.finditer(re.escape(term), normalized_question):
+                matches.append((match.start(), match.end(), term))
+        matches.sort(key=lambda match: match[1] - match[0], reverse=True)
+
+        used = np.zeros(len(normalized_question), dtype=bool)
+        filters = []
+        for start, end, term in matches:
+            if used[start:end].any():
+                continue
+            used[start:end] = True
+            filters.append((start, self._terms[term]))
+
+        filters = [conditions for _, conditions in sorted(filters)]
+
+        # 複数の列に同じ値がある語（役職・従業員区分の「インターン」など）は、
+        # 他の語で使われている列があればその列の値として扱う（「正社員とインターン」→ 従業員区分）
+        used_columns = {conditions[0][0] for conditions in filters if len(conditions) == 1}
+        for i, conditions in enumerate(filters):
+            narrowed = [condition for condition in conditions if condition[0] in used_columns]
+            if len(conditions) > 1 and narrowed:
+                filters[i] = narrowed
+
+        return filters
+
+    def search(self, filters):
+        """
+        絞り込み条件に一致する従業員の行番号を取得
+        同じ列の条件同士は「いずれか」、異なる列の条件同士は「すべて」を満たすものとして扱う
+
+        Args:
+            filters: 「parse_filters」で取り出した絞り込み条件
+
+        Returns:
+            該当する行番号の配列
+        """
+        # 該当する列の組み合わせごとに条件をまとめ、まとめた中では論理和、まとめ同士は論理積を取る
+        groups = {}
+        for conditions in filters:
+            term_mask = np.zeros(self.row_count, dtype=bool)
+            for column, value in conditions:
+                term_mask |= self.masks[column][value]
+            key = frozenset(column for column, _ in conditions)
+            groups[key] = groups[key] | term_mask if key in groups else term_mask
+
+        mask = np.ones(self.row_count, dtype=bool)
+        for group_mask in groups.values():
+            mask &= group_mask
+
+        return np.flatnonzero(mask)
+
+    def render_table(self, rows, columns):
+        """
+        従業員の一覧をマークダウンの表形式で作成
+
+        Args:
+            rows: 行番号の配列
+            columns: 表に含める列名のリスト
+
+        Returns:
+            マークダウンの表
+        """
+        lines = [
+            "| No. | " + " | ".join(columns) + " |",
+            "|" + "---|" * (len(columns) + 1)
+        ]
+        # 列ごとに該当行の値をまとめて取り出してから、行ごとに連結する
+        values = [self.columns[column][rows] for column in columns]
+        for i, row_values in enumerate(zip(*values), 1):
+            lines.append(f"| {i} | " + " | ".join(row_values) + " |")
+
+        return "\n".join(lines)
+
+    def answer(self, question):
+        """
+        従業員の一覧化を求める質問に、LLMを使わずに回答
+
+        Args:
+            question: 質問文
+
+        Returns:
+            回答（マークダウン）。従業員の一覧化を求める質問でない場合はNone
+        """
+        filters = self.parse_filters(question)
+        if not is_roster_query(question, filters):
+            return None
+
+        rows = self.search(filters)
+
+        # 絞り込みに使った複数値の列（スキル・資格）は、該当理由が分かるよう表に含める
+        columns = [column for column in ct.EMPLOYEE_TABLE_COLUMNS if column in self.columns]
+        for conditions in filters:
+            for column, _ in conditions:
+                if column in ct.EMPLOYEE_MULTI_VALUE_COLUMNS and column not in columns:
+                    columns.append(column)
+
+        condition_text = "・".join(dict.fromkeys(conditions[0][1] for conditions in filters))
+        subject = f"{condition_text}に該当する従業員" if condition_text else "全従業員"
+        if len(rows) == 0:
+            return f"{subject}は見つかりませんでした。"
+
+        return f"{subject}は以下の{len(rows)}名です。\n\n{self.render_table(rows, columns)}"
+
+
+############################################################
+# 関数定義
+############################################################
+
+def normalize_text(text):
+    """
+    照合用にテキストを正規化（全角・半角の統一、小文字化）
+
+    Args:
+        text: テキスト
+
+    Returns:
+        正規化したテキスト
+    """
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def create_entity_terms(columns):
+    """
+    質問文中の部署名・氏名の表記から、部署名・氏名への辞書を作成
+    「営業」と「営業部」、「山下涼平」と「山下 涼平」のような表記の違いは同じ部署・従業員として扱う
+
+    Args:
+        columns: 列名 → 値の配列の辞書
+
+    Returns:
+        正規化した表記 → 部署名・氏名の辞書（質問文と長い表記から順に照合できるよう、長い順に並べる）
+    """
+    entity_terms = {}
+    for department in columns.get(ct.EMPLOYEE_DEPARTMENT_COLUMN, []):
+        normalized = normalize_text(department)
+        entity_terms[normalized] = department
+        # 「営業部」→「営業」のように、末尾の「部」を省いた表記も同じ部署とする（1文字になるものは誤検知が多いため除く）
+        if normalized.endswith("部") and len(normalized) > 2:
+            entity_terms[normalized[:-1]] = department
+
+    for name in columns.get(ct.EMPLOYEE_NAME_COLUMN, []):
+        parts = normalize_text(name).split()
+        if not parts:
+            continue
+        entity_terms[" ".join(parts)] = name
+        entity_terms["".join(parts)] = name
+        # 姓・名のみの表記は同姓・同名の従業員がいるため、表記そのものを区別に使う
+        for part in parts:
+            if len(part) > 1:
+                entity_terms.setdefault(part, part)
+
+    entity_terms.pop("", None)
+    return dict(sorted(entity_terms.items(), key=lambda item: len(item[0]), reverse=True))
+
+
+def is_roster_query(question, filters):
+    """
+    従業員の一覧化を求める質問かを判定
+    一覧化・人数などを求める言葉が、従業員を指す言葉（「社員」「〇〇部」など）に対して使われている場合に限る
+    （「会議に参加したメンバーは誰？」「社員旅行の一覧」などは、社内文書の検索で回答する）
+
+    Args:
+        question: 質問文
+        filters: 質問文から取り出した絞り込み条件
+
+    Returns:
+        従業員の一覧化を求める質問であればTrue
+    """
+    normalized_question = normalize_text(question)
+
+    # 一覧化・人数などを求める言葉か、「〇〇に所属している」のような言い回しを含むものに限る
+    intent_keywords = ct.EMPLOYEE_LIST_INTENT_KEYWORDS + ct.EMPLOYEE_AFFILIATION_KEYWORDS
+    if not any(keyword in normalized_question for keyword in intent_keywords):
+        return False
+
+    # 「会議の一覧」などと区別するため、絞り込み条件か従業員を指す言葉を含むものに限る
+    if not filters and not any(keyword in normalized_question for keyword in ct.EMPLOYEE_NOUN_KEYWORDS):
+        return False
+
+    # 従業員を指す言葉・絞り込み条件の値・一覧化を求める言葉を取り除き、それ以外の内容が残らないものに限る
+    # （残るのが助詞などのひらがなと記号のみであれば、一覧化を求める言葉は従業員を対象にしている）
+    terms = [normalize_text(value) for conditions in filters for _, value in conditions]
+    terms += intent_keywords + ct.EMPLOYEE_NOUN_KEYWORDS + ct.EMPLOYEE_QUERY_FILLER_WORDS
+    residual = normalized_question
+    for term in sorted(terms, key=len, reverse=True):
+        residual = residual.replace(term, " ")
+
+    return not re.search(r"[^\sぁ-ゖー、。，．！？!?・,.]", residual)
+
+
+@st.cache_resource(max_entries=1)
+def load_employee_directory(path, mtime):
+    """
+    社員名簿を読み込み、従業員インデックスを作成
+
+    Args:
+        path: 社員名簿のファイルパス
+        mtime: 社員名簿の更新日時（更新された場合に作り直すためのキャッシュのキー）
+
+    Returns:
+        従業員インデックス
+    """
+    df = pd.read_csv(path, encoding="utf-8", dtype=str).fillna("")
+    return EmployeeDirectory(df, path)
+
+
+def get_employee_directory():
+    """
+    プロセス内で共有する従業員インデックスを取得（社員名簿が更新された場合は作り直す）
+
+    Returns:
+        従業員インデックス（社員名簿が存在しない場合はNone）
+    """
+    try:
+        mtime = os.path.getmtime(ct.EMPLOYEE_CSV_PATH)
+    except OSError:
+        return None
+
+    return load_employee_directory(ct.EMPLOYEE_CSV_PATH, mtime)
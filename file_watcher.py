@@ -0,0 +1,124 @@
+"""
+このファイルは、RAGの参照先フォルダの変更を監視し、変更されたファイルをインデックスに反映するファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import logging
+import threading
+import streamlit as st
+import watchfiles
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class FileWatcher:
+    """
+    フォルダ内のファイルの追加・変更・削除を監視し、まとまった変更ごとにインデックスの更新を依頼するクラス
+    OSの変更通知（Linuxではinotify）を使い、使えない環境では一定間隔でフォルダを確認する方式に切り替える
+    """
+    def __init__(self, path, on_change):
+        """
+        Args:
+            path: 監視対象のフォルダのパス
+            on_change: 変更されたファイルパスの集合を受け取る関数
+        """
+        self.path = path
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        監視を別スレッドで開始（開始済みの場合は何もしない）
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="file-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        監視を停止
+        """
+        self._stop_event.set()
+
+    def _run(self):
+        """
+        フォルダの変更を監視し、変更があるたびに通知
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+
+        force_polling = ct.FILE_WATCH_FORCE_POLLING
+        while not self._stop_event.is_set():
+            try:
+                # 保存時などに連続して発生する変更は、一定時間まとめてから1回だけ通知する
+                for changes in watchfiles.watch(
+                    self.path,
+                    watch_filter=is_watch_target,
+                    debounce=ct.FILE_WATCH_DEBOUNCE_MS,
+                    stop_event=self._stop_event,
+                    force_polling=force_polling,
+                    poll_delay_ms=ct.FILE_WATCH_POLL_INTERVAL_MS,
+                    raise_interrupt=False
+                ):
+                    paths = {path for _, path in changes}
+                    logger.info({"message": "データソースの変更を検知しました。", "paths": sorted(paths)})
+                    self.on_change(paths)
+            except Exception as e:
+                # 変更通知の上限に達した場合などは、フォルダを一定間隔で確認する方式で監視を続ける
+                logger.warning({"message": "データソースの監視に失敗しました。", "force_polling": force_polling, "error": f"{type(e).__name__}: {e}"})
+                if force_polling:
+                    self._stop_event.wait(ct.FILE_WATCH_POLL_INTERVAL_MS / 1000)
+                force_polling = True
+
+
+############################################################
+# 関数定義
+############################################################
+
+def is_watch_target(change, path):
+    """
+    インデックスに影響するファイルの変更かどうかを判定
+
+    Args:
+        change: 変更の種類
+        path: 変更されたファイル・フォルダのパス
+
+    Returns:
+        インデックスに影響する変更であればTrue
+    """
+    file_name = os.path.basename(path)
+    # Officeの一時ファイル（「~$」で始まるもの）や隠しファイルは対象外
+    if file_name.startswith(("~$", ".")):
+        return False
+
+    if os.path.splitext(file_name)[1] in ct.SUPPORTED_EXTENSIONS:
+        return True
+
+    # フォルダの移動・名前の変更では、配下のファイルごとの変更は通知されないため、フォルダのパスも対象とする
+    # （削除された場合はフォルダかどうか判定できないため、拡張子が対象外のパスもすべて対象とし、更新時に配下の有無で判定する）
+    return change == watchfiles.Change.deleted or os.path.isdir(path)
+
+
+@st.cache_resource
+def get_file_watcher(path, _on_change):
+    """
+    プロセス内で1つだけ作成される、参照先フォルダの監視処理を取得（初回の呼び出し時に監視を開始）
+
+    Args:
+        path: 監視対象のフォルダのパス
+        _on_change: 変更されたファイルパスの集合を受け取る関数
+
+    Returns:
+        監視処理
+    """
+    watcher = FileWatcher(path, _on_change)
+    watcher.start()
+
+    return watcher
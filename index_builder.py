@@ -0,0 +1,244 @@
+"""
+このファイルは、RAGのインデックスを画面表示とは別のスレッドで作成し、進捗を管理するファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import logging
+import threading
+import time
+import streamlit as st
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class IndexBuildProgress:
+    """
+    インデックス作成の進捗（読み込んだデータソース数・追加したチャンク数・残り時間の目安）
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 状態（"idle": 未実行、"running": 作成中、"done": 完了、"failed": 失敗）
+        self.state = "idle"
+        self.sources_total = 0
+        self.sources_done = 0
+        self.chunks_added = 0
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    def start(self):
+        """
+        作成の開始を記録
+        """
+        with self._lock:
+            self.state = "running"
+            self.sources_total = 0
+            self.sources_done = 0
+            self.chunks_added = 0
+            self.started_at = time.monotonic()
+            self.finished_at = None
+            self.error = None
+
+    def set_sources_total(self, count):
+        """
+        読み込み対象のデータソース数を記録
+
+        Args:
+            count: データソース数
+        """
+        with self._lock:
+            self.sources_total = count
+
+    def add_source(self):
+        """
+        データソースを1件読み込んだことを記録
+        """
+        with self._lock:
+            self.sources_done += 1
+
+    def add_chunks(self, count):
+        """
+        チャンクを埋め込み、インデックスに追加したことを記録
+
+        Args:
+            count: 追加したチャンク数
+        """
+        with self._lock:
+            self.chunks_added += count
+
+    def finish(self, error=None):
+        """
+        作成の終了を記録
+
+        Args:
+            error: 失敗した場合のエラー内容（成功した場合はNone）
+        """
+        with self._lock:
+            self.state = "failed" if error else "done"
+            self.error = error
+            self.finished_at = time.monotonic()
+
+    def get_status(self):
+        """
+        進捗を取得
+
+        Returns:
+            状態・データソース数・チャンク数・経過秒数・残り秒数の目安の辞書
+        """
+        with self._lock:
+            elapsed = 0.0
+            if self.started_at is not None:
+                elapsed = (self.finished_at or time.monotonic()) - self.started_at
+
+            # 読み込み・埋め込みは並行して流れるため、データソースの処理速度から残り時間を見積もる
+            eta = None
+            if self.state == "running" and self.sources_done:
+                eta = elapsed / self.sources_done * max(self.sources_total - self.sources_done, 0)
+
+            return {
+                "state": self.state,
+                "sources_total": self.sources_total,
+                "sources_done": self.sources_done,
+                "chunks_added": self.chunks_added,
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "error": self.error
+            }
+
+
+class IndexBuilder:
+    """
+    インデックスの作成を、画面表示とは別のスレッドで1つずつ実行するクラス
+    """
+    def __init__(self):
+        self.progress = IndexBuildProgress()
+        self._thread = None
+        self._schedule_thread = None
+        self._running = False
+        # 作成中に再作成を求められたかどうか（作成完了後にもう一度作成する）
+        self._rerun_requested = False
+        # 再作成で比較するファイル・フォルダのパスの集合（Noneの場合はすべてのデータソースを比較）
+        self._rerun_paths = None
+        self._lock = threading.Lock()
+
+    def start(self, build, rerun_if_running=False, changed_paths=None):
+        """
+        インデックスの作成を別スレッドで開始
+
+        Args:
+            build: 進捗と変更されたパスを受け取り、インデックスを作成して共有インデックスを差し替える関数
+            rerun_if_running: 作成中の場合に、完了後にもう一度作成するかどうか
+                （作成中に変更されたデータソースを取りこぼさないため）
+            changed_paths: 変更されたファイル・フォルダのパスの集合（Noneの場合はすべてのデータソースを比較）
+
+        Returns:
+            作成を開始した場合はTrue
+        """
+        changed_paths = None if changed_paths is None else set(changed_paths)
+        with self._lock:
+            if self._running:
+                if rerun_if_running:
+                    # 作成中に複数回変更された場合は、変更されたパスをまとめて1回で反映する
+                    if not self._rerun_requested:
+                        self._rerun_paths = changed_paths
+                    elif self._rerun_paths is not None:
+                        self._rerun_paths = None if changed_paths is None else self._rerun_paths | changed_paths
+                    self._rerun_requested = True
+                return False
+            self._running = True
+            self.progress.start()
+            self._thread = threading.Thread(target=self._run, args=(build, changed_paths), name="index-builder", daemon=True)
+            self._thread.start()
+
+        return True
+
+    def start_schedule(self, build, interval):
+        """
+        一定間隔でインデックスの作成を開始するスレッドを起動（起動済みの場合は何もしない）
+
+        Args:
+            build: 進捗と変更されたパスを受け取り、インデックスを作成して共有インデックスを差し替える関数
+            interval: 作成を開始する間隔（秒）
+
+        Returns:
+            スレッドを起動した場合はTrue
+        """
+        with self._lock:
+            if self._schedule_thread is not None:
+                return False
+            self._schedule_thread = threading.Thread(
+                target=self._run_schedule, args=(build, interval), name="index-scheduler", daemon=True
+            )
+            self._schedule_thread.start()
+
+        return True
+
+    def is_running(self):
+        """
+        インデックスを作成中かどうかを確認
+
+        Returns:
+            作成中であればTrue
+        """
+        return self._running
+
+    def _run_schedule(self, build, interval):
+        """
+        一定間隔でインデックスの作成を開始（作成中の場合は次の間隔まで待つ）
+
+        Args:
+            build: 進捗と変更されたパスを受け取り、インデックスを作成して共有インデックスを差し替える関数
+            interval: 作成を開始する間隔（秒）
+        """
+        while True:
+            time.sleep(interval)
+            self.start(build)
+
+    def _run(self, build, changed_paths):
+        """
+        インデックスを作成し、結果を進捗に記録
+
+        Args:
+            build: 進捗と変更されたパスを受け取り、インデックスを作成して共有インデックスを差し替える関数
+            changed_paths: 変更されたファイル・フォルダのパスの集合（Noneの場合はすべてのデータソースを比較）
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+        while True:
+            try:
+                build(self.progress, changed_paths)
+            except Exception as e:
+                # 失敗しても公開中のインデックスはそのまま使えるため、記録のみ行う
+                logger.error({"message": ct.INDEX_BUILD_ERROR_MESSAGE, "error": f"{type(e).__name__}: {e}"})
+                self.progress.finish(f"{type(e).__name__}: {e}")
+            else:
+                self.progress.finish()
+                logger.info({"message": "インデックスの作成が完了しました。", **self.progress.get_status()})
+
+            # 作成中に再作成を求められていれば、同じスレッドで続けて作成する
+            with self._lock:
+                if not self._rerun_requested:
+                    self._running = False
+                    return
+                self._rerun_requested = False
+                changed_paths, self._rerun_paths = self._rerun_paths, None
+                self.progress.start()
+
+
+############################################################
+# 関数定義
+############################################################
+
+@st.cache_resource
+def get_index_builder():
+    """
+    プロセス内で共有するインデックス作成処理を取得
+
+    Returns:
+        インデックス作成処理
+    """
+    return IndexBuilder()
@@ -0,0 +1,559 @@
+"""
+このファイルは、全セッションで共有するRAGのインデックス（ベクターストア）を管理するファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import hashlib
+import shutil
+import threading
+import time
+from uuid import uuid4
+import streamlit as st
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+import constants as ct
+import lexical_index as li
+import vector_backend
+
+
+############################################################
+# クラス定義
+############################################################
+
+class SharedIndex:
+    """
+    プロセス内の全セッションから参照される、RAGのインデックスの保持クラス
+    """
+    def __init__(self):
+        # インデックスの参照・差し替えを排他制御するためのロック
+        self._lock = threading.Lock()
+        # インデックスの作成処理を同時に1つだけ実行するためのロック
+        self.build_lock = threading.Lock()
+        # 現在公開中のベクターストアと、キーワード検索用の転置インデックス
+        self._db = None
+        self._lexical_index = None
+        # 現在公開中のインデックス世代の保存先フォルダのパス
+        self.generation_path = None
+        # インデックスを差し替えるたびに加算される世代番号
+        self.version = 0
+
+    def is_ready(self):
+        """
+        インデックスが利用可能かどうかを確認
+
+        Returns:
+            インデックスが作成済みであればTrue
+        """
+        return self._db is not None
+
+    def get_db(self):
+        """
+        現在公開中のベクターストアを取得
+
+        Returns:
+            ベクターストア
+        """
+        with self._lock:
+            return self._db
+
+    def get_snapshot(self):
+        """
+        現在公開中のベクターストアと転置インデックスを、同じ世代の組として取得
+
+        Returns:
+            (ベクターストア, 転置インデックス)
+        """
+        with self._lock:
+            return self._db, self._lexical_index
+
+    def get_documents(self, chunk_ids):
+        """
+        チャンクIDに対応するチャンクを取得
+
+        Args:
+            chunk_ids: チャンクIDのリスト
+
+        Returns:
+            チャンクのリスト（公開中の世代に存在しないIDは除く）
+        """
+        return self.get_db().get_documents(chunk_ids)
+
+    def hybrid_search(self, query, k):
+        """
+        キーワード検索とベクトル検索を組み合わせて、クエリと関連性が高いチャンクを検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+
+        Returns:
+            チャンクのリスト（関連性が高い順）
+        """
+        # 検索開始時点の世代を取得し、検索中に差し替えが起きても同じ世代で検索を完結させる
+        db, lexical_index = self.get_snapshot()
+
+        # 両方の検索で候補を多めに取る
+        vector_docs = db.similarity_search(query, k=ct.HYBRID_CANDIDATE_COUNT)
+        lexical_docs = [doc for doc, _ in lexical_index.search(query, ct.HYBRID_CANDIDATE_COUNT, db.get_documents)]
+
+        # 社員IDや会社名など、クエリをそのまま含むチャンクは上位に来やすいよう重みを付けて統合する
+        # （「会議」のような短い語が偶然含まれるだけのチャンクで、意味の近い検索結果を置き換えないため）
+        exact_docs = [doc for doc, _ in lexical_index.search_exact(query, ct.HYBRID_CANDIDATE_COUNT, db.get_documents)]
+
+        return li.reciprocal_rank_fusion(
+            [vector_docs, lexical_docs, exact_docs],
+            k,
+            weights=[1.0, 1.0, ct.HYBRID_EXACT_MATCH_WEIGHT]
+        )
+
+    def hybrid_search_with_scores(self, query, k):
+        """
+        キーワード検索とベクトル検索を組み合わせて検索し、ベクトル検索の関連度スコアを付けて取得
+        関連度スコアの閾値で絞り込む「社内文書検索」モードで使う
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+
+        Returns:
+            (チャンク, 関連度スコア, クエリをそのまま含むか)のリスト（関連性が高い順）
+            ベクトル検索の候補に含まれないチャンクの関連度スコアはNone
+        """
+        db, lexical_index = self.get_snapshot()
+
+        vector_docs_and_scores = db.similarity_search_with_relevance_scores(query, k=ct.HYBRID_CANDIDATE_COUNT)
+        lexical_docs = [doc for doc, _ in lexical_index.search(query, ct.HYBRID_CANDIDATE_COUNT, db.get_documents)]
+        exact_docs = [doc for doc, _ in lexical_index.search_exact(query, ct.HYBRID_CANDIDATE_COUNT, db.get_documents)]
+
+        docs = li.reciprocal_rank_fusion(
+            [[doc for doc, _ in vector_docs_and_scores], lexical_docs, exact_docs],
+            k,
+            weights=[1.0, 1.0, ct.HYBRID_EXACT_MATCH_WEIGHT]
+        )
+        scores = {doc.metadata["chunk_id"]: score for doc, score in vector_docs_and_scores}
+        exact_ids = {doc.metadata["chunk_id"] for doc in exact_docs}
+
+        return [(doc, scores.get(doc.metadata["chunk_id"]), doc.metadata["chunk_id"] in exact_ids) for doc in docs]
+
+    def swap(self, db, lexical_index, generation_path=None):
+        """
+        公開中のベクターストアと転置インデックスを新しいものに差し替え
+
+        Args:
+            db: 新しく作成したベクターストア
+            lexical_index: 新しく作成した転置インデックス
+            generation_path: 新しいインデックス世代の保存先フォルダのパス
+        """
+        # 参照の付け替えのみをロック内で行うため、検索中のセッションは差し替え前のインデックスを最後まで使える
+        with self._lock:
+            self._db = db
+            self._lexical_index = lexical_index
+            self.generation_path = generation_path
+            self.version += 1
+
+
+class SharedIndexRetriever(BaseRetriever):
+    """
+    検索のたびに共有インデックスの最新世代を参照するRetriever
+    """
+    # 非同期の検索は別スレッドで実行されるため、共有インデックスは作成時に受け取っておく
+    shared_index: SharedIndex
+    search_kwargs: dict = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        return self.shared_index.hybrid_search(query, self.search_kwargs["k"])
+
+
+############################################################
+# 関数定義
+############################################################
+
+@st.cache_resource
+def get_shared_index():
+    """
+    プロセス内で1つだけ作成される共有インデックスを取得
+
+    Returns:
+        共有インデックス
+    """
+    return SharedIndex()
+
+
+def get_shared_retriever(k=ct.RETRIEVER_SEARCH_COUNT, shared_index=None):
+    """
+    共有インデックスを検索するRetrieverを取得
+
+    Args:
+        k: 取得するチャンク数
+        shared_index: 検索する共有インデックス（画面処理のスレッド以外から呼び出す場合は、取得済みのものを渡す）
+
+    Returns:
+        共有インデックスを検索するRetriever
+    """
+    return SharedIndexRetriever(
+        shared_index=shared_index if shared_index is not None else get_shared_index(),
+        search_kwargs={"k": k}
+    )
+
+
+def scan_corpus_files(changed_paths=None):
+    """
+    RAGの参照先となるファイルの一覧と、各ファイルの更新日時・サイズを取得
+
+    Args:
+        changed_paths: 走査対象を絞り込むファイル・フォルダのパスのリスト（Noneの場合は参照先フォルダ全体）
+
+    Returns:
+        ファイルパスをキー、更新日時・サイズを値とする辞書
+    """
+    files = {}
+    for root_path in [ct.RAG_TOP_FOLDER_PATH] if changed_paths is None else changed_paths:
+        # 変更通知のパスは絶対パスのため、マニフェストと同じ参照先フォルダ起点のパスに揃える
+        root_path = to_corpus_path(root_path)
+        if os.path.isfile(root_path):
+            if os.path.splitext(root_path)[1] in ct.SUPPORTED_EXTENSIONS:
+                stat = os.stat(root_path)
+                files[root_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+            continue
+
+        # ファイルの中身は読まず、ファイルシステムの情報のみを集めるため高速に完了する
+        for dir_path, dir_names, file_names in os.walk(root_path):
+            # 走査順を固定するため、フォルダ名を並び替え
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                # 読み込み対象外のファイル形式は、インデックスに影響しないため記録しない
+                if os.path.splitext(file_name)[1] not in ct.SUPPORTED_EXTENSIONS:
+                    continue
+                full_path = os.path.join(dir_path, file_name)
+                stat = os.stat(full_path)
+                files[full_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+    return files
+
+
+def to_corpus_path(path):
+    """
+    ファイル・フォルダのパスを、参照先フォルダを起点とするパス（マニフェストに記録する形式）に変換
+
+    Args:
+        path: ファイル・フォルダのパス
+
+    Returns:
+        参照先フォルダを起点とするパス（参照先フォルダ自体の場合は参照先フォルダのパス）
+    """
+    relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(ct.RAG_TOP_FOLDER_PATH))
+    if relative_path == ".":
+        return ct.RAG_TOP_FOLDER_PATH
+    return os.path.join(ct.RAG_TOP_FOLDER_PATH, relative_path)
+
+
+def is_under_paths(path, parent_paths):
+    """
+    ファイルパスが、いずれかのパスと一致するか、いずれかのフォルダの配下にあるかを確認
+
+    Args:
+        path: ファイルパス
+        parent_paths: ファイル・フォルダのパスのリスト
+
+    Returns:
+        一致するか配下にあればTrue
+    """
+    return any(
+        path == parent_path or path.startswith(parent_path.rstrip(os.sep) + os.sep)
+        for parent_path in parent_paths
+    )
+
+
+def compute_file_hash(path):
+    """
+    ファイルの中身のハッシュ値を計算
+
+    Args:
+        path: ファイルパス
+
+    Returns:
+        SHA-256のハッシュ値
+    """
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        # 大きなファイルでもメモリを圧迫しないよう、少しずつ読み込む
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def create_chunk_ids(source, count):
+    """
+    データソースから作成したチャンクに割り当てるIDを作成
+
+    Args:
+        source: ファイルパスまたはURL
+        count: チャンク数
+
+    Returns:
+        チャンクIDのリスト
+    """
+    # 同じデータソースからは常に同じIDが作られるため、更新時に古いチャンクを特定して削除できる
+    source_key = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+    return [f"{source_key}-{i}" for i in range(count)]
+
+
+def create_index_settings():
+    """
+    インデックスの作り直しが必要かどうかの判定に使う、チャンク分割・ベクターストアの設定を取得
+
+    Returns:
+        設定の辞書
+    """
+    return {
+        "chunk_size": ct.CHUNK_SIZE,
+        "chunk_overlap": ct.CHUNK_OVERLAP,
+        "vector_backend": ct.VECTOR_BACKEND,
+        "vector_dtype": ct.VECTOR_DTYPE,
+        "vector_search_type": ct.VECTOR_SEARCH_TYPE,
+        "vector_format": vector_backend.STORE_FORMAT_VERSION,
+    }
+
+
+def create_index_plan(old_manifest, web_pages, changed_paths=None):
+    """
+    前回のマニフェストと現在のデータソースを比較し、インデックスの更新内容を決定
+
+    Args:
+        old_manifest: 前回のインデックス作成時に保存したマニフェスト（存在しない場合はNone）
+        web_pages: Webページの取得結果（「web_loader.refresh_web_pages」の戻り値）
+        changed_paths: 変更を検知したファイル・フォルダのパスのリスト
+            （Noneの場合は参照先フォルダ全体を比較し、指定した場合はその配下のみを比較する）
+
+    Returns:
+        インデックスの更新内容を表す辞書
+        - 「full_rebuild」: インデックスを一から作り直すかどうか
+        - 「manifest」: 更新後のマニフェスト（読み込み直すデータソースのチャンクIDは未設定）
+        - 「load_paths」: 読み込み直すファイルパスのリスト
+        - 「load_urls」: 読み込み直すWebページのURLのリスト
+        - 「delete_chunk_ids」: インデックスから削除するチャンクIDのリスト
+    """
+    settings = create_index_settings()
+
+    # 前回のマニフェストがない場合や、チャンク分割・ベクターストアの設定が変わった場合はすべてを読み込み直す
+    full_rebuild = old_manifest is None or old_manifest["settings"] != settings
+    old_files = {} if full_rebuild else old_manifest["files"]
+    old_web_urls = {} if full_rebuild else old_manifest["web_urls"]
+
+    manifest = {"settings": settings, "files": {}, "web_urls": {}}
+    load_paths = []
+    load_urls = []
+    delete_chunk_ids = []
+
+    # 変更を検知したパスが分かっている場合は、その配下以外のファイルを走査せずに前回の状態を引き継ぐ
+    # （フォルダの移動・名前の変更は、移動元の配下の削除と移動先の配下の追加として扱われる）
+    if changed_paths is not None and not full_rebuild:
+        changed_paths = [to_corpus_path(path) for path in changed_paths]
+        for path, old_entry in old_files.items():
+            if not is_under_paths(path, changed_paths):
+                manifest["files"][path] = old_entry
+        current_files = scan_corpus_files(changed_paths)
+    else:
+        current_files = scan_corpus_files()
+
+    for path, stat in current_files.items():
+        old_entry = old_files.get(path)
+        # 更新日時とサイズが前回と同じであれば、中身を読まずに変更なしと判定
+        if old_entry and old_entry["mtime"] == stat["mtime"] and old_entry["size"] == stat["size"]:
+            manifest["files"][path] = old_entry
+            continue
+
+        # 更新日時などが変わっていても、中身が同じであればチャンクはそのまま使う
+        file_hash = compute_file_hash(path)
+        if old_entry and old_entry["hash"] == file_hash:
+            manifest["files"][path] = {**old_entry, **stat}
+            continue
+
+        # 新規または中身が変わったファイルは読み込み直し、古いチャンクは削除
+        manifest["files"][path] = {**stat, "hash": file_hash, "chunk_ids": []}
+        load_paths.append(path)
+        if old_entry:
+            delete_chunk_ids.extend(old_entry["chunk_ids"])
+
+    # 削除されたファイルのチャンクを削除
+    for path, old_entry in old_files.items():
+        if path not in manifest["files"]:
+            delete_chunk_ids.extend(old_entry["chunk_ids"])
+
+    # Webページは、本文から取り出したテキストが前回から変わったもののみ読み込み直す
+    for web_url in ct.WEB_URL_LOAD_TARGETS:
+        old_entry = old_web_urls.get(web_url)
+        page_hash = web_pages.get(web_url, {}).get("hash")
+
+        # 取得できなかったページは、前回のチャンクがあればそのまま使う（次回の更新時に再取得）
+        if page_hash is None:
+            if old_entry:
+                manifest["web_urls"][web_url] = old_entry
+            continue
+
+        if old_entry and old_entry.get("hash") == page_hash:
+            manifest["web_urls"][web_url] = old_entry
+            continue
+
+        manifest["web_urls"][web_url] = {"hash": page_hash, "chunk_ids": []}
+        load_urls.append(web_url)
+        if old_entry:
+            delete_chunk_ids.extend(old_entry["chunk_ids"])
+
+    # 読み込み対象から外れたWebページのチャンクを削除
+    for web_url, old_entry in old_web_urls.items():
+        if web_url not in manifest["web_urls"]:
+            delete_chunk_ids.extend(old_entry["chunk_ids"])
+
+    return {
+        "full_rebuild": full_rebuild,
+        "manifest": manifest,
+        "load_paths": load_paths,
+        "load_urls": load_urls,
+        "delete_chunk_ids": delete_chunk_ids,
+    }
+
+
+def is_plan_empty(plan):
+    """
+    インデックスの更新内容が空かどうかを確認
+
+    Args:
+        plan: インデックスの更新内容
+
+    Returns:
+        チャンクの追加・削除が一切不要であればTrue
+    """
+    return not (plan["full_rebuild"] or plan["load_paths"] or plan["load_urls"] or plan["delete_chunk_ids"])
+
+
+def get_current_generation_path():
+    """
+    公開中のインデックス世代の保存先フォルダを取得
+
+    Returns:
+        保存先フォルダのパス（公開中の世代が存在しない場合はNone）
+    """
+    current_file_path = os.path.join(ct.VECTOR_STORE_DIR_PATH, ct.INDEX_CURRENT_FILE)
+    if not os.path.isfile(current_file_path):
+        return None
+
+    with open(current_file_path, encoding="utf-8") as f:
+        generation = f.read().strip()
+
+    generation_path = os.path.join(ct.VECTOR_STORE_DIR_PATH, generation)
+    if not os.path.isdir(generation_path):
+        return None
+
+    return generation_path
+
+
+def create_generation_path():
+    """
+    新しいインデックス世代の保存先フォルダを作成
+
+    Returns:
+        保存先フォルダのパス
+    """
+    # 作成日時順に並ぶ世代名にすることで、古い世代を判別しやすくする
+    generation = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid4().hex[:8]}"
+    generation_path = os.path.join(ct.VECTOR_STORE_DIR_PATH, generation)
+    os.makedirs(generation_path, exist_ok=True)
+
+    return generation_path
+
+
+def publish_generation(generation_path):
+    """
+    指定のインデックス世代を公開中の世代として記録し、不要になった古い世代を削除
+
+    Args:
+        generation_path: 公開するインデックス世代の保存先フォルダのパス
+    """
+    current_file_path = os.path.join(ct.VECTOR_STORE_DIR_PATH, ct.INDEX_CURRENT_FILE)
+    # 書き込み途中のファイルが読まれないよう、一時ファイルに書き込んでから置き換える
+    tmp_file_path = f"{current_file_path}.{uuid4().hex}.tmp"
+    with open(tmp_file_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(generation_path))
+    os.replace(tmp_file_path, current_file_path)
+
+    # 公開中の世代と、直近の世代のみを残して削除
+    generations = sorted(
+        name for name in os.listdir(ct.VECTOR_STORE_DIR_PATH)
+        if os.path.isdir(os.path.join(ct.VECTOR_STORE_DIR_PATH, name))
+        and name != os.path.basename(generation_path)
+    )
+    for name in generations[:max(len(generations) - ct.INDEX_KEEP_GENERATIONS, 0)]:
+        shutil.rmtree(os.path.join(ct.VECTOR_STORE_DIR_PATH, name), ignore_errors=True)
+
+
+def load_manifest(generation_path):
+    """
+    インデックス世代に保存されたマニフェストを読み込み
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+
+    Returns:
+        マニフェスト（存在しない場合はNone）
+    """
+    manifest_path = os.path.join(generation_path, ct.INDEX_MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return None
+
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(generation_path, manifest):
+    """
+    インデックス世代にマニフェストを保存
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        manifest: 保存するマニフェスト
+    """
+    manifest_path = os.path.join(generation_path, ct.INDEX_MANIFEST_FILE)
+    tmp_file_path = f"{manifest_path}.{uuid4().hex}.tmp"
+    with open(tmp_file_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_file_path, manifest_path)
+
+
+def load_build_stats(generation_path):
+    """
+    インデックス世代に保存された作成時の統計を読み込み
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+
+    Returns:
+        作成時の統計（存在しない場合はNone）
+    """
+    stats_path = os.path.join(generation_path, ct.INDEX_STATS_FILE)
+    if not os.path.isfile(stats_path):
+        return None
+
+    with open(stats_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_build_stats(generation_path, stats):
+    """
+    インデックス世代に作成時の統計を保存
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        stats: 保存する統計
+    """
+    stats_path = os.path.join(generation_path, ct.INDEX_STATS_FILE)
+    tmp_file_path = f"{stats_path}.{uuid4().hex}.tmp"
+    with open(tmp_file_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file_path, stats_path)
@@ -7,19 +7,30 @@
 ############################################################
 import os
 import logging
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
 from logging.handlers import TimedRotatingFileHandler
 from uuid import uuid4
 import sys
 import unicodedata
 from dotenv import load_dotenv
 import streamlit as st
-from docx import Document
-from langchain_community.document_loaders import WebBaseLoader
+from langchain.schema import Document
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 import constants as ct
 import utils
+import index_manager
+import index_builder
+import chat_history
+import embedding_pipeline
+import lexical_index as li
+import vector_backend
+import web_loader
+import file_watcher
 
 
 ############################################################
@@ -43,7 +54,7 @@ def initialize():
     initialize_session_id()
     # ログ出力の設定
     initialize_logger()
-    # RAGのRetrieverを作成
+    # RAGのRetrieverを用意（インデックスの作成・更新は別スレッドで行い、画面表示を待たせない）
     initialize_retriever()
 
 
@@ -101,27 +112,232 @@ def initialize_session_id():
 
 def initialize_retriever():
     """
-    画面読み込み時にRAGのRetriever（ベクターストアから検索するオブジェクト）を作成
+    画面読み込み時にRAGのRetriever（ベクターストアから検索するオブジェクト）を用意
+    公開中のインデックス世代があればそのまま読み込んで検索を受け付け、作成・更新は別スレッドで行う
     """
-    # ロガーを読み込むことで、後続の処理中に発生したエラーなどがログファイルに記録される
     logger = logging.getLogger(ct.LOGGER_NAME)
 
-    # すでにRetrieverが作成済みの場合、後続の処理を中断
-    if "retriever" in st.session_state:
+    # 全セッションで共有するインデックスと、インデックスの作成処理を取得
+    shared_index = index_manager.get_shared_index()
+    builder = index_builder.get_index_builder()
+
+    # 作成を「build_index.py」に任せる構成の場合は、公開中の世代の読み込みのみ行う
+    if not is_index_build_on_startup():
+        load_published_generation(shared_index)
         return
-    
-    # RAGの参照先となるデータソースの読み込み
-    docs_all = load_data_sources()
 
-    # OSがWindowsの場合、Unicode正規化と、cp932（Windows用の文字コード）で表現できない文字を除去
-    for doc in docs_all:
-        doc.page_content = adjust_string(doc.page_content)
-        for key in doc.metadata:
-            doc.metadata[key] = adjust_string(doc.metadata[key])
-    
-    # 埋め込みモデルの用意
-    embeddings = OpenAIEmbeddings()
-    
+    # すでに他のセッションで作成処理を開始している場合、後続の処理を中断
+    # （失敗した場合の再実行は、画面のボタンから行う）
+    if builder.progress.state != "idle":
+        return
+
+    # 複数のセッションから同時に呼び出された場合でも、読み込みと作成の開始は1回のみ実行
+    with shared_index.build_lock:
+        if builder.progress.state != "idle":
+            return
+
+        # 前回起動時までに作成した世代があれば、作成処理を待たずに検索を受け付ける
+        try:
+            current = load_current_generation()
+        except Exception as e:
+            # 読み込めない場合は、作成処理の完了を待つ
+            current = None
+            logger.warning({"message": "保存済みのベクターストアの読み込みに失敗しました。", "error": f"{type(e).__name__}: {e}"})
+        if current:
+            shared_index.swap(*current)
+
+        # 共有リソースは画面のスレッドで用意してから、データソースの変更の反映を別スレッドで開始
+        embedding_pipeline.get_embeddings()
+        builder.start(rebuild_retriever)
+
+        # Webページは起動のたびではなく一定間隔で取得し直すため、同じ間隔でインデックスの更新を行う
+        if ct.WEB_URL_LOAD_TARGETS:
+            builder.start_schedule(rebuild_retriever, ct.WEB_REFRESH_INTERVAL_SECONDS)
+
+        # 参照先フォルダのファイルが追加・変更・削除されたら、そのファイルのみをインデックスに反映
+        if ct.FILE_WATCH_ENABLED:
+            file_watcher.get_file_watcher(ct.RAG_TOP_FOLDER_PATH, on_data_source_change)
+
+
+def load_published_generation(shared_index):
+    """
+    公開中のインデックス世代を共有インデックスに読み込み
+    読み込み済みの世代が公開中のままであれば、読み込み直さない（差し替えると回答キャッシュが無効になるため）
+
+    Args:
+        shared_index: 全セッションで共有するインデックス
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    if shared_index.is_ready() and shared_index.generation_path == index_manager.get_current_generation_path():
+        return
+
+    # 複数のセッションから同時に呼び出された場合でも、読み込みは1回のみ実行
+    with shared_index.build_lock:
+        if shared_index.is_ready() and shared_index.generation_path == index_manager.get_current_generation_path():
+            return
+
+        try:
+            current = load_current_generation()
+        except Exception as e:
+            current = None
+            logger.warning({"message": "保存済みのベクターストアの読み込みに失敗しました。", "error": f"{type(e).__name__}: {e}"})
+
+        if current:
+            shared_index.swap(*current)
+            logger.info({"message": "公開中のインデックス世代を読み込みました（起動時の作成・更新は行いません）。", "generation": current[2]})
+        elif not shared_index.is_ready():
+            logger.error({
+                "message": "公開中のインデックス世代がない（または読み込めない）ため、検索を受け付けられません。「build_index.py」でインデックスを作成してください。",
+                "vector_store_dir": ct.VECTOR_STORE_DIR_PATH,
+                "env": f"{ct.INDEX_BUILD_ON_STARTUP_ENV}=true で起動すると、画面読み込み時に作成します。"
+            })
+
+
+def is_index_build_on_startup():
+    """
+    画面読み込み時にインデックスの作成・更新を行うかを判定
+    環境変数「INDEX_BUILD_ON_STARTUP」が設定されていればその値、なければ設定値を使う
+
+    Returns:
+        作成・更新を行う場合はTrue
+    """
+    value = os.environ.get(ct.INDEX_BUILD_ON_STARTUP_ENV)
+    if value is None or not value.strip():
+        return ct.INDEX_BUILD_ON_STARTUP
+
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def on_data_source_change(paths):
+    """
+    参照先フォルダの変更を検知した際に、インデックスの更新を別スレッドで開始
+    変更されていないファイルは読み込まず、変更されたファイルのチャンクのみを追加・差し替え・削除する
+
+    Args:
+        paths: 変更されたファイル・フォルダのパスの集合
+    """
+    # 更新中に検知した変更は、更新完了後にまとめてもう一度更新して反映する
+    index_builder.get_index_builder().start(rebuild_retriever, rerun_if_running=True, changed_paths=paths)
+
+
+def rebuild_retriever(progress=None, changed_paths=None):
+    """
+    RAGのインデックスを作り直し、全セッションで共有しているインデックスを差し替え
+
+    Args:
+        progress: 作成の進捗を記録するオブジェクト
+        changed_paths: 変更を検知したファイル・フォルダのパスの集合（Noneの場合はすべてのデータソースを比較）
+    """
+    shared_index = index_manager.get_shared_index()
+
+    # 作成中も既存のインデックスで検索できるよう、差し替えは作成完了後に一度だけ行う
+    with shared_index.build_lock:
+        result = build_vectorstore(progress, shared_index.generation_path, changed_paths=changed_paths)
+        # 公開中の世代から変更がない場合は差し替えない（回答キャッシュを無効にしないため）
+        if result:
+            shared_index.swap(*result)
+
+
+def load_current_generation():
+    """
+    公開中のインデックス世代を、データソースとの比較を行わずにそのまま読み込み
+
+    Returns:
+        (ベクターストア, 転置インデックス, 世代の保存先フォルダのパス)
+        読み込める世代がない場合や、ベクターストアの設定が変わった場合はNone
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    current_generation_path = index_manager.get_current_generation_path()
+    manifest = index_manager.load_manifest(current_generation_path) if current_generation_path else None
+    if not manifest:
+        return None
+
+    # 保存形式が異なる世代は開けないため、作り直しを待つ（チャンク分割の設定のみが異なる場合はそのまま使う）
+    settings = manifest["settings"]
+    expected_settings = index_manager.create_index_settings()
+    if any(settings.get(key) != value for key, value in expected_settings.items() if key.startswith("vector_")):
+        return None
+
+    db = vector_backend.open_vector_store(current_generation_path, embedding_pipeline.get_embeddings())
+    lexical_index = load_lexical_index(current_generation_path, db)
+    logger.info({"message": "保存済みのベクターストアを読み込みました。", "generation": current_generation_path})
+
+    return db, lexical_index, current_generation_path
+
+
+def build_vectorstore(progress=None, loaded_generation_path=None, full_rebuild=False, changed_paths=None):
+    """
+    RAGの参照先となるデータソースを読み込み、ベクターストアとキーワード検索用の転置インデックスを作成
+    前回作成時から変更があったデータソースのチャンクのみを追加・差し替え・削除する
+
+    Args:
+        progress: 作成の進捗を記録するオブジェクト
+        loaded_generation_path: すでに読み込み済みのインデックス世代の保存先フォルダのパス
+        full_rebuild: 公開中の世代を使わず、すべてのデータソースを読み込み直すかどうか
+        changed_paths: 変更を検知したファイル・フォルダのパスの集合
+            （指定した場合はその配下のファイルのみを比較し、Webページは取得し直さない）
+
+    Returns:
+        (ベクターストア, 転置インデックス, 世代の保存先フォルダのパス)
+        読み込み済みの世代から変更がない場合はNone
+    """
+    # ロガーを読み込むことで、後続の処理中に発生したエラーなどがログファイルに記録される
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start_time = time.perf_counter()
+
+    # 埋め込みモデルの用意（キャッシュにないチャンクのみを、バッチ化・並列化して埋め込む）
+    embeddings = embedding_pipeline.get_embeddings()
+
+    # 保存済みのベクターストア作成時の状態と、データソースの現在の状態を比較
+    current_generation_path = index_manager.get_current_generation_path()
+    old_manifest = None
+    if current_generation_path and not full_rebuild:
+        old_manifest = index_manager.load_manifest(current_generation_path)
+    # 作り直しが必要な場合は、変更を検知したパスによらずすべてのデータソースを比較する
+    if not old_manifest or old_manifest["settings"] != index_manager.create_index_settings():
+        changed_paths = None
+
+    if changed_paths is None:
+        # Webページは並列に取得してキャッシュに保存し、変更の有無を本文のハッシュ値で判定する
+        web_pages = web_loader.refresh_web_pages(ct.WEB_URL_LOAD_TARGETS, force=full_rebuild)
+    else:
+        # ファイルの変更の反映では、Webページは前回の読み込み結果をそのまま使う（取得し直しは定期更新で行う）
+        web_pages = {}
+    plan = index_manager.create_index_plan(old_manifest, web_pages, changed_paths)
+    manifest = plan["manifest"]
+    if progress:
+        progress.set_sources_total(len(plan["load_paths"]) + len(plan["load_urls"]))
+
+    # チャンクの追加・削除が不要な場合、保存済みのベクターストアを読み込んで処理を終了
+    if index_manager.is_plan_empty(plan):
+        # 中身が同じでも更新日時が変わったファイルがあれば、次回の比較用にマニフェストのみ更新
+        if manifest != old_manifest:
+            index_manager.save_manifest(current_generation_path, manifest)
+        if current_generation_path == loaded_generation_path:
+            return None
+        logger.info({"message": "保存済みのベクターストアを読み込みました。", "generation": current_generation_path})
+        db = vector_backend.open_vector_store(current_generation_path, embeddings)
+        return db, load_lexical_index(current_generation_path, db), current_generation_path
+
+    # 公開中のベクターストアを壊さないよう、新しい世代のフォルダ上で更新を行う
+    generation_path = index_manager.create_generation_path()
+    if not plan["full_rebuild"]:
+        # 差分更新の場合、公開中の世代のファイルを引き継いでから変更があったチャンクのみを反映
+        # 書き込み量が変更量に比例するのは「VECTOR_BACKEND」が"numpy"の場合のみ（ハードリンクで引き継ぎ、追加したチャンクのみを書き出す）。
+        # 既定の"chroma"の場合は、ファイルの変更の反映のたびにベクターストア全体を複製するため、コーパスの大きさに比例する
+        vector_backend.clone_generation(current_generation_path, generation_path)
+    db = vector_backend.open_vector_store(generation_path, embeddings)
+
+    lexical_index = load_lexical_index(generation_path, db)
+
+    # 変更・削除されたデータソースの古いチャンクを削除
+    # （転置インデックスはテキストから削除する語を判定するため、ベクターストアから削除する前に削除する）
+    if plan["delete_chunk_ids"]:
+        lexical_index.delete(db.get_documents(plan["delete_chunk_ids"]))
+        db.delete(plan["delete_chunk_ids"])
+
     # チャンク分割用のオブジェクトを作成
     text_splitter = CharacterTextSplitter(
         chunk_size=ct.CHUNK_SIZE,
@@ -129,14 +345,192 @@ def initialize_retriever():
         separator="\n"
     )
 
+    # 「読み込み → 正規化・チャンク分割 → 埋め込み → 追加」を一定件数ずつ流すことで、
+    # データソースの量によらずメモリ上に保持するチャンク数を一定に抑える
+    # ファイルの中身のハッシュ値は比較時に計算済みのため、読み込み時には計算し直さない
+    file_hashes = {path: manifest["files"][path]["hash"] for path in plan["load_paths"]}
+    results = load_sources(plan["load_paths"], plan["load_urls"], file_hashes)
+    splitted_docs = iter_source_chunks(results, text_splitter, manifest, progress)
+    chunk_count = 0
+    for batch in iter_batches(splitted_docs, ct.INGEST_BATCH_SIZE):
+        add_chunks(db, lexical_index, embeddings, batch)
+        chunk_count += len(batch)
+        if progress:
+            progress.add_chunks(len(batch))
+
+    db.persist()
+    lexical_index.save(os.path.join(generation_path, ct.LEXICAL_INDEX_FILE))
+
+    # 作成した世代だけで内容が分かるよう、作成時の統計を世代と一緒に保存
+    stats = {
+        "generation": os.path.basename(generation_path),
+        "base_generation": None if plan["full_rebuild"] else os.path.basename(current_generation_path),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "full_rebuild": plan["full_rebuild"],
+        "settings": manifest["settings"],
+        "embedding_model": ct.EMBEDDING_MODEL,
+        "sources": len(manifest["files"]) + len(manifest["web_urls"]),
+        "loaded_sources": len(plan["load_paths"]) + len(plan["load_urls"]),
+        "chunks": len(lexical_index.doc_lengths),
+        "added_chunks": chunk_count,
+        "deleted_chunks": len(plan["delete_chunk_ids"]),
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3)
+    }
+
+    # 保存が完了してから、マニフェストの保存と公開中の世代の切り替えを行う
+    index_manager.save_build_stats(generation_path, stats)
+    index_manager.save_manifest(generation_path, manifest)
+    index_manager.publish_generation(generation_path)
+    logger.info({"message": "ベクターストアを更新しました。", **stats})
+
+    return db, lexical_index, generation_path
+
+
+def load_lexical_index(generation_path, db):
+    """
+    インデックス世代に保存されたキーワード検索用の転置インデックスを読み込み
+    保存されていない場合は、ベクターストアに登録済みのチャンクから作成
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        db: 同じ世代のベクターストア
+
+    Returns:
+        転置インデックス
+    """
+    lexical_index_path = os.path.join(generation_path, ct.LEXICAL_INDEX_FILE)
+    if os.path.isfile(lexical_index_path):
+        return li.LexicalIndex.load(lexical_index_path)
+
+    lexical_index = li.LexicalIndex()
+    ids, texts, metadatas = db.get_all()
+    lexical_index.add_documents([
+        Document(page_content=text, metadata={**metadata, "chunk_id": chunk_id})
+        for chunk_id, text, metadata in zip(ids, texts, metadatas)
+    ])
+    lexical_index.save(lexical_index_path)
+
+    return lexical_index
+
+
+def load_sources(file_paths, web_urls, file_hashes=None):
+    """
+    ファイルとWebページを順に読み込み
+
+    Args:
+        file_paths: 読み込み対象のファイルパスのリスト
+        web_urls: 読み込み対象のWebページのURLのリスト（キャッシュ済みの本文から読み込む）
+        file_hashes: ファイルパスごとの、計算済みのファイルの中身のハッシュ値
+
+    Yields:
+        データソースごとの読み込み結果
+    """
+    yield from load_files(file_paths, file_hashes)
+    for web_url in web_urls:
+        yield web_loader.load_web_page(web_url)
+
+
+def iter_source_chunks(results, text_splitter, manifest, progress=None):
+    """
+    データソースごとの読み込み結果を順にチャンク分割し、作成したチャンクIDをマニフェストに記録
+
+    Args:
+        results: データソースごとの読み込み結果
+        text_splitter: チャンク分割用のオブジェクト
+        manifest: 更新後のマニフェスト
+        progress: 作成の進捗を記録するオブジェクト
+
+    Yields:
+        チャンク
+    """
+    for result in results:
+        source = result["source"]
+        if progress:
+            progress.add_source()
+        # データソースの種類に応じて、マニフェストの記録先を切り替え
+        entries = manifest["files"] if source in manifest["files"] else manifest["web_urls"]
+
+        # 読み込みに失敗したデータソースは、次回の更新時に再度読み込むようマニフェストから除外
+        if result["error"]:
+            del entries[source]
+            continue
+
+        source_chunks = split_source_documents(source, result["docs"], text_splitter)
+        entries[source]["chunk_ids"] = [doc.metadata["chunk_id"] for doc in source_chunks]
+        yield from source_chunks
+
+
+def iter_batches(items, batch_size):
+    """
+    要素を一定件数ごとのリストにまとめる
+
+    Args:
+        items: 要素を順に返すイテレーター
+        batch_size: 1バッチあたりの件数
+
+    Yields:
+        要素のリスト
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def split_source_documents(source, docs, text_splitter):
+    """
+    1つのデータソースから読み込んだドキュメントをチャンク分割し、チャンクIDを割り当て
+
+    Args:
+        source: ファイルパスまたはURL
+        docs: データソースから読み込んだドキュメントのリスト
+        text_splitter: チャンク分割用のオブジェクト
+
+    Returns:
+        チャンクのリスト
+    """
+    # OSがWindowsの場合、Unicode正規化と、cp932（Windows用の文字コード）で表現できない文字を除去
+    for doc in docs:
+        doc.page_content = adjust_string(doc.page_content)
+        for key in doc.metadata:
+            doc.metadata[key] = adjust_string(doc.metadata[key])
+
     # チャンク分割を実施
-    splitted_docs = text_splitter.split_documents(docs_all)
+    splitted_docs = text_splitter.split_documents(docs)
 
-    # ベクターストアの作成
-    db = Chroma.from_documents(splitted_docs, embedding=embeddings)
+    # データソースごとに決まったIDを割り当て、次回の更新時に差し替えられるようにする
+    chunk_ids = index_manager.create_chunk_ids(source, len(splitted_docs))
+    for i, (doc, chunk_id) in enumerate(zip(splitted_docs, chunk_ids)):
+        doc.metadata["chunk_id"] = chunk_id
+        doc.metadata["chunk_index"] = i
 
-    # ベクターストアを検索するRetrieverの作成
-    st.session_state.retriever = db.as_retriever(search_kwargs={"k": ct.RETRIEVER_SEARCH_COUNT})
+    return splitted_docs
+
+
+def add_chunks(db, lexical_index, embeddings, splitted_docs):
+    """
+    チャンクを埋め込み、埋め込みベクトルと合わせてベクターストアに追加
+    あわせて、キーワード検索用の転置インデックスにも追加
+
+    Args:
+        db: ベクターストア
+        lexical_index: 転置インデックス
+        embeddings: 埋め込みモデル
+        splitted_docs: チャンクのリスト
+    """
+    if not splitted_docs:
+        return
+
+    # ベクターストアに任せず、埋め込みステージで明示的にまとめて埋め込む
+    vectors = embeddings.embed_documents([doc.page_content for doc in splitted_docs])
+
+    # 埋め込み済みのベクトルをそのまま登録
+    db.upsert(
+        ids=[doc.metadata["chunk_id"] for doc in splitted_docs],
+        vectors=vectors,
+        texts=[doc.page_content for doc in splitted_docs],
+        metadatas=[doc.metadata for doc in splitted_docs]
+    )
+    lexical_index.add_documents(splitted_docs)
 
 
 def initialize_session_state():
@@ -146,67 +540,201 @@ def initialize_session_state():
     if "messages" not in st.session_state:
         # 「表示用」の会話ログを順次格納するリストを用意
         st.session_state.messages = []
-        # 「LLMとのやりとり用」の会話ログを順次格納するリストを用意
-        st.session_state.chat_history = []
+        # 「LLMとのやりとり用」の会話ログを順次格納する会話履歴を用意（古い会話は要約にまとめる）
+        # 要約は別スレッドで行うため、要約用のChainは画面処理のスレッドで取得して渡す
+        summary_chain = utils.get_history_summary_chain()
+        st.session_state.chat_history = chat_history.ChatHistory(
+            lambda summary, messages: utils.summarize_chat_history(summary, messages, summary_chain)
+        )
+
+
+def load_files(file_paths, file_hashes=None):
+    """
+    複数ファイルの読み込み
+    設定に応じて、プロセスプールで並列に読み込む
+
+    Args:
+        file_paths: 読み込み対象のファイルパスのリスト
+        file_hashes: ファイルパスごとの、計算済みのファイルの中身のハッシュ値
+
+    Yields:
+        ファイルごとの読み込み結果（渡したファイルパスと同じ順序）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start_time = time.perf_counter()
+    error_count = 0
+
+    file_hashes = file_hashes or {}
+    tasks = [(path, file_hashes.get(path)) for path in file_paths]
+    # 1ファイルのみの場合（ファイルの変更の反映など）は、プロセスプールを起動せずにこのプロセスで読み込む
+    # （ページ数が多いPDFファイルは、ローダーがページを分割して並列に抽出する）
+    parallel = ct.FILE_LOAD_MODE == "process" and len(tasks) > 1
+    if parallel:
+        results = iter_parallel_results(
+            create_file_load_executor,
+            load_file_task,
+            tasks,
+            ct.FILE_LOAD_MAX_IN_FLIGHT,
+            lambda task, error: create_load_result(task[0], [], 0, f"{type(error).__name__}: {error}")
+        )
+    else:
+        results = (load_file_safely(path, file_hash) for path, file_hash in tasks)
+
+    file_count = 0
+    try:
+        for result in results:
+            file_count += 1
+            if result["error"]:
+                error_count += 1
+                logger.error({"message": "ファイルの読み込みに失敗しました。", "path": result["source"], "error": result["error"]})
+            else:
+                logger.info({"message": "ファイルを読み込みました。", "path": result["source"], "elapsed_seconds": result["elapsed_seconds"]})
+            yield result
+    finally:
+        # 途中で読み込みをやめた場合も、プロセスプールを終了させる
+        if parallel:
+            results.close()
+
+    logger.info({
+        "message": "ファイルの読み込みが完了しました。",
+        "mode": ct.FILE_LOAD_MODE if parallel else "serial",
+        "files": file_count,
+        "errors": error_count,
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3)
+    })
+
+
+def create_file_load_executor():
+    """
+    ファイルを並列に読み込むためのプロセスプールを作成
+
+    Returns:
+        プロセスプール
+    """
+    # Streamlitのスレッドを引き継がないよう、子プロセスはspawnで起動する
+    return ProcessPoolExecutor(
+        max_workers=ct.FILE_LOAD_MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
 
+def iter_parallel_results(create_executor, func, items, max_in_flight, on_broken):
+    """
+    同時に実行中のタスク数を上限までに抑えながら、プールで並列に処理
+    子プロセスの異常終了（メモリ不足による強制終了など）でプールが使えなくなった場合は、作り直して残りの要素の処理を続ける
 
-def load_data_sources():
+    Args:
+        create_executor: プロセスプールを作成する関数
+        func: 各要素に適用する関数
+        items: 処理対象の要素を順に返すイテレーター
+        max_in_flight: 同時に実行中・結果待ちにしておくタスク数の上限
+        on_broken: 子プロセスの異常終了で処理できなかった要素と例外から、その要素の処理結果を作成する関数
+
+    Yields:
+        各要素の処理結果（渡した要素と同じ順序）
     """
-    RAGの参照先となるデータソースの読み込み
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    iterator = iter(items)
+    executor = create_executor()
+    try:
+        # 先頭から上限件数分だけタスクを投入
+        futures = deque((item, executor.submit(func, item)) for item in islice(iterator, max_in_flight))
+        while futures:
+            item, future = futures.popleft()
+            try:
+                # 先頭のタスクの完了を待つことで、渡した順に結果を返す
+                result = future.result()
+            except BrokenProcessPool:
+                # 異常終了の原因が実行中だったどの要素かは分からないため、プールを作り直して1件ずつ処理し直す
+                suspects = [item] + [suspect for suspect, _ in futures]
+                logger.warning({"message": "子プロセスが異常終了したため、プロセスプールを作り直します。", "retry_items": len(suspects)})
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = create_executor()
+                for suspect in suspects:
+                    try:
+                        result = executor.submit(func, suspect).result()
+                    except BrokenProcessPool as e:
+                        # 1件のみでも異常終了する要素は処理できないものとし、以降の要素のためにプールを作り直す
+                        result = on_broken(suspect, e)
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = create_executor()
+                    yield result
+                futures = deque((item, executor.submit(func, item)) for item in islice(iterator, max_in_flight))
+                continue
+
+            # 結果を1件取り出すごとに、次のタスクを1件投入
+            for next_item in islice(iterator, 1):
+                futures.append((next_item, executor.submit(func, next_item)))
+            yield result
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def load_file_task(task):
+    """
+    プロセスプールの各プロセスで、1ファイルを読み込み
+
+    Args:
+        task: (ファイルパス, 計算済みのファイルの中身のハッシュ値)
 
     Returns:
-        読み込んだ通常データソース
+        読み込み結果の辞書（形式は「load_file_safely」を参照）
     """
-    # データソースを格納する用のリスト
-    docs_all = []
-    # ファイル読み込みの実行（渡した各リストにデータが格納される）
-    recursive_file_check(ct.RAG_TOP_FOLDER_PATH, docs_all)
+    return load_file_safely(*task)
 
-    web_docs_all = []
-    # ファイルとは別に、指定のWebページ内のデータも読み込み
-    # 読み込み対象のWebページ一覧に対して処理
-    for web_url in ct.WEB_URL_LOAD_TARGETS:
-        # 指定のWebページを読み込み
-        loader = WebBaseLoader(web_url)
-        web_docs = loader.load()
-        # for文の外のリストに読み込んだデータソースを追加
-        web_docs_all.extend(web_docs)
-    # 通常読み込みのデータソースにWebページのデータを追加
-    docs_all.extend(web_docs_all)
 
-    return docs_all
+def load_file_safely(path, file_hash=None):
+    """
+    1ファイルの読み込み
+    読み込みに失敗しても例外を送出せず、他のファイルの読み込みを継続できるようにする
 
+    Args:
+        path: ファイルパス
+        file_hash: 計算済みのファイルの中身のハッシュ値（Noneの場合は必要に応じてローダーが計算）
 
-def recursive_file_check(path, docs_all):
+    Returns:
+        読み込み結果の辞書
+        - 「source」: ファイルパス
+        - 「docs」: 読み込んだドキュメントのリスト
+        - 「elapsed_seconds」: 読み込みにかかった秒数
+        - 「error」: 失敗した場合のエラー内容（成功した場合はNone）
     """
-    RAGの参照先となるデータソースの読み込み
+    start_time = time.perf_counter()
+    docs = []
+    error = None
+    try:
+        file_load(path, docs, file_hash)
+    except Exception as e:
+        docs = []
+        error = f"{type(e).__name__}: {e}"
+
+    return create_load_result(path, docs, round(time.perf_counter() - start_time, 3), error)
+
+
+def create_load_result(path, docs, elapsed_seconds, error):
+    """
+    1ファイルの読み込み結果の辞書を作成
 
     Args:
-        path: 読み込み対象のファイル/フォルダのパス
-        docs_all: データソースを格納する用のリスト
+        path: ファイルパス
+        docs: 読み込んだドキュメントのリスト
+        elapsed_seconds: 読み込みにかかった秒数
+        error: 失敗した場合のエラー内容（成功した場合はNone）
+
+    Returns:
+        読み込み結果の辞書（形式は「load_file_safely」を参照）
     """
-    # パスがフォルダかどうかを確認
-    if os.path.isdir(path):
-        # フォルダの場合、フォルダ内のファイル/フォルダ名の一覧を取得
-        files = os.listdir(path)
-        # 各ファイル/フォルダに対して処理
-        for file in files:
-            # ファイル/フォルダ名だけでなく、フルパスを取得
-            full_path = os.path.join(path, file)
-            # フルパスを渡し、再帰的にファイル読み込みの関数を実行
-            recursive_file_check(full_path, docs_all)
-    else:
-        # パスがファイルの場合、ファイル読み込み
-        file_load(path, docs_all)
+    return {"source": path, "docs": docs, "elapsed_seconds": elapsed_seconds, "error": error}
 
 
-def file_load(path, docs_all):
+def file_load(path, docs_all, file_hash=None):
     """
     ファイル内のデータ読み込み
 
     Args:
         path: ファイルパス
         docs_all: データソースを格納する用のリスト
+        file_hash: 計算済みのファイルの中身のハッシュ値
     """
     # ファイルの拡張子を取得
     file_extension = os.path.splitext(path)[1]
@@ -220,7 +748,11 @@ def file_load(path, docs_all):
             docs = utils.load_employee_csv(path)
         else:
             # ファイルの拡張子に合ったdata loaderを使ってデータ読み込み
-            loader = ct.SUPPORTED_EXTENSIONS[file_extension](path)
+            # （PDFファイルのローダーは、抽出結果のキャッシュのキーに計算済みのハッシュ値を使う）
+            if file_extension == ".pdf":
+                loader = ct.SUPPORTED_EXTENSIONS[file_extension](path, file_hash)
+            else:
+                loader = ct.SUPPORTED_EXTENSIONS[file_extension](path)
             docs = loader.load()
         docs_all.extend(docs)
 
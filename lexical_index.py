@@ -0,0 +1,371 @@
+"""
+このファイルは、キーワード検索用の転置インデックス（BM25）と、ベクトル検索結果との統合処理のファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import math
+import pickle
+import re
+import unicodedata
+from collections import Counter
+from uuid import uuid4
+import constants as ct
+
+
+############################################################
+# 設定関連
+############################################################
+# 差分のファイル名の、本体のファイル名と連番の間に入れる文字列
+DELTA_FILE_INFIX = ".delta-"
+# 英数字の連続は1語として、それ以外の文字（日本語など）の連続は文字n-gramに分割して扱う
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[^\W_a-z0-9]+")
+# 社員IDや型番のように、英数字と記号のみからなり数字を含む入力（正規化後の文字列に対して判定）
+IDENTIFIER_PATTERN = re.compile(r"(?=[a-z0-9_\-./]*[0-9])[a-z0-9][a-z0-9_\-./]*")
+
+
+############################################################
+# クラス定義
+############################################################
+
+class LexicalIndex:
+    """
+    文字n-gramの転置インデックスを使い、BM25でチャンクをキーワード検索するクラス
+    チャンクのテキストとメタデータは保持せず（ベクターストアから必要な分だけ読み込む）、語ごとのチャンクIDと出現回数のみを保持する
+    """
+    def __init__(self):
+        # 語 → {チャンクID: 出現回数}
+        self.postings = {}
+        # チャンクID → 語数
+        self.doc_lengths = {}
+        # 全チャンクの語数の合計（平均語数の計算用）
+        self.total_length = 0
+        # 前回の保存以降の変更（("add", チャンクID, 語ごとの出現回数)、("delete", チャンクID, 語のリスト)）と、
+        # 差分として保存済みの変更の件数
+        self._changes = []
+        self._saved_change_count = 0
+
+    def add_documents(self, docs):
+        """
+        チャンクをインデックスに追加
+
+        Args:
+            docs: メタデータに「chunk_id」を持つチャンクのリスト
+        """
+        for doc in docs:
+            chunk_id = doc.metadata["chunk_id"]
+            # 登録済みのチャンクは、語が分からないため転置インデックス全体から取り除いてから追加し直す
+            # （通常はインデックス作成時に、古いチャンクを「delete」で先に削除しているため発生しない）
+            if chunk_id in self.doc_lengths:
+                self._remove_terms(chunk_id, [term for term, term_postings in self.postings.items() if chunk_id in term_postings])
+
+            self._add_terms(chunk_id, Counter(tokenize(normalize_text(doc.page_content))))
+
+    def delete(self, docs):
+        """
+        チャンクをインデックスから削除
+
+        Args:
+            docs: 削除するチャンク（テキストから、転置インデックスのどの語から取り除くかを判定する）
+        """
+        for doc in docs:
+            chunk_id = doc.metadata["chunk_id"]
+            if chunk_id in self.doc_lengths:
+                self._remove_terms(chunk_id, list(set(tokenize(normalize_text(doc.page_content)))))
+
+    def search(self, query, k, get_documents):
+        """
+        BM25でクエリと関連性が高いチャンクを検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+            get_documents: チャンクIDのリストを受け取り、チャンクのリストを返す関数
+
+        Returns:
+            (チャンク, BM25スコア)のリスト（スコアが高い順）
+        """
+        scores = self._score(set(tokenize(normalize_text(query))))
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+        docs = {doc.metadata["chunk_id"]: doc for doc in get_documents([chunk_id for chunk_id, _ in ranked])}
+
+        return [(docs[chunk_id], score) for chunk_id, score in ranked if chunk_id in docs]
+
+    def search_exact(self, query, k, get_documents):
+        """
+        クエリの文字列をそのまま含むチャンクのみを検索
+        社員IDや氏名、会社名などの短いキーワードを、埋め込みを使わずに引き当てるために使う
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+            get_documents: チャンクIDのリストを受け取り、チャンクのリストを返す関数
+
+        Returns:
+            (チャンク, BM25スコア)のリスト（スコアが高い順、該当なしの場合は空のリスト）
+        """
+        normalized_query = normalize_text(query).strip()
+        # 文章のような長いクエリは、完全一致ではなく意味の近さで検索すべきため対象外
+        if not normalized_query or len(normalized_query) > ct.LEXICAL_EXACT_MATCH_MAX_LENGTH:
+            return []
+
+        terms = set(tokenize(normalized_query))
+        if not terms:
+            return []
+
+        # すべての語を含むチャンクに候補を絞り、BM25スコアが高い順に、文字列として含むかをテキストを読み込んで確認
+        term_postings = sorted((self.postings.get(term, {}) for term in terms), key=len)
+        candidates = set(term_postings[0])
+        for postings in term_postings[1:]:
+            candidates &= postings.keys()
+        if not candidates:
+            return []
+
+        scores = self._score(terms, candidates)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for start in range(0, len(ranked), k):
+            block = ranked[start:start + k]
+            docs = {doc.metadata["chunk_id"]: doc for doc in get_documents([chunk_id for chunk_id, _ in block])}
+            for chunk_id, score in block:
+                if chunk_id in docs and normalized_query in normalize_text(docs[chunk_id].page_content):
+                    results.append((docs[chunk_id], score))
+            if len(results) >= k:
+                break
+
+        return results[:k]
+
+    def save(self, path):
+        """
+        インデックスをファイルに保存
+        前回の保存以降の変更のみを差分のファイルとして追加し、差分が多くなった場合は本体のファイルにまとめ直す
+
+        Args:
+            path: 本体の保存先のファイルパス（差分は「<本体のファイルパス>.delta-<連番>」に保存）
+        """
+        delta_paths = list_delta_paths(path)
+        change_count = self._saved_change_count + len(self._changes)
+
+        if not os.path.isfile(path) or change_count > ct.LEXICAL_COMPACTION_RATIO * max(len(self.doc_lengths), 1):
+            state = {key: value for key, value in self.__dict__.items() if not key.startswith("_")}
+            write_pickle_atomic(path, state)
+            # 本体に含めた差分のファイルを削除
+            # （前の世代から引き継いだファイルはハードリンクのため、前の世代のファイルには影響しない）
+            for delta_path in delta_paths:
+                os.remove(delta_path)
+            self._saved_change_count = 0
+        elif self._changes:
+            write_pickle_atomic(f"{path}{DELTA_FILE_INFIX}{len(delta_paths) + 1:06d}", self._changes)
+            self._saved_change_count = change_count
+
+        self._changes = []
+
+    @classmethod
+    def load(cls, path):
+        """
+        ファイルに保存したインデックスを読み込み、差分のファイルの変更を順に反映
+
+        Args:
+            path: 本体の保存先のファイルパス
+
+        Returns:
+            インデックス
+        """
+        index = cls()
+        with open(path, "rb") as f:
+            index.__dict__.update(pickle.load(f))
+
+        for delta_path in list_delta_paths(path):
+            with open(delta_path, "rb") as f:
+                changes = pickle.load(f)
+            for operation, chunk_id, terms in changes:
+                if operation == "add":
+                    index._add_terms(chunk_id, terms)
+                else:
+                    index._remove_terms(chunk_id, terms)
+            index._saved_change_count += len(changes)
+        index._changes = []
+
+        return index
+
+    def _add_terms(self, chunk_id, term_counts):
+        """
+        チャンクの語を転置インデックスに追加
+
+        Args:
+            chunk_id: チャンクID
+            term_counts: 語ごとの出現回数
+        """
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+
+        length = sum(term_counts.values())
+        self.doc_lengths[chunk_id] = length
+        self.total_length += length
+        self._changes.append(("add", chunk_id, dict(term_counts)))
+
+    def _remove_terms(self, chunk_id, terms):
+        """
+        チャンクの語を転置インデックスから取り除く
+
+        Args:
+            chunk_id: チャンクID
+            terms: チャンクに含まれる語のリスト
+        """
+        for term in terms:
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                continue
+            term_postings.pop(chunk_id, None)
+            if not term_postings:
+                del self.postings[term]
+
+        self.total_length -= self.doc_lengths.pop(chunk_id)
+        self._changes.append(("delete", chunk_id, terms))
+
+    def _score(self, terms, candidates=None):
+        """
+        BM25スコアを計算
+
+        Args:
+            terms: クエリの語の集合
+            candidates: スコアを計算するチャンクIDの集合（Noneの場合は語を含むすべてのチャンク）
+
+        Returns:
+            チャンクIDをキー、BM25スコアを値とする辞書
+        """
+        doc_count = len(self.doc_lengths)
+        if doc_count == 0:
+            return {}
+        average_length = self.total_length / doc_count
+
+        scores = {}
+        for term in terms:
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (doc_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for chunk_id, count in term_postings.items():
+                if candidates is not None and chunk_id not in candidates:
+                    continue
+                length_norm = ct.BM25_K1 * (1 - ct.BM25_B + ct.BM25_B * self.doc_lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (ct.BM25_K1 + 1) / (count + length_norm)
+
+        return scores
+
+
+############################################################
+# 関数定義
+############################################################
+
+def normalize_text(text):
+    """
+    検索用にテキストを正規化（全角・半角の統一、小文字化）
+
+    Args:
+        text: テキスト
+
+    Returns:
+        正規化したテキスト
+    """
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def is_identifier_query(query):
+    """
+    入力が社員IDや型番のような識別子かを判定
+    識別子をそのまま含むチャンクは、意味の近さ（ベクトル検索の関連度スコア）によらず検索結果として扱える
+
+    Args:
+        query: 検索クエリ
+
+    Returns:
+        識別子であればTrue
+    """
+    return IDENTIFIER_PATTERN.fullmatch(normalize_text(query).strip()) is not None
+
+
+def tokenize(normalized_text):
+    """
+    正規化したテキストを検索用の語に分割
+
+    Args:
+        normalized_text: 正規化したテキスト
+
+    Returns:
+        語のリスト（英数字は連続した1語、日本語などは文字bi-gram）
+    """
+    terms = []
+    for run in TOKEN_PATTERN.findall(normalized_text):
+        if run.isascii() or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    return terms
+
+
+def list_delta_paths(path):
+    """
+    本体のファイルに対応する差分のファイルを、保存した順に取得
+
+    Args:
+        path: 本体の保存先のファイルパス
+
+    Returns:
+        差分のファイルパスのリスト
+    """
+    dir_path = os.path.dirname(path) or "."
+    prefix = f"{os.path.basename(path)}{DELTA_FILE_INFIX}"
+    if not os.path.isdir(dir_path):
+        return []
+
+    return [
+        os.path.join(dir_path, file_name)
+        for file_name in sorted(os.listdir(dir_path))
+        if file_name.startswith(prefix) and file_name[len(prefix):].isdigit()
+    ]
+
+
+def write_pickle_atomic(path, data):
+    """
+    書き込み途中のファイルが読まれないよう、一時ファイルに書き込んでから置き換える
+
+    Args:
+        path: 書き込み先のファイルパス
+        data: 書き込むデータ
+    """
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def reciprocal_rank_fusion(result_lists, k, weights=None):
+    """
+    複数の検索結果を、順位の逆数の和（Reciprocal Rank Fusion）で1つの順位に統合
+
+    Args:
+        result_lists: 検索結果（チャンクのリスト）のリスト
+        k: 統合後に取得するチャンク数
+        weights: 検索結果ごとの重み（Noneの場合はすべて1）
+
+    Returns:
+        チャンクのリスト（統合後の順位順）
+    """
+    weights = weights or [1.0] * len(result_lists)
+    scores = {}
+    documents = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, 1):
+            # 同じチャンクは、チャンクIDで同一と判定する
+            key = doc.metadata.get("chunk_id", doc.page_content)
+            scores[key] = scores.get(key, 0.0) + weight / (ct.HYBRID_RRF_K + rank)
+            documents.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+
+    return [documents[key] for key in ranked]
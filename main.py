@@ -19,6 +19,8 @@ from initialize import initialize
 import components as cn
 # （自作）変数（定数）がまとめて定義・管理されているモジュール
 import constants as ct
+# （自作）全セッションで共有するRAGのインデックスを管理するモジュール
+import index_manager
 
 
 ############################################################
@@ -68,6 +70,9 @@ cn.display_app_title()
 # モード表示
 cn.display_select_mode()
 
+# インデックスの作成状況の表示（作成中は進捗を、失敗した場合はエラーを表示）
+cn.display_index_status()
+
 # AIメッセージの初期表示
 cn.display_initial_ai_message()
 
@@ -90,7 +95,9 @@ except Exception as e:
 ############################################################
 # 6. チャット入力の受け付け
 ############################################################
-chat_message = st.chat_input(ct.CHAT_INPUT_HELPER_TEXT)
+# 検索に使えるインデックスがまだない場合（初回の作成中など）は、送信を受け付けない
+index_ready = index_manager.get_shared_index().is_ready()
+chat_message = st.chat_input(ct.CHAT_INPUT_HELPER_TEXT if index_ready else ct.INDEX_BUILDING_MESSAGE, disabled=not index_ready)
 
 
 ############################################################
@@ -110,13 +117,15 @@ if chat_message:
     # ==========================================
     # 7-2. LLMからの回答取得
     # ==========================================
-    # 「st.spinner」でグルグル回っている間、表示の不具合が発生しないよう空のエリアを表示
-    res_box = st.empty()
+    # 回答を表示するエリアを先に用意（「社内問い合わせ」モードでは、生成途中の回答をこのエリアに逐次表示）
+    assistant_message = st.chat_message("assistant")
+    with assistant_message:
+        res_box = st.empty()
     # LLMによる回答生成（回答生成が完了するまでグルグル回す）
     with st.spinner(ct.SPINNER_TEXT):
         try:
-            # 画面読み込み時に作成したRetrieverを使い、Chainを実行
-            llm_response = utils.get_llm_response(chat_message)
+            # 画面読み込み時に作成したインデックスを使い、共有のイベントループ上で非同期にChainを実行
+            llm_response = utils.get_llm_response(chat_message, res_box)
         except Exception as e:
             # エラーログの出力
             logger.error(f"{ct.GET_LLM_RESPONSE_ERROR_MESSAGE}\n{e}")
@@ -128,7 +137,7 @@ if chat_message:
     # ==========================================
     # 7-3. LLMからの回答表示
     # ==========================================
-    with st.chat_message("assistant"):
+    with assistant_message:
         try:
             # ==========================================
             # モードが「社内文書検索」の場合
@@ -142,7 +151,7 @@ if chat_message:
             # ==========================================
             elif st.session_state.mode == ct.ANSWER_MODE_2:
                 # 入力に対しての回答と、参照した文書のありかを表示
-                content = cn.display_contact_llm_response(llm_response)
+                content = cn.display_contact_llm_response(llm_response, res_box)
             
             # AIメッセージのログ出力
             logger.info({"message": content, "application_mode": st.session_state.mode})
@@ -0,0 +1,168 @@
+"""
+このファイルは、PDFファイルのテキストをページ単位で並列に抽出し、抽出結果をキャッシュするローダーのファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from uuid import uuid4
+import fitz
+# 並列抽出用のプロセスの起動を軽くするため、読み込みに時間がかかる「langchain」ではなく「langchain_core」から読み込む
+from langchain_core.documents import Document
+
+
+############################################################
+# クラス定義
+############################################################
+
+class PdfLoader:
+    """
+    PyMuPDFLoaderと同じ形式（1ページ1ドキュメント、同じメタデータ）でPDFファイルを読み込むローダー
+    - 抽出したページのテキストを、ファイルの中身のハッシュ値をキーにキャッシュし、同じ中身のファイルは再び解析しない
+    - ページ数が多いファイルは、ページを分割して複数プロセスで並列に抽出する
+    """
+    def __init__(self, file_path, cache_dir=None, max_workers=None, parallel_min_pages=64, file_hash=None):
+        """
+        Args:
+            file_path: PDFファイルのパス
+            cache_dir: 抽出結果のキャッシュの保存先フォルダのパス（Noneの場合はキャッシュしない）
+            max_workers: 並列に抽出する際のプロセス数の上限（Noneの場合、またはCPUコア数より多い場合はCPUコア数）
+            parallel_min_pages: 並列に抽出する最小のページ数（これより少ない場合は1プロセスで抽出）
+            file_hash: マニフェスト作成時に計算済みのファイルの中身のハッシュ値（Noneの場合は読み込み時に計算）
+        """
+        self.file_path = str(file_path)
+        self.cache_dir = cache_dir
+        cpu_count = os.cpu_count() or 1
+        self.max_workers = min(max_workers or cpu_count, cpu_count)
+        self.parallel_min_pages = parallel_min_pages
+        self.file_hash = file_hash
+
+    def load(self):
+        """
+        PDFファイルを読み込み
+
+        Returns:
+            ページごとのドキュメントのリスト
+        """
+        # マニフェストと同じハッシュ値を使い、計算済みであればファイルを読み直さない
+        file_hash = self.file_hash
+        if file_hash is None:
+            # 並列抽出用のプロセスの起動を軽くするため、使う時点で読み込む
+            from index_manager import compute_file_hash
+            file_hash = compute_file_hash(self.file_path)
+        extracted = self._load_cache(file_hash)
+        if extracted is None:
+            extracted = extract_pdf(self.file_path, self.max_workers, self.parallel_min_pages)
+            self._save_cache(file_hash, extracted)
+
+        # ファイルパスはキャッシュに含めず、読み込み時のパスを使う（同じ中身のファイルが複数あっても正しく表示するため）
+        total_pages = len(extracted["pages"])
+        return [
+            Document(
+                page_content=text,
+                metadata={
+                    "source": self.file_path,
+                    "file_path": self.file_path,
+                    "page": page_number,
+                    "total_pages": total_pages,
+                    **extracted["metadata"]
+                }
+            )
+            for page_number, text in enumerate(extracted["pages"])
+        ]
+
+    def _load_cache(self, file_hash):
+        """
+        抽出結果をキャッシュから取得
+
+        Args:
+            file_hash: ファイルの中身のハッシュ値
+
+        Returns:
+            抽出結果（キャッシュがない場合はNone）
+        """
+        if not self.cache_dir:
+            return None
+
+        cache_path = os.path.join(self.cache_dir, f"{file_hash}.json")
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cache(self, file_hash, extracted):
+        """
+        抽出結果をキャッシュに保存
+
+        Args:
+            file_hash: ファイルの中身のハッシュ値
+            extracted: 抽出結果
+        """
+        if not self.cache_dir:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_path = os.path.join(self.cache_dir, f"{file_hash}.json")
+        # 複数プロセスから同時に書き込まれても壊れないよう、一時ファイルに書き込んでから置き換える
+        tmp_file_path = f"{cache_path}.{uuid4().hex}.tmp"
+        with open(tmp_file_path, "w", encoding="utf-8") as f:
+            json.dump(extracted, f, ensure_ascii=False)
+        os.replace(tmp_file_path, cache_path)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def extract_pdf(path, max_workers, parallel_min_pages):
+    """
+    PDFファイルから、ページごとのテキストと文書のメタデータを抽出
+
+    Args:
+        path: PDFファイルのパス
+        max_workers: 並列に抽出する際のプロセス数の上限
+        parallel_min_pages: 並列に抽出する最小のページ数
+
+    Returns:
+        {"metadata": 文書のメタデータ, "pages": ページごとのテキストのリスト}
+    """
+    with fitz.open(path) as doc:
+        page_count = len(doc)
+        # PyMuPDFLoaderと同じく、文字列・整数の項目のみをメタデータに含める
+        metadata = {key: value for key, value in doc.metadata.items() if type(value) in [str, int]}
+
+        # ファイル単位の並列読み込みのプロセス内では、すでにCPUコアを使い切っているため、プールを入れ子にせず1プロセスで抽出する
+        in_pool_worker = multiprocessing.parent_process() is not None
+        if page_count < parallel_min_pages or max_workers <= 1 or in_pool_worker:
+            return {"metadata": metadata, "pages": [page.get_text() for page in doc]}
+
+    # PyMuPDFはスレッド間で並列に動かないため、ページを分割して各プロセスでファイルを開き直して抽出する
+    worker_count = min(max_workers, page_count)
+    bounds = [page_count * i // worker_count for i in range(worker_count + 1)]
+    with ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context("spawn")) as executor:
+        parts = executor.map(extract_page_range, [path] * worker_count, bounds[:-1], bounds[1:])
+        pages = [text for part in parts for text in part]
+
+    return {"metadata": metadata, "pages": pages}
+
+
+def extract_page_range(path, start, end):
+    """
+    PDFファイルの指定範囲のページからテキストを抽出（プロセスプールの各プロセスで実行）
+
+    Args:
+        path: PDFファイルのパス
+        start: 抽出する最初のページ番号
+        end: 抽出する最後のページ番号の次の番号
+
+    Returns:
+        ページごとのテキストのリスト
+    """
+    with fitz.open(path) as doc:
+        return [doc[page_number].get_text() for page_number in range(start, end)]
+
@@ -0,0 +1,43 @@
+"""
+このファイルは、テスト共通の設定（リポジトリ直下のモジュールの読み込みと、外部サービスの代わりに使うフェイク）のファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import sys
+import pytest
+import tiktoken
+
+# テスト対象のモジュールはリポジトリ直下に置かれているため、読み込み先に追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+############################################################
+# フェイク
+############################################################
+
+class FakeEncoding:
+    """
+    1文字を1トークンとして数えるエンコーディング（トークナイザーのデータをダウンロードせずにテストするため）
+    """
+    def encode(self, text, **kwargs):
+        return [ord(char) for char in text]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture(autouse=True)
+def fake_encoding(monkeypatch):
+    """
+    トークン数の計算に、フェイクのエンコーディングを使う
+    """
+    import context_packer
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: FakeEncoding())
+    monkeypatch.setattr(context_packer, "_encoding", None)
@@ -0,0 +1,116 @@
+"""
+このファイルは、検索結果と回答を再利用するキャッシュ（answer_cache.py）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import answer_cache
+import employee_directory
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture(scope="module")
+def entity_terms():
+    """
+    リポジトリ同梱の社員名簿から作成した、部署名・氏名の表記の辞書
+    """
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "社員について", "社員名簿.csv")
+    df = pd.read_csv(path, encoding="utf-8", dtype=str).fillna("")
+    return employee_directory.EmployeeDirectory(df, path).entity_terms
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_vector_pair(similarity, size=8):
+    """
+    コサイン類似度が指定の値になる、2つのベクトルを作成
+    """
+    base = np.zeros(size, dtype=np.float32)
+    base[0] = 1.0
+    other = np.zeros(size, dtype=np.float32)
+    other[0] = similarity
+    other[1] = np.sqrt(1 - similarity ** 2)
+    return base, other
+
+
+############################################################
+# テスト
+############################################################
+
+@pytest.mark.parametrize("question_a, question_b", [
+    ("経費精算の締め日はいつですか？", "経費精算の締切日を教えて"),
+    ("営業部の定例会議はいつ？", "営業の定例会議の日程を教えて"),
+    ("山下涼平さんの保有資格は？", "山下 涼平さんが持っている資格を教えて"),
+    ("EcoTee Creatorの使い方", "ecotee creatorの利用方法を教えて"),
+])
+def test_paraphrases_share_key_terms(entity_terms, question_a, question_b):
+    assert answer_cache.extract_key_terms(question_a, entity_terms) == answer_cache.extract_key_terms(question_b, entity_terms)
+
+
+@pytest.mark.parametrize("question_a, question_b", [
+    ("営業部の定例会議はいつ？", "経理部の定例会議はいつ？"),
+    ("IT部の人数は？", "人事部の人数は？"),
+    ("山下涼平さんの保有資格は？", "山口英樹さんの保有資格は？"),
+    ("グローバルフュージョン株式会社との商談内容は？", "クリスタルワークス株式会社との商談内容は？"),
+    ("2023年度の売上目標は？", "2024年度の売上目標は？"),
+    ("EMP0001の入社日は？", "EMP0002の入社日は？"),
+])
+def test_near_misses_differ_in_key_terms(entity_terms, question_a, question_b):
+    assert answer_cache.extract_key_terms(question_a, entity_terms) != answer_cache.extract_key_terms(question_b, entity_terms)
+
+
+def test_department_is_not_matched_twice(entity_terms):
+    # 「IT部」を部署名として照合した後に、「it」を英字の語として重ねて拾わない
+    assert answer_cache.extract_key_terms("IT部の人数は？", entity_terms) == {"IT部"}
+
+
+def test_semantic_cache_requires_same_key_terms():
+    cache = answer_cache.SemanticAnswerCache(similarity_threshold=0.97)
+    stored, query = create_vector_pair(0.99)
+    cache.put("mode", stored, 1, {"answer": "営業部"}, frozenset({"営業部"}))
+
+    # 類似度が閾値以上でも、対象の部署が異なる質問には再利用しない
+    assert cache.get("mode", query, 1, frozenset({"経理部"})) is None
+    assert cache.get_stats()["rejections"] == 1
+
+    value, similarity = cache.get("mode", query, 1, frozenset({"営業部"}))
+    assert value == {"answer": "営業部"}
+    assert similarity == pytest.approx(0.99, abs=1e-4)
+
+
+def test_semantic_cache_ignores_similarity_below_threshold():
+    cache = answer_cache.SemanticAnswerCache()
+    stored, query = create_vector_pair(answer_cache.ct.SEMANTIC_CACHE_SIMILARITY_THRESHOLD - 0.02)
+    cache.put("mode", stored, 1, {"answer": "a"})
+
+    assert cache.get("mode", query, 1) is None
+    assert cache.get("mode", stored, 1) == ({"answer": "a"}, pytest.approx(1.0))
+
+
+def test_semantic_cache_is_cleared_for_newer_index_version():
+    cache = answer_cache.SemanticAnswerCache()
+    stored, _ = create_vector_pair(1.0)
+    cache.put("mode", stored, 1, {"answer": "a"})
+
+    assert cache.get("mode", stored, 2) is None
+    # 作り直し前の世代で作成した結果は保存しない
+    cache.put("mode", stored, 1, {"answer": "a"})
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_query_result_cache_normalizes_question():
+    cache = answer_cache.QueryResultCache()
+    cache.put(answer_cache.create_cache_key("mode", "経費精算の締め日は？", 1), {"answer": "a"})
+
+    assert cache.get(answer_cache.create_cache_key("mode", "経費精算の締め日は", 1)) == {"answer": "a"}
+    assert cache.get(answer_cache.create_cache_key("mode", "経費精算の締め日は", 2)) is None
@@ -0,0 +1,84 @@
+"""
+このファイルは、埋め込みベクトルをSQLiteに保存して再利用するキャッシュ（embedding_cache.CachedEmbeddings）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import sqlite3
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import embedding_cache
+
+
+############################################################
+# フェイク
+############################################################
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """
+    埋め込みモデルに渡されたテキストを記録するフェイク
+    """
+    embedded: list = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_cache(tmp_path, model_name="model-a", max_entries=100):
+    embeddings = CountingEmbedding(size=8, embedded=[])
+    cache = embedding_cache.CachedEmbeddings(embeddings, model_name, str(tmp_path / "embeddings.sqlite3"), max_entries)
+    return cache, embeddings
+
+
+def count_rows(tmp_path, model_name):
+    with sqlite3.connect(str(tmp_path / "embeddings.sqlite3")) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model_name,)).fetchone()[0]
+
+
+############################################################
+# テスト
+############################################################
+
+def test_cached_and_duplicate_texts_are_not_embedded_again(tmp_path):
+    cache, embeddings = create_cache(tmp_path)
+    first = cache.embed_documents(["就業規則", "経費精算", "就業規則"])
+
+    # 空白・全角半角の違いだけのテキストも同じものとして扱う
+    second = cache.embed_documents(["経費精算", "就業規則 "])
+
+    assert embeddings.embedded == ["就業規則", "経費精算"]
+    # キャッシュからはfloat32で保存したベクトルが返る
+    assert np.allclose(second, [first[1], first[0]], atol=1e-6)
+    assert cache.get_stats() == {"hits": 2, "misses": 2, "deduplicated": 1, "entries": 2}
+
+
+def test_eviction_is_limited_to_the_current_model(tmp_path):
+    other, _ = create_cache(tmp_path, "model-b")
+    other.embed_documents([f"別モデル{i}" for i in range(5)])
+
+    cache, _ = create_cache(tmp_path, max_entries=20)
+    cache.embed_documents([f"文書{i}" for i in range(15)])
+    cache.embed_documents([f"追加{i}" for i in range(10)])
+
+    # 上限を超えた時点で、上限より一定割合少なくなるまで古いものから削除され、他のモデルのベクトルは残る
+    assert count_rows(tmp_path, "model-a") == cache.get_stats()["entries"] == 19
+    assert count_rows(tmp_path, "model-b") == 5
+    assert embedding_cache.create_text_hash("追加9") in cache._get_vectors([embedding_cache.create_text_hash("追加9")])
+
+
+def test_put_does_not_count_rows_every_time(tmp_path):
+    cache, _ = create_cache(tmp_path)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    for i in range(5):
+        cache.embed_documents([f"文書{i}"])
+
+    assert not [statement for statement in statements if "COUNT(*)" in statement]
+    assert cache.get_stats()["entries"] == 5
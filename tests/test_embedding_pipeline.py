@@ -0,0 +1,120 @@
+"""
+このファイルは、チャンクのバッチ化と、レート制限（429）を受けた場合の再試行（embedding_pipeline.BatchedEmbeddings）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+import httpx
+import openai
+import pytest
+from langchain_core.embeddings import Embeddings
+import embedding_pipeline
+
+
+############################################################
+# フェイク
+############################################################
+
+class FakeEmbeddingAPI(Embeddings):
+    """
+    テキストの長さをベクトルとして返し、指定の回数だけレート制限のエラーを返す埋め込みAPIの代わり
+    """
+    def __init__(self, rate_limited_calls=0, retry_after="0.5"):
+        self.rate_limited_calls = rate_limited_calls
+        self.retry_after = retry_after
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+            if self.rate_limited_calls > 0:
+                self.rate_limited_calls -= 1
+                raise create_rate_limit_error(self.retry_after)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    待機した秒数を記録し、実際には待機しない
+    """
+    recorded = []
+    monkeypatch.setattr(embedding_pipeline.time, "sleep", recorded.append)
+    return recorded
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_rate_limit_error(retry_after):
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+############################################################
+# テスト
+############################################################
+
+def test_texts_are_batched_by_tokens_and_size():
+    api = FakeEmbeddingAPI()
+    # テスト共通のフェイクのエンコーディングでは、1文字が1トークン
+    embeddings = embedding_pipeline.BatchedEmbeddings(api, max_batch_tokens=10, max_batch_size=3, max_concurrency=1)
+    texts = ["aaaa", "bbbb", "cc", "d", "e", "f", "gggggggggggg"]
+
+    vectors = embeddings.embed_documents(texts)
+
+    # 上限を超えるテキストは、1件のみのバッチとして送る
+    assert api.batches == [["aaaa", "bbbb", "cc"], ["d", "e", "f"], ["gggggggggggg"]]
+    assert vectors == [[float(len(text))] for text in texts]
+
+
+def test_parallel_batches_keep_input_order():
+    api = FakeEmbeddingAPI()
+    embeddings = embedding_pipeline.BatchedEmbeddings(api, max_batch_tokens=100, max_batch_size=2, max_concurrency=4)
+    texts = ["x" * i for i in range(1, 20)]
+
+    assert embeddings.embed_documents(texts) == [[float(i)] for i in range(1, 20)]
+
+
+def test_rate_limit_waits_for_retry_after_and_retries(sleeps):
+    api = FakeEmbeddingAPI(rate_limited_calls=2, retry_after="0.5")
+    embeddings = embedding_pipeline.BatchedEmbeddings(api, max_concurrency=1, max_retries=3)
+
+    assert embeddings.embed_documents(["経費精算"]) == [[4.0]]
+    assert len(api.batches) == 3
+    # サーバーが指定した秒数（Retry-After）だけ、全バッチの送信を止めてから再試行する
+    assert len(sleeps) == 2
+    assert all(0 < seconds <= 0.5 for seconds in sleeps)
+
+
+def test_rate_limit_without_retry_after_uses_exponential_backoff(sleeps, monkeypatch):
+    monkeypatch.setattr(embedding_pipeline.ct, "EMBEDDING_RETRY_BASE_SECONDS", 1.0)
+    monkeypatch.setattr(embedding_pipeline.random, "uniform", lambda low, high: 0.0)
+    api = FakeEmbeddingAPI(rate_limited_calls=3, retry_after=None)
+    embeddings = embedding_pipeline.BatchedEmbeddings(api, max_concurrency=1, max_retries=3)
+
+    embeddings.embed_documents(["経費精算"])
+
+    # 待機時間は1秒・2秒・4秒と倍になる（計測のずれを許容する）
+    assert [round(seconds) for seconds in sleeps] == [1, 2, 4]
+
+
+def test_rate_limit_error_is_raised_after_max_retries(sleeps):
+    api = FakeEmbeddingAPI(rate_limited_calls=10, retry_after="0.1")
+    embeddings = embedding_pipeline.BatchedEmbeddings(api, max_concurrency=1, max_retries=2)
+
+    with pytest.raises(openai.RateLimitError):
+        embeddings.embed_documents(["経費精算"])
+    assert len(api.batches) == 3
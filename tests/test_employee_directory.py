@@ -0,0 +1,76 @@
+"""
+このファイルは、従業員インデックス（employee_directory.py）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import pandas as pd
+import pytest
+import employee_directory
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture(scope="module")
+def directory():
+    """
+    リポジトリ同梱の社員名簿から作成した従業員インデックス
+    """
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "社員について", "社員名簿.csv")
+    df = pd.read_csv(path, encoding="utf-8", dtype=str).fillna("")
+    return employee_directory.EmployeeDirectory(df, path)
+
+
+############################################################
+# テスト
+############################################################
+
+@pytest.mark.parametrize("question", [
+    "新入社員研修の資料の一覧を教えて",
+    "社員旅行の一覧",
+    "会議に参加したメンバーは誰？",
+    "営業部の会議で決まった施策の担当は誰？",
+    "会議の一覧",
+])
+def test_document_questions_fall_through_to_retrieval(directory, question):
+    assert directory.answer(question) is None
+
+
+@pytest.mark.parametrize("question, count", [
+    ("人事部に所属している従業員情報を一覧化して", 9),
+    ("営業部の社員一覧", 12),
+    ("営業部に所属している社員", 12),
+    ("人事部の社員は誰？", 9),
+    ("社員は何人？", 50),
+    ("全従業員の一覧", 50),
+])
+def test_roster_questions_are_answered_from_directory(directory, question, count):
+    answer = directory.answer(question)
+    assert answer is not None
+    assert f"以下の{count}名です。" in answer
+
+
+def test_same_column_terms_are_combined_with_or(directory):
+    # 「インターン」は役職・従業員区分の両方にあるが、「正社員」と並ぶ場合は従業員区分として扱う
+    filters = directory.parse_filters("正社員とインターンの一覧")
+    assert [[column for column, _ in conditions] for conditions in filters] == [["従業員区分"], ["従業員区分"]]
+
+    rows = directory.search(filters)
+    assert set(directory.columns["従業員区分"][rows]) == {"正社員", "インターン"}
+
+
+def test_different_column_terms_are_combined_with_and(directory):
+    rows = directory.search(directory.parse_filters("営業部のマネージャーの一覧"))
+    assert len(rows) > 0
+    assert set(directory.columns["部署"][rows]) == {"営業部"}
+    assert set(directory.columns["役職"][rows]) == {"マネージャー"}
+
+
+def test_longest_term_wins(directory):
+    # 「プロジェクトマネージャ」（資格）に含まれる「マネージャ」を、役職として拾わない
+    filters = directory.parse_filters("プロジェクトマネージャの資格を持つ社員の一覧")
+    assert [[column for column, _ in conditions] for conditions in filters] == [["保有資格"]]
@@ -0,0 +1,32 @@
+"""
+このファイルは、参照先フォルダの変更のうちインデックスに影響するものの判定（file_watcher.is_watch_target）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import watchfiles
+import file_watcher
+
+
+############################################################
+# テスト
+############################################################
+
+def test_supported_files_are_watched(tmp_path):
+    assert file_watcher.is_watch_target(watchfiles.Change.modified, str(tmp_path / "規程.pdf"))
+    assert not file_watcher.is_watch_target(watchfiles.Change.modified, str(tmp_path / "画像.png"))
+
+
+def test_temporary_and_hidden_files_are_ignored(tmp_path):
+    assert not file_watcher.is_watch_target(watchfiles.Change.added, str(tmp_path / "~$規程.docx"))
+    assert not file_watcher.is_watch_target(watchfiles.Change.added, str(tmp_path / ".規程.txt"))
+
+
+def test_directory_moves_are_watched(tmp_path):
+    (tmp_path / "社内規程").mkdir()
+
+    # 移動先はフォルダとして存在し、移動元は削除として通知される
+    assert file_watcher.is_watch_target(watchfiles.Change.added, str(tmp_path / "社内規程"))
+    assert file_watcher.is_watch_target(watchfiles.Change.deleted, str(tmp_path / "規程"))
+    assert not file_watcher.is_watch_target(watchfiles.Change.added, str(tmp_path / "存在しない"))
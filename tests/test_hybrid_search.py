@@ -0,0 +1,145 @@
+"""
+このファイルは、キーワード検索・完全一致検索・ベクトル検索の統合（index_manager.SharedIndex.hybrid_search）と、
+統合した検索結果を関連度スコアで絞り込む「社内文書検索」モード（utils.get_doc_search_response）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+from types import SimpleNamespace
+from langchain.schema import Document
+import pytest
+import answer_cache
+import index_manager
+import lexical_index as li
+import utils
+
+
+############################################################
+# フェイク
+############################################################
+
+class FakeVectorStore:
+    """
+    あらかじめ決めた順位でチャンクを返すベクターストア
+    """
+    def __init__(self, docs, scores=None):
+        self.docs = docs
+        # ベクトル検索の関連度スコア（順位の高い順）
+        self.scores = scores or [1.0 - 0.1 * rank for rank in range(len(docs))]
+
+    def similarity_search(self, query, k):
+        return self.docs[:k]
+
+    def similarity_search_with_relevance_scores(self, query, k):
+        return list(zip(self.docs, self.scores))[:k]
+
+    def get_documents(self, ids):
+        by_id = {doc.metadata["chunk_id"]: doc for doc in self.docs}
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_doc(chunk_id, text):
+    return Document(page_content=text, metadata={"chunk_id": chunk_id, "source": f"{chunk_id}.txt"})
+
+
+def create_shared_index(docs, vector_order, scores=None):
+    lexical_index = li.LexicalIndex()
+    lexical_index.add_documents(docs)
+    by_id = {doc.metadata["chunk_id"]: doc for doc in docs}
+
+    shared_index = index_manager.SharedIndex()
+    shared_index.swap(FakeVectorStore([by_id[chunk_id] for chunk_id in vector_order], scores), lexical_index)
+    return shared_index
+
+
+def search_documents(monkeypatch, shared_index, chat_message):
+    """
+    「社内文書検索」モードで検索し、検索結果のチャンクIDを取得
+    """
+    chat_history = SimpleNamespace(get_messages=lambda: [], add_turn=lambda question, answer: None)
+    monkeypatch.setattr(utils, "st", SimpleNamespace(session_state=SimpleNamespace(chat_history=chat_history)))
+    monkeypatch.setattr(index_manager, "get_shared_index", lambda: shared_index)
+    monkeypatch.setattr(answer_cache, "get_query_result_cache", answer_cache.QueryResultCache)
+
+    response = utils.get_doc_search_response(chat_message)
+    return [doc.metadata["chunk_id"] for doc in response["context"]]
+
+
+############################################################
+# テスト
+############################################################
+
+def test_short_query_keeps_semantic_results_when_a_substring_matches():
+    # 「会議」をそのまま含むのは議事録の一部だけで、意味の近い規程はベクトル検索でのみ上位に来る
+    docs = [
+        create_doc("minutes", "第3回営業会議の議事録。出席者は営業部の5名。"),
+        create_doc("policy", "社内ミーティングの開催手順と、参加者への事前共有ルールを定める。"),
+        create_doc("trip", "社員旅行の行き先と日程のお知らせ。"),
+    ]
+    shared_index = create_shared_index(docs, ["policy", "minutes", "trip"])
+
+    results = [doc.metadata["chunk_id"] for doc in shared_index.hybrid_search("会議", 2)]
+
+    assert "policy" in results
+
+
+def test_exact_match_is_boosted_to_the_top():
+    docs = [
+        create_doc("other", "従業員の評価制度についての説明。"),
+        create_doc("target", "社員ID EMP-0042 の保有資格は基本情報技術者。"),
+    ]
+    shared_index = create_shared_index(docs, ["other", "target"])
+
+    results = shared_index.hybrid_search("EMP-0042", 2)
+
+    assert results[0].metadata["chunk_id"] == "target"
+
+
+def test_reciprocal_rank_fusion_applies_weights():
+    a = create_doc("a", "a")
+    b = create_doc("b", "b")
+
+    assert li.reciprocal_rank_fusion([[a, b], [b, a]], 2, weights=[2.0, 1.0])[0] is a
+    assert li.reciprocal_rank_fusion([[a, b], [b, a]], 2, weights=[1.0, 2.0])[0] is b
+
+
+def test_doc_search_keeps_semantic_results_when_a_substring_matches(monkeypatch):
+    docs = [
+        create_doc("minutes", "第3回営業会議の議事録。出席者は営業部の5名。"),
+        create_doc("policy", "社内ミーティングの開催手順と、参加者への事前共有ルールを定める。"),
+        create_doc("trip", "社員旅行の行き先と日程のお知らせ。"),
+    ]
+    shared_index = create_shared_index(docs, ["policy", "minutes", "trip"], [0.8, 0.4, 0.2])
+
+    results = search_documents(monkeypatch, shared_index, "会議")
+
+    # 「会議」を含むだけの関連度の低い議事録ではなく、閾値以上の規程を返す
+    assert results == ["policy"]
+
+
+def test_doc_search_returns_identifier_match_below_the_threshold(monkeypatch):
+    docs = [
+        create_doc("other", "従業員の評価制度についての説明。"),
+        create_doc("target", "社員ID EMP-0042 の保有資格は基本情報技術者。"),
+    ]
+    shared_index = create_shared_index(docs, ["other", "target"], [0.5, 0.3])
+
+    results = search_documents(monkeypatch, shared_index, "EMP-0042")
+
+    assert results == ["target"]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("EMP-0042", True),
+    ("ｅｍｐ００４２", True),
+    ("会議", False),
+    ("EcoTee", False),
+    ("経費精算 2024", False),
+])
+def test_identifier_query(query, expected):
+    assert li.is_identifier_query(query) == expected
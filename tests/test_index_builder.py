@@ -0,0 +1,95 @@
+"""
+このファイルは、別スレッドでのインデックス作成と、作成中に検知した変更の反映（index_builder.IndexBuilder）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+import index_builder
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_blocking_build():
+    """
+    1回目の作成を止めておき、呼び出しごとの変更されたパスを記録する作成処理を作成
+    """
+    calls = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def build(progress, changed_paths):
+        calls.append(changed_paths)
+        started.set()
+        if len(calls) == 1:
+            release.wait(5)
+
+    return build, calls, started, release
+
+
+def wait_until_idle(builder):
+    builder._thread.join(5)
+    assert not builder.is_running()
+
+
+############################################################
+# テスト
+############################################################
+
+def test_changes_during_a_build_are_merged_into_one_rerun():
+    builder = index_builder.IndexBuilder()
+    build, calls, started, release = create_blocking_build()
+
+    assert builder.start(build, changed_paths={"a.txt"})
+    started.wait(5)
+    assert not builder.start(build, rerun_if_running=True, changed_paths={"b.txt"})
+    assert not builder.start(build, rerun_if_running=True, changed_paths={"c.txt"})
+    release.set()
+    wait_until_idle(builder)
+
+    assert calls == [{"a.txt"}, {"b.txt", "c.txt"}]
+    assert builder.progress.state == "done"
+
+
+def test_full_rescan_request_wins_over_changed_paths():
+    builder = index_builder.IndexBuilder()
+    build, calls, started, release = create_blocking_build()
+
+    builder.start(build)
+    started.wait(5)
+    builder.start(build, rerun_if_running=True, changed_paths={"b.txt"})
+    builder.start(build, rerun_if_running=True)
+    builder.start(build, rerun_if_running=True, changed_paths={"c.txt"})
+    release.set()
+    wait_until_idle(builder)
+
+    assert calls == [None, None]
+
+
+def test_start_without_rerun_is_dropped_while_running():
+    builder = index_builder.IndexBuilder()
+    build, calls, started, release = create_blocking_build()
+
+    builder.start(build)
+    started.wait(5)
+    assert not builder.start(build)
+    release.set()
+    wait_until_idle(builder)
+
+    assert calls == [None]
+
+
+def test_failed_build_is_recorded():
+    builder = index_builder.IndexBuilder()
+
+    def build(progress, changed_paths):
+        raise RuntimeError("boom")
+
+    builder.start(build)
+    wait_until_idle(builder)
+
+    assert builder.progress.state == "failed"
+    assert "boom" in builder.progress.error
@@ -0,0 +1,158 @@
+"""
+このファイルは、マニフェストの比較によるインデックスの差分更新内容の決定（index_manager.create_index_plan）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import pytest
+import constants as ct
+import index_manager
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    """
+    一時フォルダを参照先フォルダとし、Webページを読み込み対象から外す
+    """
+    monkeypatch.setattr(ct, "RAG_TOP_FOLDER_PATH", str(tmp_path / "data"))
+    monkeypatch.setattr(ct, "WEB_URL_LOAD_TARGETS", [])
+    (tmp_path / "data" / "規程").mkdir(parents=True)
+    (tmp_path / "data" / "規程" / "就業規則.txt").write_text("始業は9時", encoding="utf-8")
+    (tmp_path / "data" / "規程" / "経費精算.txt").write_text("領収書を提出", encoding="utf-8")
+    (tmp_path / "data" / "議事録.txt").write_text("第1回会議", encoding="utf-8")
+    return tmp_path / "data"
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_manifest(plan):
+    """
+    読み込み直すファイルにチャンクIDを割り当て、インデックス作成後のマニフェストを作成
+    """
+    manifest = plan["manifest"]
+    for path in plan["load_paths"]:
+        manifest["files"][path]["chunk_ids"] = index_manager.create_chunk_ids(path, 1)
+    return manifest
+
+
+def corpus_path(*parts):
+    return os.path.join(ct.RAG_TOP_FOLDER_PATH, *parts)
+
+
+############################################################
+# テスト
+############################################################
+
+def test_first_build_loads_every_file(corpus):
+    plan = index_manager.create_index_plan(None, {})
+
+    assert plan["full_rebuild"]
+    assert sorted(plan["load_paths"]) == sorted([
+        corpus_path("規程", "就業規則.txt"),
+        corpus_path("規程", "経費精算.txt"),
+        corpus_path("議事録.txt"),
+    ])
+
+
+def test_unchanged_corpus_produces_empty_plan(corpus):
+    manifest = create_manifest(index_manager.create_index_plan(None, {}))
+
+    plan = index_manager.create_index_plan(manifest, {})
+
+    assert index_manager.is_plan_empty(plan)
+    assert plan["manifest"] == manifest
+
+
+def test_touched_file_with_same_content_is_not_reloaded(corpus):
+    manifest = create_manifest(index_manager.create_index_plan(None, {}))
+    path = corpus / "議事録.txt"
+    os.utime(path, ns=(0, 0))
+
+    plan = index_manager.create_index_plan(manifest, {})
+
+    assert index_manager.is_plan_empty(plan)
+    assert plan["manifest"]["files"][corpus_path("議事録.txt")]["mtime"] == 0
+
+
+def test_modified_and_deleted_files_are_diffed(corpus):
+    manifest = create_manifest(index_manager.create_index_plan(None, {}))
+    (corpus / "議事録.txt").write_text("第2回会議の内容に更新", encoding="utf-8")
+    (corpus / "規程" / "経費精算.txt").unlink()
+
+    plan = index_manager.create_index_plan(manifest, {})
+
+    assert plan["load_paths"] == [corpus_path("議事録.txt")]
+    assert sorted(plan["delete_chunk_ids"]) == sorted(
+        manifest["files"][corpus_path("議事録.txt")]["chunk_ids"]
+        + manifest["files"][corpus_path("規程", "経費精算.txt")]["chunk_ids"]
+    )
+
+
+def test_changed_paths_limit_the_scan(corpus, monkeypatch):
+    manifest = create_manifest(index_manager.create_index_plan(None, {}))
+    (corpus / "規程" / "就業規則.txt").write_text("始業は10時に変更", encoding="utf-8")
+    (corpus / "議事録.txt").write_text("第2回会議の内容に更新", encoding="utf-8")
+
+    # 変更通知は絶対パスで届くため、マニフェストのパスの形式に揃えて比較されること
+    plan = index_manager.create_index_plan(manifest, {}, changed_paths={str((corpus / "議事録.txt").resolve())})
+
+    # 通知されていないファイルは走査されず、前回の状態が引き継がれる
+    assert plan["load_paths"] == [corpus_path("議事録.txt")]
+    assert plan["manifest"]["files"][corpus_path("規程", "就業規則.txt")] == manifest["files"][corpus_path("規程", "就業規則.txt")]
+
+
+def test_directory_rename_is_handled_as_delete_and_add(corpus):
+    manifest = create_manifest(index_manager.create_index_plan(None, {}))
+    os.rename(corpus / "規程", corpus / "社内規程")
+
+    # フォルダの移動では、移動元と移動先のフォルダのパスのみが通知される
+    plan = index_manager.create_index_plan(
+        manifest, {}, changed_paths={str(corpus / "規程"), str(corpus / "社内規程")}
+    )
+
+    assert sorted(plan["load_paths"]) == sorted([
+        corpus_path("社内規程", "就業規則.txt"),
+        corpus_path("社内規程", "経費精算.txt"),
+    ])
+    assert sorted(plan["delete_chunk_ids"]) == sorted(
+        manifest["files"][corpus_path("規程", "就業規則.txt")]["chunk_ids"]
+        + manifest["files"][corpus_path("規程", "経費精算.txt")]["chunk_ids"]
+    )
+    assert sorted(plan["manifest"]["files"]) == sorted([
+        corpus_path("議事録.txt"),
+        corpus_path("社内規程", "就業規則.txt"),
+        corpus_path("社内規程", "経費精算.txt"),
+    ])
+
+
+def test_settings_change_forces_full_rebuild(corpus, monkeypatch):
+    manifest = create_manifest(index_manager.create_index_plan(None, {}))
+    monkeypatch.setattr(ct, "CHUNK_SIZE", ct.CHUNK_SIZE + 1)
+
+    plan = index_manager.create_index_plan(manifest, {}, changed_paths={str(corpus / "議事録.txt")})
+
+    assert plan["full_rebuild"]
+    assert len(plan["load_paths"]) == 3
+
+
+def test_web_page_is_reloaded_only_when_text_changes(corpus, monkeypatch):
+    url = "https://example.com/"
+    monkeypatch.setattr(ct, "WEB_URL_LOAD_TARGETS", [url])
+    manifest = create_manifest(index_manager.create_index_plan(None, {url: {"hash": "a"}}))
+    manifest["web_urls"][url]["chunk_ids"] = ["web-0"]
+
+    # 取得できなかった場合や、変更を検知したファイルのみを反映する場合は前回のチャンクを使う
+    assert index_manager.is_plan_empty(index_manager.create_index_plan(manifest, {url: {"hash": "a"}}))
+    assert index_manager.is_plan_empty(index_manager.create_index_plan(manifest, {}))
+
+    plan = index_manager.create_index_plan(manifest, {url: {"hash": "b"}})
+    assert plan["load_urls"] == [url]
+    assert plan["delete_chunk_ids"] == ["web-0"]
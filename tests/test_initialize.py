@@ -0,0 +1,119 @@
+"""
+このファイルは、ファイルの並列読み込みで子プロセスが異常終了した場合の処理の継続（initialize.iter_parallel_results）と、
+起動時にインデックスを作成するかの判定、公開中のインデックス世代の読み込みのテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import index_builder
+import index_manager
+import initialize
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def load_only(monkeypatch):
+    """
+    起動時にインデックスを作成しない構成で、公開中の世代名と読み込み回数を差し替え可能にする
+
+    Returns:
+        公開中の世代名・読み込んだ世代のリスト・共有インデックスを持つ辞書
+    """
+    state = {"current": "gen1", "loads": [], "shared_index": index_manager.SharedIndex()}
+
+    def load_current_generation():
+        state["loads"].append(state["current"])
+        return object(), object(), state["current"]
+
+    monkeypatch.delenv("INDEX_BUILD_ON_STARTUP", raising=False)
+    monkeypatch.setattr(index_manager, "get_shared_index", lambda: state["shared_index"])
+    monkeypatch.setattr(index_manager, "get_current_generation_path", lambda: state["current"])
+    monkeypatch.setattr(index_builder, "get_index_builder", index_builder.IndexBuilder)
+    monkeypatch.setattr(initialize, "load_current_generation", load_current_generation)
+    return state
+
+
+############################################################
+# 関数定義
+############################################################
+
+def crash_on_negative(value):
+    """
+    負の値を渡された場合に、メモリ不足による強制終了のようにプロセスを異常終了させる
+    """
+    if value < 0:
+        os._exit(1)
+    return value * 10
+
+
+def create_executor():
+    return ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork"))
+
+
+def on_broken(item, error):
+    return ("lost", item)
+
+
+############################################################
+# テスト
+############################################################
+
+def test_results_are_yielded_in_order():
+    results = initialize.iter_parallel_results(create_executor, crash_on_negative, range(5), 2, on_broken)
+
+    assert list(results) == [0, 10, 20, 30, 40]
+
+
+def test_broken_pool_is_rebuilt_and_only_the_crashing_item_is_lost():
+    items = [1, 2, -3, 4, 5, -6, 7]
+
+    results = initialize.iter_parallel_results(create_executor, crash_on_negative, items, 3, on_broken)
+
+    # 異常終了時に一緒に実行中だった要素は処理し直され、原因の要素のみが処理できなかったものとして返る
+    assert list(results) == [10, 20, ("lost", -3), 40, 50, ("lost", -6), 70]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, False),
+    ("", False),
+    ("true", True),
+    ("1", True),
+    ("False", False),
+])
+def test_index_build_on_startup_defaults_to_load_only(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("INDEX_BUILD_ON_STARTUP", raising=False)
+    else:
+        monkeypatch.setenv("INDEX_BUILD_ON_STARTUP", value)
+
+    assert initialize.is_index_build_on_startup() == expected
+
+
+def test_published_generation_is_loaded_once_per_process(load_only):
+    initialize.initialize_retriever()
+    initialize.initialize_retriever()
+    initialize.initialize_retriever()
+
+    # 画面の再実行のたびに読み込み直すと、回答キャッシュが無効になる
+    assert load_only["loads"] == ["gen1"]
+    assert load_only["shared_index"].version == 1
+
+
+def test_newly_published_generation_is_swapped_in(load_only):
+    initialize.initialize_retriever()
+    # 「build_index.py」が新しい世代を公開した後の、次の画面の再実行
+    load_only["current"] = "gen2"
+    initialize.initialize_retriever()
+    initialize.initialize_retriever()
+
+    assert load_only["loads"] == ["gen1", "gen2"]
+    assert load_only["shared_index"].generation_path == "gen2"
+    assert load_only["shared_index"].version == 2
@@ -0,0 +1,134 @@
+"""
+このファイルは、キーワード検索用の転置インデックス（lexical_index.LexicalIndex）の検索と、差分の保存のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+from langchain.schema import Document
+import constants as ct
+import lexical_index as li
+
+
+############################################################
+# フェイク
+############################################################
+
+class FakeDocumentStore:
+    """
+    チャンクIDからチャンクを返す、ベクターストアの代わり
+    """
+    def __init__(self):
+        self.docs = {}
+
+    def add(self, docs):
+        self.docs.update({doc.metadata["chunk_id"]: doc for doc in docs})
+
+    def get_documents(self, ids):
+        return [self.docs[chunk_id] for chunk_id in ids if chunk_id in self.docs]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_doc(chunk_id, text):
+    return Document(page_content=text, metadata={"chunk_id": chunk_id, "source": f"{chunk_id}.txt"})
+
+
+def add_docs(index, store, docs):
+    store.add(docs)
+    index.add_documents(docs)
+
+
+def create_index(store, count=10):
+    index = li.LexicalIndex()
+    add_docs(index, store, [create_doc(f"c{i}", f"第{i}回の定例会議の議事録") for i in range(count)])
+    return index
+
+
+def search_ids(index, store, query, k=5):
+    return [doc.metadata["chunk_id"] for doc, _ in index.search(query, k, store.get_documents)]
+
+
+############################################################
+# テスト
+############################################################
+
+def test_search_and_exact_search():
+    store = FakeDocumentStore()
+    index = li.LexicalIndex()
+    add_docs(index, store, [
+        create_doc("a", "社員ID EMP-0042 の保有資格"),
+        create_doc("b", "経費精算の手順と締め日"),
+        create_doc("c", "EMPと0042を別々に含む文書"),
+    ])
+
+    assert search_ids(index, store, "経費の精算") == ["b"]
+    # 語をすべて含んでいても、文字列として含まないチャンクは完全一致の結果に含めない
+    assert [doc.metadata["chunk_id"] for doc, _ in index.search_exact("emp-0042", 5, store.get_documents)] == ["a"]
+    assert index.search_exact("EMP-0043", 5, store.get_documents) == []
+
+
+def test_index_keeps_only_postings_and_ids():
+    index = create_index(FakeDocumentStore(), 2)
+
+    assert set(index.__dict__) - {"_changes", "_saved_change_count"} == {"postings", "doc_lengths", "total_length"}
+
+
+def test_delete_removes_postings():
+    store = FakeDocumentStore()
+    index = create_index(store, 2)
+    index.delete(store.get_documents(["c0"]))
+
+    assert search_ids(index, store, "第0回") == ["c1"]
+    assert all("c0" not in postings for postings in index.postings.values())
+    assert index.total_length == index.doc_lengths["c1"]
+
+
+def test_re_adding_a_registered_chunk_replaces_its_terms():
+    store = FakeDocumentStore()
+    index = create_index(store, 2)
+    add_docs(index, store, [create_doc("c0", "まったく別の内容")])
+
+    assert "c0" not in search_ids(index, store, "定例会議")
+    assert search_ids(index, store, "別の内容") == ["c0"]
+
+
+def test_save_appends_deltas_and_load_replays_them(tmp_path):
+    path = str(tmp_path / ct.LEXICAL_INDEX_FILE)
+    store = FakeDocumentStore()
+    index = create_index(store)
+    index.save(path)
+    base_mtime = os.stat(path).st_mtime_ns
+
+    index.delete(store.get_documents(["c3"]))
+    add_docs(index, store, [create_doc("n1", "新しい就業規則の説明")])
+    index.save(path)
+
+    # 本体は書き直されず、変更のみが差分のファイルとして追加される
+    assert os.stat(path).st_mtime_ns == base_mtime
+    assert li.list_delta_paths(path) == [f"{path}{li.DELTA_FILE_INFIX}000001"]
+
+    loaded = li.LexicalIndex.load(path)
+    assert loaded.doc_lengths == index.doc_lengths
+    assert loaded.postings == index.postings
+    assert search_ids(loaded, store, "就業規則") == ["n1"]
+
+
+def test_many_changes_are_compacted_into_the_base(tmp_path):
+    path = str(tmp_path / ct.LEXICAL_INDEX_FILE)
+    store = FakeDocumentStore()
+    index = create_index(store)
+    index.save(path)
+
+    for i in range(3):
+        add_docs(index, store, [create_doc(f"n{i}", f"追加{i}の文書")])
+        index.save(path)
+
+    # 差分の件数が全チャンク数の一定割合を超えた時点で本体にまとめ直される
+    assert li.list_delta_paths(path) == []
+    loaded = li.LexicalIndex.load(path)
+    assert loaded.postings == index.postings
+    assert len(loaded.doc_lengths) == 13
@@ -0,0 +1,81 @@
+"""
+このファイルは、PDFファイルのページ単位の抽出とキャッシュ（pdf_loader.PdfLoader）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import multiprocessing
+import fitz
+import pytest
+import constants as ct
+import index_manager
+import initialize
+import pdf_loader
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """
+    1ページに1行ずつテキストを書き込んだ、4ページのPDFファイル
+    """
+    path = str(tmp_path / "規程.pdf")
+    with fitz.open() as doc:
+        for i in range(4):
+            doc.new_page().insert_text((72, 72), f"page {i}")
+        doc.save(path)
+    return path
+
+
+############################################################
+# テスト
+############################################################
+
+def test_pages_are_cached_by_manifest_hash(tmp_path, pdf_path):
+    cache_dir = str(tmp_path / "cache")
+    docs = pdf_loader.PdfLoader(pdf_path, cache_dir=cache_dir, max_workers=1).load()
+
+    assert [doc.page_content.strip() for doc in docs] == [f"page {i}" for i in range(4)]
+    assert docs[0].metadata["total_pages"] == 4
+    # マニフェストと同じハッシュ値をキャッシュのキーに使う
+    assert os.listdir(cache_dir) == [f"{index_manager.compute_file_hash(pdf_path)}.json"]
+
+
+def test_pool_worker_extracts_without_nested_pool(pdf_path, monkeypatch):
+    # ファイル単位の並列読み込みのプロセス内として実行し、ページ単位のプールを作らないことを確認する
+    monkeypatch.setattr(multiprocessing, "parent_process", lambda: object())
+    monkeypatch.setattr(pdf_loader, "ProcessPoolExecutor", None)
+
+    extracted = pdf_loader.extract_pdf(pdf_path, max_workers=4, parallel_min_pages=2)
+
+    assert [text.strip() for text in extracted["pages"]] == [f"page {i}" for i in range(4)]
+
+
+def test_manifest_hash_is_reused_without_reading_the_file_again(tmp_path, pdf_path, monkeypatch):
+    def fail(path):
+        raise AssertionError("file hash computed again")
+
+    monkeypatch.setattr(index_manager, "compute_file_hash", fail)
+    cache_dir = str(tmp_path / "cache")
+
+    pdf_loader.PdfLoader(pdf_path, cache_dir=cache_dir, max_workers=1, file_hash="manifest-hash").load()
+
+    assert os.listdir(cache_dir) == ["manifest-hash.json"]
+
+
+def test_single_file_is_loaded_without_the_file_pool(tmp_path, pdf_path, monkeypatch):
+    # 1ファイルのみの読み込みでは、ファイル単位のプールを作らず、ローダーがページを分割できるようにする
+    monkeypatch.setattr(ct, "FILE_LOAD_MODE", "process")
+    monkeypatch.setattr(ct, "PDF_PAGE_CACHE_DIR_PATH", str(tmp_path / "cache"))
+    monkeypatch.setattr(initialize, "create_file_load_executor", None)
+    monkeypatch.setattr(index_manager, "compute_file_hash", None)
+
+    results = list(initialize.load_files([pdf_path], {pdf_path: "manifest-hash"}))
+
+    assert results[0]["error"] is None
+    assert len(results[0]["docs"]) == 4
@@ -0,0 +1,118 @@
+"""
+このファイルは、イベントループのスレッドで実行する「社内問い合わせ」モードの回答取得（utils.aget_llm_response）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import asyncio
+import threading
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableLambda
+import constants as ct
+import answer_cache
+import embedding_pipeline
+import employee_directory
+import index_manager
+import lexical_index as li
+import utils
+import vector_backend
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch):
+    """
+    2件のチャンクを登録した共有インデックスと、LLMの代わりのChainを使う共有リソース
+    """
+    monkeypatch.setattr(ct, "VECTOR_BACKEND", "numpy")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    texts = ["経費精算の締め日は毎月25日です", "営業部の定例会議は月曜日です"]
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings)
+    db.upsert(["a", "b"], embeddings.embed_documents(texts), texts, [{"source": "a.txt"}, {"source": "b.txt"}])
+    lexical_index = li.LexicalIndex()
+    lexical_index.add_documents([Document(page_content=text, metadata={"chunk_id": chunk_id}) for chunk_id, text in zip("ab", texts)])
+    shared_index = index_manager.SharedIndex()
+    shared_index.swap(db, lexical_index, str(tmp_path))
+
+    answer_calls = []
+    return {
+        "shared_index": shared_index,
+        "query_result_cache": answer_cache.QueryResultCache(),
+        "semantic_answer_cache": answer_cache.SemanticAnswerCache(),
+        "embeddings": embeddings,
+        "employee_directory": None,
+        "question_generator_chain": RunnableLambda(lambda chain_input: "経費精算の締め日はいつ？"),
+        "question_answer_chain": RunnableLambda(lambda chain_input: answer_calls.append(chain_input) or "毎月25日です"),
+        "answer_calls": answer_calls
+    }
+
+
+@pytest.fixture(autouse=True)
+def forbid_cached_resource_getters(monkeypatch):
+    """
+    イベントループのスレッドから「st.cache_resource」の関数を呼び出した場合に失敗させる
+    """
+    def fail(*args, **kwargs):
+        raise AssertionError("cached resource getter called from the event loop thread")
+
+    for module, name in [
+        (utils, "get_llm"),
+        (utils, "get_question_generator_chain"),
+        (utils, "get_question_answer_chain"),
+        (embedding_pipeline, "get_embeddings"),
+        (employee_directory, "get_employee_directory"),
+        (answer_cache, "get_query_result_cache"),
+        (answer_cache, "get_semantic_answer_cache"),
+        (index_manager, "get_shared_index"),
+    ]:
+        monkeypatch.setattr(module, name, fail)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def run_in_thread(coro):
+    """
+    画面処理のスレッドとは別のスレッドで、コルーチンを実行
+    """
+    result = {}
+
+    def run():
+        result["value"] = asyncio.run(coro)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(10)
+    return result["value"]
+
+
+############################################################
+# テスト
+############################################################
+
+def test_answer_uses_only_passed_resources(resources):
+    response = run_in_thread(utils.aget_llm_response("経費精算の締め日は？", ct.ANSWER_MODE_2, [], resources))
+
+    assert response["answer"] == "毎月25日です"
+    assert response["context"]
+
+    # 2回目は検索・回答生成を省略し、キャッシュ済みの回答を使う
+    run_in_thread(utils.aget_llm_response("経費精算の締め日は？", ct.ANSWER_MODE_2, [], resources))
+    assert len(resources["answer_calls"]) == 1
+
+
+def test_rewritten_question_skips_semantic_cache(resources):
+    chat_history = [("human", "経費精算について教えて"), ("ai", "申請はシステムから行います")]
+
+    run_in_thread(utils.aget_llm_response("その締め日は？", ct.ANSWER_MODE_2, chat_history, resources))
+
+    # 会話履歴を使って書き換えた質問文は、類似質問のキャッシュに保存しない
+    assert resources["semantic_answer_cache"].get_stats()["entries"] == 0
+    assert resources["query_result_cache"].get_stats()["entries"] == 1
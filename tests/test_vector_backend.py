@@ -0,0 +1,160 @@
+"""
+このファイルは、セグメント単位で差分を保存する「numpy」形式のベクターストア（vector_backend.NumpyVectorStore）のテストです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import constants as ct
+import vector_backend
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+@pytest.fixture(autouse=True)
+def numpy_backend(monkeypatch):
+    monkeypatch.setattr(ct, "VECTOR_BACKEND", "numpy")
+
+
+############################################################
+# 関数定義
+############################################################
+
+def add_texts(db, embeddings, texts, prefix):
+    ids = [f"{prefix}-{i}" for i in range(len(texts))]
+    db.upsert(ids, embeddings.embed_documents(texts), texts, [{"source": f"{prefix}.txt"} for _ in texts])
+    return ids
+
+
+def read_segments(generation_path):
+    with open(os.path.join(generation_path, vector_backend.SEGMENTS_FILE), encoding="utf-8") as f:
+        return json.load(f)["segments"]
+
+
+def top_id(db, query):
+    return db.similarity_search(query, 1)[0].metadata["chunk_id"]
+
+
+############################################################
+# テスト
+############################################################
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_search_returns_the_matching_chunk(tmp_path, embeddings, dtype):
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings, dtype=dtype)
+    add_texts(db, embeddings, ["就業規則", "経費精算", "社員旅行"], "a")
+    db.persist()
+
+    reopened = vector_backend.NumpyVectorStore(str(tmp_path), embeddings, dtype=dtype)
+
+    assert top_id(reopened, "経費精算") == "a-1"
+    assert reopened.similarity_search_with_relevance_scores("経費精算", 1)[0][1] == pytest.approx(1.0, abs=0.02)
+
+
+def test_persist_appends_a_segment_and_records_deletes(tmp_path, embeddings):
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings)
+    add_texts(db, embeddings, [f"規程{i}" for i in range(10)], "a")
+    db.persist()
+    first = read_segments(str(tmp_path))[0]
+    first_vectors_path = os.path.join(str(tmp_path), f"{first['name']}{vector_backend.SEGMENT_VECTORS_SUFFIX}")
+    first_inode = os.stat(first_vectors_path).st_ino
+
+    db.delete(["a-0"])
+    add_texts(db, embeddings, ["社員旅行"], "b")
+    db.persist()
+
+    # 保存済みのセグメントは書き直されず、削除は行番号としてのみ記録される
+    segments = read_segments(str(tmp_path))
+    assert [segment["name"] for segment in segments][0] == first["name"]
+    assert segments[0]["deleted_rows"] == [0]
+    assert len(segments) == 2
+    assert os.stat(first_vectors_path).st_ino == first_inode
+
+    ids, _, _ = db.get_all()
+    assert len(ids) == 10 and "a-0" not in ids and "b-0" in ids
+    assert top_id(db, "規程0") != "a-0"
+    assert top_id(db, "社員旅行") == "b-0"
+
+
+def test_compaction_merges_segments(tmp_path, embeddings, monkeypatch):
+    monkeypatch.setattr(ct, "VECTOR_MAX_SEGMENTS", 2)
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings)
+    for i in range(3):
+        add_texts(db, embeddings, [f"議事録{i}"], f"m{i}")
+        db.persist()
+
+    segments = read_segments(str(tmp_path))
+    assert len(segments) == 1
+    assert segments[0]["rows"] == 3
+    # まとめ直した後は、使われなくなったセグメントのファイルが残らない
+    assert len([name for name in os.listdir(str(tmp_path)) if name.endswith(vector_backend.SEGMENT_VECTORS_SUFFIX)]) == 1
+    assert top_id(db, "議事録1") == "m1-0"
+
+
+def test_compaction_drops_deleted_rows(tmp_path, embeddings):
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings)
+    ids = add_texts(db, embeddings, [f"文書{i}" for i in range(10)], "d")
+    db.persist()
+
+    db.delete(ids[:5])
+    db.persist()
+
+    segments = read_segments(str(tmp_path))
+    assert [(segment["rows"], segment["deleted_rows"]) for segment in segments] == [(5, [])]
+
+
+def test_cloned_generation_does_not_change_the_source(tmp_path, embeddings):
+    source_path = str(tmp_path / "gen1")
+    os.makedirs(source_path)
+    db = vector_backend.NumpyVectorStore(source_path, embeddings)
+    add_texts(db, embeddings, ["就業規則", "経費精算"], "a")
+    db.persist()
+
+    generation_path = str(tmp_path / "gen2")
+    vector_backend.clone_generation(source_path, generation_path)
+    cloned = vector_backend.NumpyVectorStore(generation_path, embeddings)
+    cloned.delete(["a-0"])
+    add_texts(cloned, embeddings, ["社員旅行"], "b")
+    cloned.persist()
+
+    # 元の世代は、複製先の変更の影響を受けない
+    source = vector_backend.NumpyVectorStore(source_path, embeddings)
+    assert sorted(source.get_all()[0]) == ["a-0", "a-1"]
+    assert sorted(cloned.get_all()[0]) == ["a-1", "b-0"]
+
+
+def test_ivf_is_trained_only_for_large_segments(tmp_path, embeddings, monkeypatch):
+    monkeypatch.setattr(ct, "VECTOR_IVF_MIN_ROWS", 20)
+    monkeypatch.setattr(ct, "VECTOR_IVF_PROBES", 64)
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings, search_type="ivf")
+    add_texts(db, embeddings, [f"規程{i}" for i in range(30)], "r")
+    db.persist()
+    add_texts(db, embeddings, ["追加の規程"], "s")
+    db.persist()
+
+    assert [segment["ivf"] for segment in read_segments(str(tmp_path))] == [True, False]
+    assert top_id(db, "規程7") == "r-7"
+    assert top_id(db, "追加の規程") == "s-0"
+
+
+def test_get_documents_reads_chunks_on_demand(tmp_path, embeddings):
+    db = vector_backend.NumpyVectorStore(str(tmp_path), embeddings)
+    add_texts(db, embeddings, ["就業規則", "経費精算", "社員旅行"], "a")
+    db.persist()
+    add_texts(db, embeddings, ["保存前の文書"], "b")
+
+    docs = db.get_documents(["a-2", "missing", "b-0", "a-0"])
+
+    assert [doc.page_content for doc in docs] == ["社員旅行", "保存前の文書", "就業規則"]
+    assert docs[0].metadata == {"source": "a.txt", "chunk_id": "a-2"}
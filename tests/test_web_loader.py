@@ -0,0 +1,135 @@
+"""
+このファイルは、Webページの並列取得と、ETag・Last-Modifiedによる条件付きリクエストのキャッシュ（web_loader.py）のテストです。
+ローカルで起動したHTTPサーバーを、取得先のWebサイトの代わりに使います。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import constants as ct
+import web_loader
+
+
+############################################################
+# フェイク
+############################################################
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    """
+    パスごとの本文を返し、ETagが一致する場合は304を返すWebサイトの代わり
+    """
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        page = self.server.pages.get(self.path)
+        if page is None:
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        etag = f'"{page["version"]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = page["html"].encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+############################################################
+# フィクスチャ
+############################################################
+
+@pytest.fixture
+def site():
+    """
+    別スレッドで起動したローカルのHTTPサーバー
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSiteHandler)
+    server.pages = {
+        "/a": {"version": 1, "html": "<html lang='ja'><title>A</title><body>就業規則</body></html>"},
+        "/b": {"version": 1, "html": "<html><title>B</title><body>経費精算</body></html>"},
+    }
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    server.url = lambda path: f"http://127.0.0.1:{server.server_address[1]}{path}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def web_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ct, "WEB_CACHE_DIR_PATH", str(tmp_path / "web"))
+
+
+############################################################
+# テスト
+############################################################
+
+def test_pages_are_fetched_and_loaded_from_cache(site):
+    urls = [site.url("/a"), site.url("/b")]
+
+    results = web_loader.refresh_web_pages(urls)
+
+    assert [results[url]["status"] for url in urls] == ["updated", "updated"]
+    loaded = web_loader.load_web_page(urls[0])
+    assert loaded["error"] is None
+    assert "就業規則" in loaded["docs"][0].page_content
+    assert loaded["docs"][0].metadata == {"source": urls[0], "title": "A", "language": "ja"}
+
+
+def test_refresh_interval_skips_requests(site):
+    url = site.url("/a")
+    web_loader.refresh_web_pages([url])
+
+    assert web_loader.refresh_web_pages([url])[url]["status"] == "fresh"
+    assert len(site.requests) == 1
+
+
+def test_unchanged_page_is_revalidated_with_etag(site):
+    url = site.url("/a")
+    first = web_loader.refresh_web_pages([url])[url]
+
+    second = web_loader.refresh_web_pages([url], force=True)[url]
+
+    # 2回目はETagを付けて送り、304を受けた場合は本文を受け取らずに前回の内容を使う
+    assert site.requests[-1] == ("/a", '"1"')
+    assert second == {"hash": first["hash"], "status": "not_modified", "error": None}
+
+
+def test_changed_page_is_fetched_again(site):
+    url = site.url("/a")
+    first = web_loader.refresh_web_pages([url])[url]
+    site.pages["/a"] = {"version": 2, "html": "<html><title>A</title><body>就業規則（改定版）</body></html>"}
+
+    second = web_loader.refresh_web_pages([url], force=True)[url]
+
+    assert second["status"] == "updated"
+    assert second["hash"] != first["hash"]
+    assert "改定版" in web_loader.load_web_page(url)["docs"][0].page_content
+
+
+def test_failed_fetch_falls_back_to_cache(site):
+    url = site.url("/a")
+    first = web_loader.refresh_web_pages([url])[url]
+    del site.pages["/a"]
+
+    result = web_loader.refresh_web_pages([url, site.url("/missing")], force=True)
+
+    # キャッシュがあれば前回の内容を使い、なければ失敗として返す（他のページの取得は止めない）
+    assert result[url]["status"] == "stale"
+    assert result[url]["hash"] == first["hash"]
+    assert result[site.url("/missing")]["status"] == "failed"
@@ -6,15 +6,27 @@
 # ライブラリの読み込み
 ############################################################
 import os
+import time
+import asyncio
+import logging
+import queue
+import threading
+import httpx
 import pandas as pd
 from dotenv import load_dotenv
 import streamlit as st
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema import HumanMessage, Document
+from langchain.schema import Document
 from langchain_openai import ChatOpenAI
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain_core.output_parsers import StrOutputParser
 from langchain.chains.combine_documents import create_stuff_documents_chain
 import constants as ct
+import index_manager
+import lexical_index as li
+import answer_cache
+import embedding_pipeline
+import employee_directory
+import context_packer
 
 
 ############################################################
@@ -24,6 +36,11 @@ import constants as ct
 load_dotenv()
 
 
+# 質問文の書き換え（独立した入力テキストの生成）を実行・省略した回数
+query_rewrite_stats = {"rewritten": 0, "skipped": 0}
+query_rewrite_stats_lock = threading.Lock()
+
+
 ############################################################
 # 関数定義
 ############################################################
@@ -50,6 +67,7 @@ def get_source_icon(source):
 def load_employee_csv(file_path):
     """
     社員名簿CSVファイルを統合されたドキュメントとして読み込む
+    部署ごとの集計は「groupby」の1回で行い、従業員ごとのテキストは列単位の文字列演算でまとめて作成する
 
     Args:
         file_path: CSVファイルのパス
@@ -58,131 +76,141 @@ def load_employee_csv(file_path):
         統合されたドキュメントのリスト
     """
     try:
-        # CSVファイルを読み込み
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
+        # CSVファイルを読み込み（テキストの組み立てに使うため、すべての列を文字列として扱う）
+        df = pd.read_csv(file_path, encoding='utf-8', dtype=str).fillna("")
+        col = {column: df[column] for column in df.columns}
+
+        # 部署ごとの通し番号
+        no = (df.groupby('部署', sort=False).cumcount() + 1).astype(str)
+        # 各従業員の詳細情報（部署ごとの統合テキスト用）
+        employee_texts = (
+            no + ". 【" + col['氏名（フルネーム）'] + "】(" + col['社員ID'] + ")\n"
+            + "   性別: " + col['性別'] + " | 年齢: " + col['年齢'] + "歳\n"
+            + "   役職: " + col['役職'] + " | 従業員区分: " + col['従業員区分'] + "\n"
+            + "   入社日: " + col['入社日'] + "\n"
+            + "   メールアドレス: " + col['メールアドレス'] + "\n"
+            + "   スキルセット: " + col['スキルセット'] + "\n"
+            + "   保有資格: " + col['保有資格'] + "\n"
+            + "   学歴: " + col['大学名'] + " " + col['学部・学科'] + " (" + col['卒業年月日'] + "卒業)\n"
+        )
+
+        # 部署ごとの内訳（役職・従業員区分・性別）を、部署をまたいでまとめて集計
+        breakdowns = {
+            column: df.groupby('部署', sort=False)[column].value_counts(sort=True)
+            for column in ['役職', '従業員区分', '性別']
+        }
+
         # 部署ごとにグループ化して、検索しやすいテキスト形式に変換
-        departments = df['部署'].unique()
+        groups = df.groupby('部署', sort=False).indices
+        departments = list(groups)
         documents = []
-        
-        for dept in departments:
-            dept_employees = df[df['部署'] == dept]
-            
+
+        for dept, positions in groups.items():
+            dept_employees = df.iloc[positions]
+            count = len(positions)
+
             # 部署ごとの統合テキストを作成
             content_lines = [
                 f"【{dept}所属の従業員情報一覧】",
                 f"部署名: {dept}",
-                f"所属人数: {len(dept_employees)}人",
-                ""
+                f"所属人数: {count}人",
+                "",
+                "【従業員一覧】"
             ]
-            
             # 各従業員の詳細情報を追加
-            content_lines.append("【従業員一覧】")
-            for i, (_, employee) in enumerate(dept_employees.iterrows(), 1):
-                employee_info = [
-                    f"{i}. 【{employee['氏名（フルネーム）']}】({employee['社員ID']})",
-                    f"   性別: {employee['性別']} | 年齢: {employee['年齢']}歳",
-                    f"   役職: {employee['役職']} | 従業員区分: {employee['従業員区分']}",
-                    f"   入社日: {employee['入社日']}",
-                    f"   メールアドレス: {employee['メールアドレス']}",
-                    f"   スキルセット: {employee['スキルセット']}",
-                    f"   保有資格: {employee['保有資格']}",
-                    f"   学歴: {employee['大学名']} {employee['学部・学科']} ({employee['卒業年月日']}卒業)",
-                    ""
-                ]
-                content_lines.extend(employee_info)
-            
+            content_lines.extend(employee_texts.iloc[positions].tolist())
+
             # 部署の統計情報を追加
             content_lines.extend([
                 "【部署統計】",
-                f"役職別内訳: {dict(dept_employees['役職'].value_counts())}",
-                f"従業員区分別内訳: {dict(dept_employees['従業員区分'].value_counts())}",
-                f"性別内訳: {dict(dept_employees['性別'].value_counts())}",
+                f"役職別内訳: {get_breakdown(breakdowns['役職'], dept)}",
+                f"従業員区分別内訳: {get_breakdown(breakdowns['従業員区分'], dept)}",
+                f"性別内訳: {get_breakdown(breakdowns['性別'], dept)}",
                 ""
             ])
-            
-            # 検索キーワードを強化（人事部の場合は特別に強化）
-            if dept == "人事部":
-                content_lines.extend([
-                    "【検索キーワード】",
-                    f"{dept}, {dept}部, {dept}所属, 従業員, 社員, 名簿, スタッフ, 人事情報, 組織, メンバー",
-                    f"役職: {', '.join(dept_employees['役職'].unique())}",
-                    f"従業員区分: {', '.join(dept_employees['従業員区分'].unique())}",
-                    "人事部, 人事, HR, 人材管理, 採用, 労務, 給与, 人事担当, 人事スタッフ",
-                    "人事部に所属, 人事部の従業員, 人事部の社員, 人事部のスタッフ, 人事部のメンバー",
-                    "人事部員, 人事部一覧, 人事チーム, HR部門, 人材管理部門",
-                    f"人事部詳細情報, 人事部{len(dept_employees)}名, 人事部全員",
-                    ""
-                ])
-            else:
+
+            # 検索キーワードを強化（詳細な一覧を作成する部署は、部署固有のキーワードも追加）
+            content_lines.extend([
+                "【検索キーワード】",
+                f"{dept}, {dept}部, {dept}所属, 従業員, 社員, 名簿, スタッフ, 人事情報, 組織, メンバー",
+                f"役職: {', '.join(dept_employees['役職'].unique())}",
+                f"従業員区分: {', '.join(dept_employees['従業員区分'].unique())}"
+            ])
+            if dept in ct.EMPLOYEE_DETAILED_DEPARTMENTS:
                 content_lines.extend([
-                    "【検索キーワード】",
-                    f"{dept}, {dept}部, {dept}所属, 従業員, 社員, 名簿, スタッフ, 人事情報, 組織, メンバー",
-                    f"役職: {', '.join(dept_employees['役職'].unique())}",
-                    f"従業員区分: {', '.join(dept_employees['従業員区分'].unique())}",
-                    ""
+                    get_department_keywords(dept),
+                    f"{dept}に所属, {dept}の従業員, {dept}の社員, {dept}のスタッフ, {dept}のメンバー",
+                    f"{dept}員, {dept}一覧, {dept}チーム",
+                    f"{dept}詳細情報, {dept}{count}名, {dept}全員"
                 ])
-            
+            content_lines.append("")
+
             # 統合されたテキストを作成
             content = "\n".join(content_lines)
-            
+
             # ドキュメントオブジェクトを作成
             doc = Document(
                 page_content=content,
                 metadata={
                     "source": file_path,
                     "department": dept,
-                    "employee_count": len(dept_employees),
+                    "employee_count": count,
                     "document_type": "department_roster"
                 }
             )
             documents.append(doc)
-        
-        # 全社員統合ドキュメント（人事部情報を強調）
+
+        # 詳細な一覧を作成する部署
+        detailed_departments = [dept for dept in ct.EMPLOYEE_DETAILED_DEPARTMENTS if dept in groups]
+
+        # 全社員統合ドキュメント（詳細な一覧を作成する部署の情報を強調）
         all_content_lines = [
             "【全社員名簿・従業員情報一覧】",
             f"総従業員数: {len(df)}人",
             f"部署数: {len(departments)}部署",
-            f"部署一覧: {', '.join(departments)}",
-            "",
-            "【重要: 人事部従業員完全リスト】",
-            f"人事部所属者数: {len(df[df['部署'] == '人事部'])}名",
-            "人事部に所属している全従業員は以下の通りです:",
+            f"部署一覧: {', '.join(departments)}"
         ]
-        
-        # 人事部メンバーを個別に詳細列挙
-        hr_members = df[df['部署'] == '人事部']
-        for i, (_, emp) in enumerate(hr_members.iterrows(), 1):
+
+        # 詳細な一覧を作成する部署のメンバーを個別に詳細列挙
+        for dept in detailed_departments:
+            positions = groups[dept]
+            member_texts = (
+                "\n" + no.iloc[positions] + ". 【" + dept + "】" + col['氏名（フルネーム）'].iloc[positions] + "\n"
+                + "   - 社員ID: " + col['社員ID'].iloc[positions] + "\n"
+                + "   - 役職: " + col['役職'].iloc[positions] + "\n"
+                + "   - 従業員区分: " + col['従業員区分'].iloc[positions] + "\n"
+                + "   - 年齢: " + col['年齢'].iloc[positions] + "歳\n"
+                + "   - 入社日: " + col['入社日'].iloc[positions]
+            )
             all_content_lines.extend([
-                f"\n{i}. 【人事部】{emp['氏名（フルネーム）']}",
-                f"   - 社員ID: {emp['社員ID']}",
-                f"   - 役職: {emp['役職']}",
-                f"   - 従業員区分: {emp['従業員区分']}",
-                f"   - 年齢: {emp['年齢']}歳",
-                f"   - 入社日: {emp['入社日']}"
+                "",
+                f"【重要: {dept}従業員完全リスト】",
+                f"{dept}所属者数: {len(positions)}名",
+                f"{dept}に所属している全従業員は以下の通りです:"
+            ])
+            all_content_lines.extend(member_texts.tolist())
+            all_content_lines.extend([
+                "",
+                f"※{dept}は{len(positions)}名の重要な組織です"
             ])
-        
+
         all_content_lines.extend([
-            "",
-            f"※人事部は{len(hr_members)}名の重要な組織です",
             "",
             "【部署別人数】"
         ])
-        
+
         # 部署別の概要を追加
-        for dept in departments:
-            dept_count = len(df[df['部署'] == dept])
-            all_content_lines.append(f"・{dept}: {dept_count}人")
-        
+        all_content_lines.extend(f"・{dept}: {len(positions)}人" for dept, positions in groups.items())
+
         all_content_lines.extend([
             "",
             "【検索キーワード】",
             "社員名簿, 従業員名簿, 全社員, 人事情報, 組織図, 部署別, 従業員一覧, スタッフ一覧",
-            "人事部, 各部署, 組織構成, メンバー構成, 全従業員, 社員情報"
+            ", ".join(detailed_departments + ["各部署", "組織構成", "メンバー構成", "全従業員", "社員情報"])
         ])
-        
+
         all_content = "\n".join(all_content_lines)
-        
+
         # 全社員用ドキュメントを作成
         all_doc = Document(
             page_content=all_content,
@@ -194,133 +222,136 @@ def load_employee_csv(file_path):
             }
         )
         documents.append(all_doc)
-        
-        # 人事部専用の追加ドキュメントを作成（検索精度向上のため）
-        hr_dept_employees = df[df['部署'] == '人事部']
-        if len(hr_dept_employees) > 0:
-            hr_content_lines = [
-                "【人事部従業員情報詳細一覧】",
-                f"人事部総人数: {len(hr_dept_employees)}名",
-                "",
-                "【人事部全メンバー詳細情報】"
-            ]
-            
-            for i, (_, emp) in enumerate(hr_dept_employees.iterrows(), 1):
-                hr_content_lines.extend([
-                    f"\n■ 人事部メンバー {i}人目",
-                    f"【{emp['氏名（フルネーム）']}】",
-                    f"・社員ID: {emp['社員ID']}",
-                    f"・部署: {emp['部署']}（人事部所属）",
-                    f"・役職: {emp['役職']}",
-                    f"・従業員区分: {emp['従業員区分']}",
-                    f"・性別: {emp['性別']}",
-                    f"・年齢: {emp['年齢']}歳",
-                    f"・入社日: {emp['入社日']}",
-                    f"・メールアドレス: {emp['メールアドレス']}",
-                    f"・スキルセット: {emp['スキルセット']}",
-                    f"・保有資格: {emp['保有資格']}",
-                    f"・学歴: {emp['大学名']} {emp['学部・学科']} ({emp['卒業年月日']}卒業)",
-                    ""
-                ])
-            
-            hr_content_lines.extend([
-                "\n【人事部検索用キーワード】",
-                "人事部, 人事, HR, 人材管理, 採用, 労務, 給与, 人事担当, 人事スタッフ",
-                "従業員情報, 社員情報, 人事メンバー, 人事チーム, 人事組織",
-                f"人事部員{len(hr_dept_employees)}名, 人事部所属, 人事部一覧",
-                "人事部に所属, 人事部の従業員, 人事部の社員, 人事部のスタッフ, 人事部のメンバー"
-            ])
-            
-            hr_content = "\n".join(hr_content_lines)
-            
-            hr_doc = Document(
-                page_content=hr_content,
-                metadata={
-                    "source": file_path,
-                    "department": "人事部",
-                    "employee_count": len(hr_dept_employees),
-                    "document_type": "hr_department_detailed"
-                }
-            )
-            documents.append(hr_doc)
-            
-            # 人事部専用テーブル形式ドキュメントも追加
-            hr_table_lines = [
-                "【人事部従業員一覧表】",
-                f"人事部所属者: {len(hr_dept_employees)}名",
-                "",
-                "| No. | 氏名 | 社員ID | 役職 | 従業員区分 | 年齢 | 入社日 |",
-                "|-----|------|--------|------|------------|------|--------|"
-            ]
-            
-            for i, (_, emp) in enumerate(hr_dept_employees.iterrows(), 1):
-                hr_table_lines.append(
-                    f"| {i} | {emp['氏名（フルネーム）']} | {emp['社員ID']} | {emp['役職']} | {emp['従業員区分']} | {emp['年齢']}歳 | {emp['入社日']} |"
-                )
-            
-            hr_table_lines.extend([
-                "",
-                "【詳細情報】",
-                "上記は人事部に所属している全従業員の一覧です。",
-                f"合計{len(hr_dept_employees)}名が人事部に配属されています。",
-                "",
-                "【人事部関連キーワード】",
-                "人事部所属, 人事部員, 人事部の従業員, 人事部一覧, 人事部メンバー",
-                "人事担当者, 人事スタッフ, 人事チーム, HR部門, 人材管理部門"
-            ])
-            
-            hr_table_content = "\n".join(hr_table_lines)
-            
-            hr_table_doc = Document(
-                page_content=hr_table_content,
-                metadata={
-                    "source": file_path,
-                    "department": "人事部",
-                    "employee_count": len(hr_dept_employees),
-                    "document_type": "hr_department_table"
-                }
-            )
-            documents.append(hr_table_doc)
-            
-            # 人事部専用の簡潔な名前リストドキュメントも追加（より高い検索精度のため）
-            hr_simple_lines = [
-                "【人事部メンバー簡潔リスト】",
-                f"人事部には{len(hr_dept_employees)}名の従業員が所属しています。",
-                "",
-                "人事部所属の全従業員："
-            ]
-            
-            for i, (_, emp) in enumerate(hr_dept_employees.iterrows(), 1):
-                hr_simple_lines.append(f"{i}. {emp['氏名（フルネーム）']} - {emp['役職']} ({emp['従業員区分']})")
-            
-            hr_simple_lines.extend([
-                "",
-                "これが人事部に所属している全従業員の完全なリストです。",
-                "人事部, 人事部所属, 人事部員, 人事部の従業員, 人事部一覧, 人事部メンバー",
-                f"人事部総数{len(hr_dept_employees)}名"
-            ])
-            
-            hr_simple_content = "\n".join(hr_simple_lines)
-            
-            hr_simple_doc = Document(
-                page_content=hr_simple_content,
-                metadata={
-                    "source": file_path,
-                    "department": "人事部",
-                    "employee_count": len(hr_dept_employees),
-                    "document_type": "hr_department_simple"
-                }
-            )
-            documents.append(hr_simple_doc)
-        
+
+        # 詳細な一覧を作成する部署ごとに、詳細・表形式・簡潔な名前リストのドキュメントを追加（検索精度向上のため）
+        for dept in detailed_departments:
+            documents.extend(create_department_documents(file_path, dept, df.iloc[groups[dept]]))
+
         return documents
-        
+
     except Exception as e:
         # エラーが発生した場合は空のリストを返す
         print(f"Error loading employee CSV: {e}")
         return []
 
 
+def create_department_documents(file_path, dept, dept_employees):
+    """
+    部署の従業員情報を、詳細・表形式・簡潔な名前リストの3種類のドキュメントとして作成
+
+    Args:
+        file_path: CSVファイルのパス
+        dept: 部署名
+        dept_employees: 部署に所属する従業員のデータフレーム（すべての列が文字列）
+
+    Returns:
+        ドキュメントのリスト
+    """
+    col = {column: dept_employees[column] for column in dept_employees.columns}
+    count = len(dept_employees)
+    no = pd.Series(range(1, count + 1), index=dept_employees.index).astype(str)
+    metadata = {"source": file_path, "department": dept, "employee_count": count}
+    keywords = get_department_keywords(dept)
+
+    # 詳細情報のドキュメント
+    detailed_texts = (
+        f"\n■ {dept}メンバー " + no + "人目\n"
+        + "【" + col['氏名（フルネーム）'] + "】\n"
+        + "・社員ID: " + col['社員ID'] + "\n"
+        + "・部署: " + col['部署'] + f"（{dept}所属）\n"
+        + "・役職: " + col['役職'] + "\n"
+        + "・従業員区分: " + col['従業員区分'] + "\n"
+        + "・性別: " + col['性別'] + "\n"
+        + "・年齢: " + col['年齢'] + "歳\n"
+        + "・入社日: " + col['入社日'] + "\n"
+        + "・メールアドレス: " + col['メールアドレス'] + "\n"
+        + "・スキルセット: " + col['スキルセット'] + "\n"
+        + "・保有資格: " + col['保有資格'] + "\n"
+        + "・学歴: " + col['大学名'] + " " + col['学部・学科'] + " (" + col['卒業年月日'] + "卒業)\n"
+    )
+    detailed_lines = [
+        f"【{dept}従業員情報詳細一覧】",
+        f"{dept}総人数: {count}名",
+        "",
+        f"【{dept}全メンバー詳細情報】",
+        *detailed_texts.tolist(),
+        f"\n【{dept}検索用キーワード】",
+        keywords,
+        f"従業員情報, 社員情報, {dept}メンバー, {dept}チーム, {dept}組織",
+        f"{dept}員{count}名, {dept}所属, {dept}一覧",
+        f"{dept}に所属, {dept}の従業員, {dept}の社員, {dept}のスタッフ, {dept}のメンバー"
+    ]
+
+    # 表形式のドキュメント
+    table_rows = (
+        "| " + no + " | " + col['氏名（フルネーム）'] + " | " + col['社員ID'] + " | " + col['役職']
+        + " | " + col['従業員区分'] + " | " + col['年齢'] + "歳 | " + col['入社日'] + " |"
+    )
+    table_lines = [
+        f"【{dept}従業員一覧表】",
+        f"{dept}所属者: {count}名",
+        "",
+        "| No. | 氏名 | 社員ID | 役職 | 従業員区分 | 年齢 | 入社日 |",
+        "|-----|------|--------|------|------------|------|--------|",
+        *table_rows.tolist(),
+        "",
+        "【詳細情報】",
+        f"上記は{dept}に所属している全従業員の一覧です。",
+        f"合計{count}名が{dept}に配属されています。",
+        "",
+        f"【{dept}関連キーワード】",
+        f"{dept}所属, {dept}員, {dept}の従業員, {dept}一覧, {dept}メンバー",
+        keywords
+    ]
+
+    # 簡潔な名前リストのドキュメント
+    simple_rows = no + ". " + col['氏名（フルネーム）'] + " - " + col['役職'] + " (" + col['従業員区分'] + ")"
+    simple_lines = [
+        f"【{dept}メンバー簡潔リスト】",
+        f"{dept}には{count}名の従業員が所属しています。",
+        "",
+        f"{dept}所属の全従業員：",
+        *simple_rows.tolist(),
+        "",
+        f"これが{dept}に所属している全従業員の完全なリストです。",
+        f"{dept}, {dept}所属, {dept}員, {dept}の従業員, {dept}一覧, {dept}メンバー",
+        f"{dept}総数{count}名"
+    ]
+
+    return [
+        Document(page_content="\n".join(detailed_lines), metadata={**metadata, "document_type": "department_detailed"}),
+        Document(page_content="\n".join(table_lines), metadata={**metadata, "document_type": "department_table"}),
+        Document(page_content="\n".join(simple_lines), metadata={**metadata, "document_type": "department_simple"})
+    ]
+
+
+def get_breakdown(counts, dept):
+    """
+    部署をまたいで集計した内訳から、指定した部署の内訳を取得
+
+    Args:
+        counts: (部署, 値)をインデックスとする件数のシリーズ
+        dept: 部署名
+
+    Returns:
+        値をキー、件数を値とする辞書（件数が多い順）
+    """
+    return {value: int(count) for value, count in counts.loc[dept].items()}
+
+
+def get_department_keywords(dept):
+    """
+    部署固有の検索キーワードを取得
+
+    Args:
+        dept: 部署名
+
+    Returns:
+        「, 」区切りの検索キーワード
+    """
+    return ", ".join([dept, *ct.EMPLOYEE_DEPARTMENT_KEYWORDS.get(dept, [])])
+
+
 def build_error_message(message):
     """
     エラーメッセージと管理者問い合わせテンプレートの連結
@@ -334,19 +365,378 @@ def build_error_message(message):
     return "\n".join([message, ct.COMMON_ERROR_MESSAGE])
 
 
-def get_llm_response(chat_message):
+def get_llm_response(chat_message, res_box=None):
     """
     LLMからの回答取得
+    検索・回答生成は全セッションで共有するイベントループ上で非同期に実行し、画面処理のスレッドは表示のみを担う
 
     Args:
         chat_message: ユーザー入力値
+        res_box: 生成途中の回答を逐次表示するエリア（指定した場合、「社内問い合わせ」モードの回答をストリーミング表示）
 
     Returns:
         LLMからの回答
     """
-    # LLMのオブジェクトを用意
-    llm = ChatOpenAI(model_name=ct.MODEL, temperature=ct.TEMPERATURE)
+    # 「社内文書検索」モードでは回答文を使わないため、LLMを呼ばずに検索結果のみで回答
+    if st.session_state.mode == ct.ANSWER_MODE_1:
+        return get_doc_search_response(chat_message)
+
+    # 会話履歴（古い会話は要約にまとめられ、トークン数の上限内に収まっている）
+    chat_history = st.session_state.chat_history.get_messages()
+
+    # 生成されたトークンは、イベントループのスレッドからキュー経由で画面処理のスレッドに渡す
+    token_queue = queue.Queue()
+    on_token = token_queue.put if res_box is not None else None
+    # 「st.cache_resource」で共有しているリソースは、画面処理のスレッドで取得してからイベントループのスレッドに渡す
+    resources = get_inquiry_resources(st.session_state.mode)
+    future = run_async(aget_llm_response(chat_message, st.session_state.mode, chat_history, resources, on_token))
+
+    if res_box is not None:
+        # 「社内問い合わせ」モードでは、生成された部分から順に画面へ表示
+        display_streamed_answer(future, token_queue, res_box)
+    llm_response = future.result()
+    if res_box is not None:
+        res_box.markdown(llm_response["answer"])
+
+    # LLMレスポンスを会話履歴に追加
+    st.session_state.chat_history.add_turn(chat_message, llm_response["answer"])
+
+    return llm_response
+
+
+async def aget_llm_response(chat_message, mode, chat_history, resources, on_token=None):
+    """
+    「社内問い合わせ」モードの回答を非同期に取得
+    イベントループのスレッドで実行されるため、「st.session_state」や「st.cache_resource」の関数は参照せず、渡されたリソースのみを使う
+
+    Args:
+        chat_message: ユーザー入力値
+        mode: 回答モード
+        chat_history: 会話履歴のメッセージのリスト
+        resources: 「get_inquiry_resources」で取得した共有リソース
+        on_token: 回答が生成されるたびに、生成された部分を渡して呼び出す関数
+
+    Returns:
+        LLMからの回答
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    shared_index = resources["shared_index"]
+    query_result_cache = resources["query_result_cache"]
+
+    # 会話履歴なしでも理解できる、独立した質問文を取得（必要な場合のみLLMで書き換え）
+    question = await aget_standalone_question(chat_message, chat_history, resources["question_generator_chain"])
+
+    # 従業員の一覧化を求める質問は、LLMを使わずに社員名簿から直接回答
+    llm_response = get_employee_directory_response(chat_message, question, chat_history, resources["employee_directory"])
+    if llm_response:
+        return llm_response
+
+    # 同じ質問に対する検索結果と回答がキャッシュにあれば、検索とLLMの呼び出しを省略
+    index_version = shared_index.version
+    cache_key = answer_cache.create_cache_key(mode, question, index_version)
+    cached = query_result_cache.get(cache_key)
+    question_vector = None
+    key_terms = None
+    # 会話履歴を使って書き換えた質問文は、書き換えの結果に揺れがあり、取り違えた場合の影響も大きいため類似質問のキャッシュを使わない
+    use_semantic_cache = question == chat_message
+    if not cached and use_semantic_cache:
+        # 言い回しだけが異なる過去の質問があれば、その検索結果と回答を再利用
+        cached, question_vector, key_terms = await aget_semantic_cached_result(mode, question, index_version, resources)
+        if cached:
+            query_result_cache.put(cache_key, cached)
+    if cached:
+        context = shared_index.get_documents(cached["chunk_ids"])
+        answer = cached["answer"]
+        logger.info({"message": "キャッシュ済みの回答を使用しました。", **query_result_cache.get_stats()})
+    else:
+        # 全セッションで共有しているインデックスから、質問と関連性が高いドキュメントを検索
+        retrieved_docs = await index_manager.get_shared_retriever(ct.CONTEXT_CANDIDATE_COUNT, shared_index).ainvoke(question)
+        # 重複の除去・連続するチャンクの結合をした上で、トークン数の上限まで関連性が高い順に詰める
+        context, context_tokens = context_packer.pack_context(retrieved_docs)
+
+        # LLMから回答を取得する用のChain（モードごとに一度だけ作成したもの）
+        chain = resources["question_answer_chain"]
+
+        # LLMへのリクエストとレスポンス取得
+        chain_input = {"input": chat_message, "chat_history": chat_history, "context": context}
+        log_prompt_tokens(chat_message, chat_history, context_tokens)
+        if on_token is not None:
+            answer = await astream_answer(chain, chain_input, on_token)
+        else:
+            answer = await chain.ainvoke(chain_input)
+
+        # 検索中にインデックスが作り直された場合は、古い世代の結果になるためキャッシュしない
+        if shared_index.version == index_version:
+            chunk_ids = [chunk_id for doc in context for chunk_id in doc.metadata.get("chunk_ids", [doc.metadata["chunk_id"]])]
+            result = {"chunk_ids": chunk_ids, "answer": answer}
+            query_result_cache.put(cache_key, result)
+            if use_semantic_cache:
+                resources["semantic_answer_cache"].put(mode, question_vector, index_version, result, key_terms)
+
+    return {"input": chat_message, "chat_history": chat_history, "context": context, "answer": answer}
+
+
+@st.cache_resource
+def get_event_loop():
+    """
+    全セッションで共有するイベントループを、専用のスレッドで起動
+    LLM・埋め込みAPIへの通信待ちを1つのスレッドで多重化し、同時に多数の問い合わせを処理できるようにする
+
+    Returns:
+        イベントループ
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+
+    return loop
+
+
+def get_inquiry_resources(mode):
+    """
+    「社内問い合わせ」モードの回答に使う共有リソースを、画面処理のスレッドで取得
+    「st.cache_resource」の関数は画面処理のスレッドから呼び出す必要があるため、取得したものをイベントループのスレッドに渡す
+
+    Args:
+        mode: 回答モード
+
+    Returns:
+        共有リソースの辞書
+    """
+    return {
+        "shared_index": index_manager.get_shared_index(),
+        "query_result_cache": answer_cache.get_query_result_cache(),
+        "semantic_answer_cache": answer_cache.get_semantic_answer_cache(),
+        "embeddings": embedding_pipeline.get_embeddings(),
+        "employee_directory": employee_directory.get_employee_directory(),
+        "question_generator_chain": get_question_generator_chain(),
+        "question_answer_chain": get_question_answer_chain(mode)
+    }
+
+
+def run_async(coro):
+    """
+    共有のイベントループでコルーチンを実行
+
+    Args:
+        coro: コルーチン
+
+    Returns:
+        実行結果を受け取るFuture
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def display_streamed_answer(future, token_queue, res_box):
+    """
+    イベントループで生成中の回答を、キューから受け取った部分から順に画面へ表示
+
+    Args:
+        future: 回答を取得するコルーチンのFuture
+        token_queue: 生成された部分が順に入るキュー
+        res_box: 生成途中の回答を逐次表示するエリア
+    """
+    answer = ""
+    while not (future.done() and token_queue.empty()):
+        try:
+            token = token_queue.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        answer += token
+        # 生成途中であることが分かるよう、末尾にカーソルを付けて表示
+        res_box.markdown(answer + "▌")
+
+
+def log_prompt_tokens(chat_message, chat_history, context_tokens):
+    """
+    LLMに送信するプロンプトのトークン数をログに出力
+
+    Args:
+        chat_message: ユーザー入力値
+        chat_history: 会話履歴
+        context_tokens: 文脈のトークン数
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    history_tokens = sum(
+        context_packer.count_tokens(message.content if hasattr(message, "content") else str(message))
+        for message in chat_history
+    )
+    system_tokens = context_packer.count_tokens(ct.SYSTEM_PROMPT_INQUIRY)
+    input_tokens = context_packer.count_tokens(chat_message)
+
+    logger.info({
+        "message": "LLMに送信するプロンプトのトークン数を集計しました。",
+        "prompt_tokens": system_tokens + context_tokens + history_tokens + input_tokens,
+        "system_tokens": system_tokens,
+        "context_tokens": context_tokens,
+        "history_tokens": history_tokens,
+        "input_tokens": input_tokens
+    })
+
+
+def get_employee_directory_response(chat_message, question, chat_history, directory):
+    """
+    従業員の一覧化を求める質問に、社員名簿の従業員インデックスから回答
+
+    Args:
+        chat_message: ユーザー入力値
+        question: 会話履歴なしでも理解できる独立した質問文
+        chat_history: 会話履歴のメッセージのリスト
+        directory: 従業員インデックス（社員名簿が存在しない場合はNone）
+
+    Returns:
+        LLMからの回答と同じ形式の辞書（従業員の一覧化を求める質問でない場合はNone）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start_time = time.perf_counter()
+
+    if directory is None:
+        return None
+    answer = directory.answer(question)
+    if answer is None:
+        return None
+
+    logger.info({
+        "message": "社員名簿から従業員を一覧化しました。",
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3)
+    })
+
+    # 情報源として社員名簿を表示するため、回答をドキュメントとして「context」に入れる
+    context = [Document(page_content=answer, metadata={"source": directory.source})]
+    return {"input": chat_message, "chat_history": chat_history, "context": context, "answer": answer}
+
+
+async def aget_semantic_cached_result(mode, question, index_version, resources):
+    """
+    言い回しだけが異なる過去の質問の、検索結果と回答をキャッシュから取得
+
+    Args:
+        mode: 回答モード
+        question: 会話履歴なしでも理解できる独立した質問文
+        index_version: 検索に使うインデックスの世代番号
+        resources: 「get_inquiry_resources」で取得した共有リソース
+
+    Returns:
+        (保存した値（該当なしの場合はNone）, 質問文の埋め込みベクトル, 質問文の答えを左右する語)
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start_time = time.perf_counter()
+
+    semantic_answer_cache = resources["semantic_answer_cache"]
+    # 質問文の埋め込みベクトルは埋め込みキャッシュに保存されるため、続く検索で再度APIを呼ぶことはない
+    question_vector = await resources["embeddings"].aembed_query(question)
+    # 部署名・氏名は社員名簿の値と照合し、表記の違い（「営業」と「営業部」など）を同じものとして扱う
+    directory = resources["employee_directory"]
+    key_terms = answer_cache.extract_key_terms(question, directory.entity_terms if directory else None)
+    result = semantic_answer_cache.get(mode, question_vector, index_version, key_terms)
+
+    logger.info({
+        "message": "類似質問のキャッシュを参照しました。",
+        "hit": result is not None,
+        "similarity": round(result[1], 4) if result else None,
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+        **semantic_answer_cache.get_stats()
+    })
+
+    return (result[0] if result else None), question_vector, key_terms
+
+
+def get_doc_search_response(chat_message):
+    """
+    「社内文書検索」モードの回答取得
+    LLMは呼び出さず、ハイブリッド検索の結果のうち関連度スコアが閾値以上のドキュメントのみを検索結果として返す
+
+    Args:
+        chat_message: ユーザー入力値
+
+    Returns:
+        LLMからの回答と同じ形式の辞書（「answer」は該当資料がない場合のみ「該当資料なし」）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start_time = time.perf_counter()
+
+    shared_index = index_manager.get_shared_index()
+    query_result_cache = answer_cache.get_query_result_cache()
+
+    # 同じ入力に対する検索結果がキャッシュにあれば、検索を省略
+    index_version = shared_index.version
+    cache_key = answer_cache.create_cache_key(ct.ANSWER_MODE_1, chat_message, index_version)
+    cached = query_result_cache.get(cache_key)
+    if cached:
+        context = shared_index.get_documents(cached["chunk_ids"])
+        answer = cached["answer"]
+        logger.info({"message": "キャッシュ済みの検索結果を使用しました。", **query_result_cache.get_stats()})
+    else:
+        # 「社内問い合わせ」モードと同じく、キーワード検索・完全一致検索・ベクトル検索の順位を統合して検索
+        results = shared_index.hybrid_search_with_scores(chat_message, ct.RETRIEVER_SEARCH_COUNT)
+        # 関連度スコアが閾値未満のドキュメントは関連性が低いものとして除外
+        # （入力をそのまま含むだけでは残さず、社員IDのような識別子の入力の場合のみ、スコアによらず残す）
+        identifier_query = li.is_identifier_query(chat_message)
+        context = [
+            doc for doc, score, exact in results
+            if (score is not None and score >= ct.DOC_SEARCH_SCORE_THRESHOLD) or (exact and identifier_query)
+        ]
+        # 閾値以上のドキュメントが1件もなければ、LLMの判定と同じく「該当資料なし」とする
+        answer = "" if context else ct.NO_DOC_MATCH_ANSWER
+
+        # 閾値の調整に使えるよう、検索結果のスコアをログに出力
+        logger.info({
+            "message": "社内文書を検索しました。",
+            "identifier_query": identifier_query,
+            "scores": [None if score is None else round(score, 3) for _, score, _ in results],
+            "threshold": ct.DOC_SEARCH_SCORE_THRESHOLD,
+            "matched": len(context),
+            "elapsed_seconds": round(time.perf_counter() - start_time, 3)
+        })
+
+        if shared_index.version == index_version:
+            query_result_cache.put(cache_key, {
+                "chunk_ids": [doc.metadata["chunk_id"] for doc in context],
+                "answer": answer
+            })
+
+    llm_response = {"input": chat_message, "chat_history": st.session_state.chat_history.get_messages(), "context": context, "answer": answer}
+    # 会話履歴に追加
+    st.session_state.chat_history.add_turn(chat_message, answer)
+
+    return llm_response
+
+
+@st.cache_resource
+def get_llm():
+    """
+    プロセス内で共有するLLMのオブジェクトを取得
+    HTTP接続をプールして使い回すことで、リクエストのたびに接続を張り直さないようにする
+
+    Returns:
+        LLMのオブジェクト
+    """
+    # 接続を維持（keep-alive）したまま再利用するHTTPクライアントを、同期・非同期の呼び出しそれぞれに用意
+    limits = httpx.Limits(
+        max_connections=ct.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=ct.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=ct.LLM_HTTP_KEEPALIVE_EXPIRY
+    )
+    http_client = httpx.Client(limits=limits, timeout=ct.LLM_REQUEST_TIMEOUT)
+    # 非同期のクライアントは、共有のイベントループ上でのみ使う
+    http_async_client = httpx.AsyncClient(limits=limits, timeout=ct.LLM_REQUEST_TIMEOUT)
+    return ChatOpenAI(
+        model_name=ct.MODEL,
+        temperature=ct.TEMPERATURE,
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
+
+
+@st.cache_resource
+def get_question_generator_chain():
+    """
+    会話履歴なしでもLLMに理解してもらえる、独立した入力テキストを生成するChainを一度だけ作成
 
+    Returns:
+        独立した入力テキストを生成するChain
+    """
     # 会話履歴なしでもLLMに理解してもらえる、独立した入力テキストを取得するためのプロンプトテンプレートを作成
     question_generator_template = ct.SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT
     question_generator_prompt = ChatPromptTemplate.from_messages(
@@ -357,8 +747,22 @@ def get_llm_response(chat_message):
         ]
     )
 
+    return question_generator_prompt | get_llm() | StrOutputParser()
+
+
+@st.cache_resource
+def get_question_answer_chain(mode):
+    """
+    LLMから回答を取得する用のChainを、モードごとに一度だけ作成
+
+    Args:
+        mode: 回答モード（「社内文書検索」or「社内問い合わせ」）
+
+    Returns:
+        LLMから回答を取得する用のChain
+    """
     # モードによってLLMから回答を取得する用のプロンプトを変更
-    if st.session_state.mode == ct.ANSWER_MODE_1:
+    if mode == ct.ANSWER_MODE_1:
         # モードが「社内文書検索」の場合のプロンプト
         question_answer_template = ct.SYSTEM_PROMPT_DOC_SEARCH
     else:
@@ -373,19 +777,136 @@ def get_llm_response(chat_message):
         ]
     )
 
-    # 会話履歴なしでもLLMに理解してもらえる、独立した入力テキストを取得するためのRetrieverを作成
-    history_aware_retriever = create_history_aware_retriever(
-        llm, st.session_state.retriever, question_generator_prompt
+    return create_stuff_documents_chain(get_llm(), question_answer_prompt)
+
+
+@st.cache_resource
+def get_history_summary_chain():
+    """
+    古い会話を要約にまとめるChainを一度だけ作成
+
+    Returns:
+        会話を要約するChain
+    """
+    history_summary_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", ct.SYSTEM_PROMPT_SUMMARIZE_HISTORY),
+            MessagesPlaceholder("chat_history")
+        ]
     )
 
-    # LLMから回答を取得する用のChainを作成
-    question_answer_chain = create_stuff_documents_chain(llm, question_answer_prompt)
-    # 「RAG x 会話履歴の記憶機能」を実現するためのChainを作成
-    chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    return history_summary_prompt | get_llm() | StrOutputParser()
 
-    # LLMへのリクエストとレスポンス取得
-    llm_response = chain.invoke({"input": chat_message, "chat_history": st.session_state.chat_history})
-    # LLMレスポンスを会話履歴に追加
-    st.session_state.chat_history.extend([HumanMessage(content=chat_message), llm_response["answer"]])
 
-    return llm_response
\ No newline at end of file
+def summarize_chat_history(summary, messages, chain):
+    """
+    これまでの要約に、新たに要約対象となった会話をまとめる
+    要約用のスレッドで実行されるため、Chainは画面処理のスレッドで取得したものを受け取る
+
+    Args:
+        summary: これまでの要約
+        messages: 要約に追加する会話のメッセージのリスト
+        chain: 「get_history_summary_chain」で取得した、会話を要約するChain
+
+    Returns:
+        新しい要約
+    """
+    return chain.invoke({
+        "summary": summary or "（なし）",
+        "max_tokens": ct.CHAT_HISTORY_SUMMARY_MAX_TOKENS,
+        "chat_history": messages
+    })
+
+
+async def aget_standalone_question(chat_message, chat_history, chain):
+    """
+    会話履歴なしでも理解できる、独立した質問文を取得
+    書き換えが不要と判断できる場合は、LLMを呼ばずに入力をそのまま使う
+
+    Args:
+        chat_message: ユーザー入力値
+        chat_history: 会話履歴
+        chain: 「get_question_generator_chain」で取得した、独立した入力テキストを生成するChain
+
+    Returns:
+        独立した質問文
+    """
+    rewrite = needs_query_rewrite(chat_message, chat_history)
+    record_query_rewrite(rewrite)
+    if not rewrite:
+        return chat_message
+
+    return await chain.ainvoke({"input": chat_message, "chat_history": chat_history})
+
+
+def needs_query_rewrite(chat_message, chat_history):
+    """
+    質問文を独立した入力テキストに書き換える必要があるかを判定
+
+    Args:
+        chat_message: ユーザー入力値
+        chat_history: 会話履歴
+
+    Returns:
+        書き換えが必要であればTrue
+    """
+    # 最初の質問など会話履歴がない場合、書き換えの材料がないため不要
+    if not chat_history:
+        return False
+
+    # 前の会話を指す言葉（「それ」「上記」など）を含む場合は、会話履歴なしでは意味が通らないため必要
+    if any(keyword in chat_message for keyword in ct.QUERY_REWRITE_CONTEXT_KEYWORDS):
+        return True
+
+    # 短すぎる入力は、前の会話の続き（「営業部は？」など）である可能性が高いため必要
+    return len(chat_message.strip()) < ct.QUERY_REWRITE_MIN_LENGTH
+
+
+def record_query_rewrite(rewrite):
+    """
+    質問文の書き換えを実行・省略した回数を記録し、ログに出力
+
+    Args:
+        rewrite: 書き換えを実行したかどうか
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    with query_rewrite_stats_lock:
+        query_rewrite_stats["rewritten" if rewrite else "skipped"] += 1
+        stats = dict(query_rewrite_stats)
+
+    logger.info({"message": "質問文の書き換え要否を判定しました。", "rewrite": rewrite, **stats})
+
+
+async def astream_answer(chain, chain_input, on_token):
+    """
+    LLMからの回答をストリーミングで取得し、生成された部分を順に呼び出し元へ渡す
+
+    Args:
+        chain: LLMから回答を取得する用のChain
+        chain_input: Chainへの入力値
+        on_token: 回答が生成されるたびに、生成された部分を渡して呼び出す関数
+
+    Returns:
+        LLMからの回答
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    start_time = time.perf_counter()
+    first_token_seconds = None
+    answer = ""
+
+    # 回答は生成されたトークンごとに分割されて届く
+    async for token in chain.astream(chain_input):
+        if first_token_seconds is None:
+            first_token_seconds = time.perf_counter() - start_time
+        answer += token
+        on_token(token)
+
+    logger.info({
+        "message": "回答をストリーミングで取得しました。",
+        "time_to_first_token_seconds": round(first_token_seconds, 3) if first_token_seconds is not None else None,
+        "total_seconds": round(time.perf_counter() - start_time, 3)
+    })
+
+    return answer
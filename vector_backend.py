@@ -0,0 +1,719 @@
+"""
+このファイルは、ベクトル検索の保存形式・検索方式を切り替えられるようにする、ベクターストアの抽象化のファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import math
+import mmap
+import shutil
+from uuid import uuid4
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import Chroma
+import constants as ct
+
+
+############################################################
+# 設定関連
+############################################################
+# インデックス世代の保存形式のバージョン（変わった場合は、インデックスを作り直す）
+STORE_FORMAT_VERSION = 3
+# 「numpy」形式で保存する、セグメントの一覧のファイルと、セグメントごとのファイル（「<セグメント名><接尾辞>」）
+# チャンクのテキストとメタデータは1行ずつJSONにして連結し、各行の開始位置のファイルと合わせて、必要な行のみを読み込む
+SEGMENTS_FILE = "segments.json"
+SEGMENT_VECTORS_SUFFIX = ".vectors.npy"
+SEGMENT_SCALES_SUFFIX = ".scales.npy"
+SEGMENT_IDS_SUFFIX = ".ids.json"
+SEGMENT_CHUNKS_SUFFIX = ".chunks.jsonl"
+SEGMENT_OFFSETS_SUFFIX = ".offsets.npy"
+SEGMENT_IVF_SUFFIX = ".ivf.npz"
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ChromaVectorStore:
+    """
+    Chromaにベクトルを保存・検索するベクターストア
+    """
+    def __init__(self, generation_path, embeddings):
+        """
+        Args:
+            generation_path: インデックス世代の保存先フォルダのパス
+            embeddings: 検索クエリの埋め込みに使う埋め込みモデル
+        """
+        self.db = Chroma(
+            collection_name=ct.VECTOR_STORE_COLLECTION_NAME,
+            embedding_function=embeddings,
+            persist_directory=generation_path
+        )
+
+    def upsert(self, ids, vectors, texts, metadatas):
+        """
+        埋め込み済みのチャンクを追加（同じIDが登録済みの場合は差し替え）
+
+        Args:
+            ids: チャンクIDのリスト
+            vectors: 埋め込みベクトルのリスト
+            texts: チャンクのテキストのリスト
+            metadatas: チャンクのメタデータのリスト
+        """
+        # 埋め込み済みのベクトルをそのまま登録するため、Chromaのコレクションに直接追加
+        self.db._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+
+    def delete(self, ids):
+        """
+        チャンクを削除
+
+        Args:
+            ids: 削除するチャンクIDのリスト
+        """
+        if ids:
+            self.db.delete(ids=ids)
+
+    def get_all(self):
+        """
+        登録済みのすべてのチャンクを取得
+
+        Returns:
+            (チャンクIDのリスト, テキストのリスト, メタデータのリスト)
+        """
+        stored = self.db.get()
+        return stored["ids"], stored["documents"], stored["metadatas"]
+
+    def get_documents(self, ids):
+        """
+        チャンクIDに対応するチャンクを取得
+
+        Args:
+            ids: チャンクIDのリスト
+
+        Returns:
+            チャンクのリスト（渡したIDの順、登録されていないIDは除く）
+        """
+        if not ids:
+            return []
+
+        stored = self.db._collection.get(ids=list(ids))
+        docs = {
+            chunk_id: Document(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id})
+            for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+        return [docs[chunk_id] for chunk_id in ids if chunk_id in docs]
+
+    def similarity_search(self, query, k):
+        """
+        クエリと関連性が高いチャンクを検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+
+        Returns:
+            チャンクのリスト（関連性が高い順）
+        """
+        return self.db.similarity_search(query, k=k)
+
+    def similarity_search_with_relevance_scores(self, query, k):
+        """
+        関連度スコア（0〜1）付きで、クエリと関連性が高いチャンクを検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+
+        Returns:
+            (チャンク, 関連度スコア)のリスト（関連度が高い順）
+        """
+        return self.db.similarity_search_with_relevance_scores(query, k=k)
+
+    def persist(self):
+        """
+        変更内容をファイルに保存
+        """
+        self.db.persist()
+
+
+class VectorSegment:
+    """
+    一度書き出した後は変更しない、ベクトルの行列とチャンクの情報の組（セグメント）
+    - 行列とチャンクのテキスト・メタデータは読み込み専用でメモリマップするため、同じホスト上の複数のプロセスはOSのページキャッシュを共有する
+      （メモリ上に展開するのはチャンクIDのみで、テキスト・メタデータは検索結果として返す行の分だけ読み込む）
+    - 行の削除は行列を書き換えず、削除済みの行番号としてセグメントの一覧に記録する
+    """
+    def __init__(self, generation_path, info, dtype):
+        """
+        Args:
+            generation_path: インデックス世代の保存先フォルダのパス
+            info: セグメントの一覧に記録された、セグメントの情報
+            dtype: 行列の保存形式
+        """
+        self.name = info["name"]
+        self.ivf = info["ivf"]
+        segment_path = os.path.join(generation_path, self.name)
+
+        self.vectors = np.load(f"{segment_path}{SEGMENT_VECTORS_SUFFIX}", mmap_mode="r")
+        self.scales = np.load(f"{segment_path}{SEGMENT_SCALES_SUFFIX}", mmap_mode="r") if dtype == "int8" else None
+        with open(f"{segment_path}{SEGMENT_IDS_SUFFIX}", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.offsets = np.load(f"{segment_path}{SEGMENT_OFFSETS_SUFFIX}", mmap_mode="r")
+        with open(f"{segment_path}{SEGMENT_CHUNKS_SUFFIX}", "rb") as f:
+            self.chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # IVF検索用のクラスタの中心と、クラスタごとの行の範囲（行はクラスタ順に並べて保存する）
+        self.centroids = None
+        self.list_offsets = None
+        if self.ivf:
+            with np.load(f"{segment_path}{SEGMENT_IVF_SUFFIX}") as ivf:
+                self.centroids = ivf["centroids"]
+                self.list_offsets = ivf["list_offsets"]
+
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.alive[info["deleted_rows"]] = False
+
+    def get_info(self):
+        """
+        セグメントの一覧に記録する、セグメントの情報を取得
+
+        Returns:
+            セグメント名・行数・削除済みの行番号・IVF検索の有無の辞書
+        """
+        return {
+            "name": self.name,
+            "rows": len(self.ids),
+            "deleted_rows": np.flatnonzero(~self.alive).tolist(),
+            "ivf": self.ivf
+        }
+
+    def get_chunk(self, row):
+        """
+        行に対応するチャンクの情報を取得
+
+        Args:
+            row: 行番号
+
+        Returns:
+            (チャンクID, テキスト, メタデータ)
+        """
+        chunk = json.loads(self.chunks[int(self.offsets[row]):int(self.offsets[row + 1])])
+        return self.ids[row], chunk["text"], chunk["metadata"]
+
+    def close(self):
+        """
+        メモリマップを閉じる（ファイルを削除・置き換えできるようにするため）
+        """
+        self.chunks.close()
+        self.vectors = None
+        self.scales = None
+        self.offsets = None
+
+    def read_rows(self, rows):
+        """
+        行列から、指定した行をfloat32のベクトルとして取得
+
+        Args:
+            rows: 行番号の配列、または範囲（slice）
+
+        Returns:
+            float32の行列
+        """
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows], dtype=np.float32)[:, np.newaxis]
+        return block
+
+    def search(self, query_vector, k):
+        """
+        コサイン類似度が高い行を検索
+
+        Args:
+            query_vector: 正規化したクエリの埋め込みベクトル
+            k: 取得する行数
+
+        Returns:
+            (コサイン類似度, 行番号)のリスト
+        """
+        # IVF検索の場合は、クエリに近いクラスタの行の範囲のみを検索対象とする
+        if self.centroids is not None:
+            lists = np.argsort(-(self.centroids @ query_vector))[:ct.VECTOR_IVF_PROBES]
+            ranges = [(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists]
+        else:
+            ranges = [(0, len(self.ids))]
+
+        # 行列全体をfloat32に展開しないよう、一定行数ずつ内積を計算して上位のみを残す
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for range_start, range_end in ranges:
+            for start in range(range_start, range_end, ct.VECTOR_SEARCH_BLOCK_ROWS):
+                end = min(start + ct.VECTOR_SEARCH_BLOCK_ROWS, range_end)
+                scores = self.read_rows(slice(start, end)) @ query_vector
+                # 削除済みの行は検索対象外
+                scores[~self.alive[start:end]] = -np.inf
+                best_scores = np.concatenate([best_scores, scores])
+                best_rows = np.concatenate([best_rows, np.arange(start, end)])
+                if len(best_scores) > k:
+                    top = np.argpartition(-best_scores, k)[:k]
+                    best_scores, best_rows = best_scores[top], best_rows[top]
+
+        return [(float(score), int(row)) for score, row in zip(best_scores, best_rows) if np.isfinite(score)]
+
+
+class NumpyVectorStore:
+    """
+    埋め込みベクトルをNumPyの行列ファイルとして保存し、メモリマップで読み込んで検索するベクターストア
+    - 保存のたびに全体を書き直さず、追加したチャンクを新しいセグメントとして書き出し、削除したチャンクは行番号のみを記録する
+    - セグメントが増えた場合や削除済みの行が多くなった場合は、1つのセグメントにまとめ直す（圧縮）
+    - 行列はfloat32のほか、float16（半分）・int8（4分の1、行ごとの倍率付き）に量子化して保存できる
+    - 検索は全件の内積による厳密な検索のほか、クラスタ単位に絞り込むIVF検索を選べる（一定行数以上のセグメントのみ）
+    """
+    def __init__(self, generation_path, embeddings, dtype=ct.VECTOR_DTYPE, search_type=ct.VECTOR_SEARCH_TYPE):
+        """
+        Args:
+            generation_path: インデックス世代の保存先フォルダのパス
+            embeddings: 検索クエリの埋め込みに使う埋め込みモデル
+            dtype: 行列の保存形式（"float32"、"float16"、"int8"）
+            search_type: 検索方式（"exact": 全件検索、"ivf": クラスタ単位に絞り込んだ検索）
+        """
+        self.generation_path = generation_path
+        self.embeddings = embeddings
+        self.dtype = dtype
+        self.search_type = search_type
+
+        # 保存済みのセグメントと、チャンクIDから（セグメント, 行番号）への対応
+        self._segments = []
+        self._row_of = {}
+        # 保存前に追加したチャンク
+        self._added = {}
+
+        self._load()
+
+    def upsert(self, ids, vectors, texts, metadatas):
+        """
+        埋め込み済みのチャンクを追加（同じIDが登録済みの場合は差し替え）
+        追加したチャンクは、保存（persist）するまではメモリ上に保持する
+
+        Args:
+            ids: チャンクIDのリスト
+            vectors: 埋め込みベクトルのリスト
+            texts: チャンクのテキストのリスト
+            metadatas: チャンクのメタデータのリスト
+        """
+        self.delete([chunk_id for chunk_id in ids if chunk_id in self._row_of])
+        for chunk_id, vector, text, metadata in zip(ids, vectors, texts, metadatas):
+            self._added[chunk_id] = (normalize_rows(np.asarray(vector, dtype=np.float32)), text, metadata)
+
+    def delete(self, ids):
+        """
+        チャンクを削除
+
+        Args:
+            ids: 削除するチャンクIDのリスト
+        """
+        for chunk_id in ids:
+            self._added.pop(chunk_id, None)
+            location = self._row_of.pop(chunk_id, None)
+            if location is not None:
+                segment, row = location
+                segment.alive[row] = False
+
+    def get_all(self):
+        """
+        登録済みのすべてのチャンクを取得
+
+        Returns:
+            (チャンクIDのリスト, テキストのリスト, メタデータのリスト)
+        """
+        chunks = [
+            segment.get_chunk(row)
+            for segment in self._segments for row in np.flatnonzero(segment.alive)
+        ]
+        chunks += [(chunk_id, text, metadata) for chunk_id, (_, text, metadata) in self._added.items()]
+
+        return [chunk[0] for chunk in chunks], [chunk[1] for chunk in chunks], [chunk[2] for chunk in chunks]
+
+    def get_documents(self, ids):
+        """
+        チャンクIDに対応するチャンクを取得
+
+        Args:
+            ids: チャンクIDのリスト
+
+        Returns:
+            チャンクのリスト（渡したIDの順、登録されていないIDは除く）
+        """
+        docs = []
+        for chunk_id in ids:
+            if chunk_id in self._added:
+                _, text, metadata = self._added[chunk_id]
+            elif chunk_id in self._row_of:
+                segment, row = self._row_of[chunk_id]
+                _, text, metadata = segment.get_chunk(row)
+            else:
+                continue
+            docs.append(Document(page_content=text, metadata={**metadata, "chunk_id": chunk_id}))
+
+        return docs
+
+    def similarity_search(self, query, k):
+        """
+        クエリと関連性が高いチャンクを検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+
+        Returns:
+            チャンクのリスト（関連性が高い順）
+        """
+        return [doc for doc, _ in self.similarity_search_with_relevance_scores(query, k)]
+
+    def similarity_search_with_relevance_scores(self, query, k):
+        """
+        関連度スコア（0〜1）付きで、クエリと関連性が高いチャンクを検索
+
+        Args:
+            query: 検索クエリ
+            k: 取得するチャンク数
+
+        Returns:
+            (チャンク, 関連度スコア)のリスト（関連度が高い順）
+        """
+        query_vector = normalize_rows(np.asarray(self.embeddings.embed_query(query), dtype=np.float32))
+
+        # 各セグメントと、保存前に追加した行から、コサイン類似度が高いものを集める
+        candidates = [
+            (similarity, segment, row)
+            for segment in self._segments for similarity, row in segment.search(query_vector, k)
+        ]
+        for chunk_id, (vector, text, metadata) in self._added.items():
+            candidates.append((float(vector @ query_vector), None, (chunk_id, text, metadata)))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        results = []
+        for similarity, segment, row in candidates[:k]:
+            chunk_id, text, metadata = segment.get_chunk(row) if segment is not None else row
+            # Chroma（L2距離）と同じ尺度の関連度スコアにそろえ、「DOC_SEARCH_SCORE_THRESHOLD」をそのまま使えるようにする
+            relevance = 1.0 - (2.0 - 2.0 * similarity) / math.sqrt(2)
+            results.append((Document(page_content=text, metadata={**metadata, "chunk_id": chunk_id}), relevance))
+
+        return results
+
+    def persist(self):
+        """
+        削除・追加した内容を保存し、メモリマップで読み込み直す
+        追加したチャンクのみを新しいセグメントとして書き出すため、書き込み量は変更量に比例する
+        """
+        added = list(self._added.items())
+        total_rows = sum(len(segment.ids) for segment in self._segments) + len(added)
+        alive_rows = sum(int(segment.alive.sum()) for segment in self._segments) + len(added)
+        segment_count = len([segment for segment in self._segments if segment.alive.any()]) + bool(added)
+
+        if alive_rows == 0:
+            infos = []
+        elif segment_count > ct.VECTOR_MAX_SEGMENTS or total_rows - alive_rows > ct.VECTOR_COMPACTION_DELETED_RATIO * total_rows:
+            # セグメントが多すぎる場合や削除済みの行が多い場合は、残っている行を1つのセグメントにまとめ直す
+            sources = [(segment, np.flatnonzero(segment.alive)) for segment in self._segments] + [(None, added)]
+            infos = [self._write_segment(sources, alive_rows)]
+        else:
+            infos = [segment.get_info() for segment in self._segments if segment.alive.any()]
+            if added:
+                infos.append(self._write_segment([(None, added)], len(added)))
+
+        write_json_atomic(
+            os.path.join(self.generation_path, SEGMENTS_FILE),
+            {"version": STORE_FORMAT_VERSION, "dtype": self.dtype, "segments": infos}
+        )
+
+        # 使われなくなったセグメントのファイルを、メモリマップを閉じてから削除
+        # （前の世代から引き継いだファイルはハードリンクのため、前の世代のファイルには影響しない）
+        kept = {info["name"] for info in infos}
+        removed = [segment.name for segment in self._segments if segment.name not in kept]
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+        for name in removed:
+            remove_segment_files(self.generation_path, name)
+
+        self._load()
+
+    def _write_segment(self, sources, row_count):
+        """
+        保存済みのセグメントの行と、保存前に追加した行から、新しいセグメントを書き出す
+
+        Args:
+            sources: (セグメント, 書き出す行番号の配列)、または(None, 追加したチャンクのリスト)のリスト
+            row_count: 書き出す行数
+
+        Returns:
+            セグメントの情報
+        """
+        blocks = []
+        for segment, rows in sources:
+            if segment is not None:
+                blocks.append((lambda indexes, segment=segment, rows=rows: segment.read_rows(rows[indexes]), len(rows)))
+            elif rows:
+                matrix = np.vstack([vector for _, (vector, _, _) in rows])
+                blocks.append((lambda indexes, matrix=matrix: matrix[indexes], len(rows)))
+        block_offsets = np.cumsum([0] + [count for _, count in blocks])
+        dim = len(blocks[0][0](np.arange(1))[0])
+
+        def get_rows(indexes):
+            # 書き出す行の番号（各セグメントの行 → 追加した行の順）から、float32のベクトルを取得
+            indexes = np.asarray(indexes)
+            block_of = np.searchsorted(block_offsets, indexes, side="right") - 1
+            out = np.empty((len(indexes), dim), dtype=np.float32)
+            for i, (read, _) in enumerate(blocks):
+                selected = block_of == i
+                if selected.any():
+                    out[selected] = read(indexes[selected] - block_offsets[i])
+            return out
+
+        def get_chunk(index):
+            # 書き出す行の番号から、チャンクの情報を取得
+            for segment, rows in sources:
+                count = len(rows)
+                if index < count:
+                    if segment is not None:
+                        return segment.get_chunk(rows[index])
+                    chunk_id, (_, text, metadata) = rows[index]
+                    return chunk_id, text, metadata
+                index -= count
+
+        return write_segment(self.generation_path, get_rows, get_chunk, row_count, dim, self.dtype, self.search_type)
+
+    def _load(self):
+        """
+        保存済みのセグメントをメモリマップで読み込み、保存前の変更をリセット
+        """
+        segments_path = os.path.join(self.generation_path, SEGMENTS_FILE)
+        self._segments = []
+        if os.path.isfile(segments_path):
+            with open(segments_path, encoding="utf-8") as f:
+                segments = json.load(f)
+            self.dtype = segments["dtype"]
+            self._segments = [VectorSegment(self.generation_path, info, self.dtype) for info in segments["segments"]]
+
+        self._added = {}
+        self._row_of = {
+            chunk_id: (segment, row)
+            for segment in self._segments for row, chunk_id in enumerate(segment.ids) if segment.alive[row]
+        }
+
+
+############################################################
+# 関数定義
+############################################################
+
+def open_vector_store(generation_path, embeddings):
+    """
+    設定（VECTOR_BACKEND）に応じたベクターストアを開く
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        embeddings: 検索クエリの埋め込みに使う埋め込みモデル
+
+    Returns:
+        ベクターストア
+    """
+    if ct.VECTOR_BACKEND == "numpy":
+        return NumpyVectorStore(generation_path, embeddings)
+
+    return ChromaVectorStore(generation_path, embeddings)
+
+
+def clone_generation(source_path, generation_path):
+    """
+    差分更新の元にするインデックス世代のファイルを、新しい世代のフォルダに引き継ぐ
+    「numpy」形式はハードリンクで引き継ぐため変更量に比例した書き込みで済むが、Chromaは世代全体を複製する
+
+    Args:
+        source_path: 元にするインデックス世代の保存先フォルダのパス
+        generation_path: 新しいインデックス世代の保存先フォルダのパス
+    """
+    # Chromaは保存時にファイルを上書きするため、元の世代を壊さないよう複製する
+    if ct.VECTOR_BACKEND != "numpy":
+        shutil.copytree(source_path, generation_path, dirs_exist_ok=True)
+        return
+
+    # 「numpy」形式のファイルは書き出した後に変更せず、更新は別名のファイルへの書き出しと置き換えで行うため、
+    # ハードリンクで引き継ぐことで、コーパスの大きさによらずファイルの中身を複製しない
+    os.makedirs(generation_path, exist_ok=True)
+    for file_name in os.listdir(source_path):
+        source_file_path = os.path.join(source_path, file_name)
+        if not os.path.isfile(source_file_path):
+            continue
+        try:
+            os.link(source_file_path, os.path.join(generation_path, file_name))
+        except OSError:
+            # ハードリンクを作成できないファイルシステムでは複製する
+            shutil.copy2(source_file_path, os.path.join(generation_path, file_name))
+
+
+def write_segment(generation_path, get_rows, get_chunk, row_count, dim, dtype, search_type):
+    """
+    セグメントのファイル（行列・チャンクの情報・IVF検索用の情報）を書き出す
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        get_rows: 行番号の配列を受け取り、float32の行列を返す関数
+        get_chunk: 行番号を受け取り、(チャンクID, テキスト, メタデータ)を返す関数
+        row_count: 行数
+        dim: ベクトルの次元数
+        dtype: 行列の保存形式
+        search_type: 検索方式
+
+    Returns:
+        セグメントの情報
+    """
+    # 別名のファイルとして書き出し、セグメントの一覧に記録されるまでは読まれないようにする
+    name = f"segment-{uuid4().hex[:16]}"
+    segment_path = os.path.join(generation_path, name)
+
+    # IVF検索の場合、クラスタの中心を求めてから、同じクラスタの行が連続するように並べ替える
+    order = np.arange(row_count)
+    centroids = None
+    list_offsets = None
+    if search_type == "ivf" and row_count >= ct.VECTOR_IVF_MIN_ROWS:
+        centroids = train_centroids(get_rows, row_count)
+        labels = np.concatenate([
+            np.argmax(get_rows(np.arange(start, min(start + ct.VECTOR_SEARCH_BLOCK_ROWS, row_count))) @ centroids.T, axis=1)
+            for start in range(0, row_count, ct.VECTOR_SEARCH_BLOCK_ROWS)
+        ])
+        order = np.argsort(labels, kind="stable")
+        list_offsets = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        np.savez(f"{segment_path}{SEGMENT_IVF_SUFFIX}", centroids=centroids, list_offsets=list_offsets)
+
+    # 少しずつ書き出すことで、メモリ上に行列全体を展開しない
+    vectors_out = np.lib.format.open_memmap(
+        f"{segment_path}{SEGMENT_VECTORS_SUFFIX}", mode="w+", dtype=np.dtype(dtype), shape=(row_count, dim)
+    )
+    scales_out = np.empty(row_count, dtype=np.float32) if dtype == "int8" else None
+    for start in range(0, row_count, ct.VECTOR_SEARCH_BLOCK_ROWS):
+        end = min(start + ct.VECTOR_SEARCH_BLOCK_ROWS, row_count)
+        quantized, scales = quantize_rows(get_rows(order[start:end]), dtype)
+        vectors_out[start:end] = quantized
+        if scales_out is not None:
+            scales_out[start:end] = scales
+    vectors_out.flush()
+    del vectors_out
+    if scales_out is not None:
+        np.save(f"{segment_path}{SEGMENT_SCALES_SUFFIX}", scales_out)
+
+    # チャンクのテキスト・メタデータは1行ずつ書き出し、各行の開始位置を記録する
+    ids = []
+    offsets = np.empty(row_count + 1, dtype=np.int64)
+    offsets[0] = 0
+    with open(f"{segment_path}{SEGMENT_CHUNKS_SUFFIX}", "wb") as f:
+        for i, index in enumerate(order):
+            chunk_id, text, metadata = get_chunk(int(index))
+            ids.append(chunk_id)
+            offsets[i + 1] = offsets[i] + f.write(
+                (json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False) + "\n").encode("utf-8")
+            )
+    np.save(f"{segment_path}{SEGMENT_OFFSETS_SUFFIX}", offsets)
+    with open(f"{segment_path}{SEGMENT_IDS_SUFFIX}", "w", encoding="utf-8") as f:
+        json.dump(ids, f, ensure_ascii=False)
+
+    return {"name": name, "rows": row_count, "deleted_rows": [], "ivf": centroids is not None}
+
+
+def remove_segment_files(generation_path, name):
+    """
+    セグメントのファイルを削除
+
+    Args:
+        generation_path: インデックス世代の保存先フォルダのパス
+        name: セグメント名
+    """
+    for suffix in [
+        SEGMENT_VECTORS_SUFFIX, SEGMENT_SCALES_SUFFIX, SEGMENT_IDS_SUFFIX,
+        SEGMENT_CHUNKS_SUFFIX, SEGMENT_OFFSETS_SUFFIX, SEGMENT_IVF_SUFFIX
+    ]:
+        path = os.path.join(generation_path, f"{name}{suffix}")
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def write_json_atomic(path, data):
+    """
+    書き込み途中のファイルが読まれないよう、一時ファイルに書き込んでから置き換える
+    （ハードリンクで引き継いだファイルを書き換えず、別のファイルに置き換えることにもなる）
+
+    Args:
+        path: 書き込み先のファイルパス
+        data: 書き込むデータ
+    """
+    tmp_file_path = f"{path}.{uuid4().hex}.tmp"
+    with open(tmp_file_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_file_path, path)
+
+
+def normalize_rows(vectors):
+    """
+    内積がコサイン類似度になるよう、ベクトル（または行列の各行）を長さ1に正規化
+
+    Args:
+        vectors: ベクトル、または行列
+
+    Returns:
+        正規化したベクトル、または行列
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_rows(block, dtype):
+    """
+    float32の行列を保存形式に変換
+
+    Args:
+        block: float32の行列
+        dtype: 保存形式（"float32"、"float16"、"int8"）
+
+    Returns:
+        (変換した行列, 行ごとの倍率（int8以外はNone）)
+    """
+    if dtype != "int8":
+        return block.astype(dtype), None
+
+    # 行ごとに絶対値の最大が127になるよう倍率を決め、整数に丸める
+    scales = np.abs(block).max(axis=1) / 127
+    scales[scales == 0] = 1
+    quantized = np.clip(np.rint(block / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+
+    return quantized, scales.astype(np.float32)
+
+
+def train_centroids(get_rows, row_count):
+    """
+    IVF検索用のクラスタの中心を、k-means法（球面）で求める
+
+    Args:
+        get_rows: 行番号の配列を受け取り、float32の行列を返す関数
+        row_count: 行数
+
+    Returns:
+        正規化したクラスタの中心の行列
+    """
+    list_count = ct.VECTOR_IVF_LISTS or max(int(math.sqrt(row_count)), 1)
+    rng = np.random.default_rng(0)
+
+    # 全行ではなく、一部の行のみでクラスタの中心を求める
+    sample = get_rows(np.sort(rng.choice(row_count, size=min(row_count, ct.VECTOR_IVF_TRAIN_SAMPLE), replace=False)))
+    list_count = min(list_count, len(sample))
+    centroids = sample[rng.choice(len(sample), size=list_count, replace=False)]
+    for _ in range(ct.VECTOR_IVF_TRAIN_ITERATIONS):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(list_count):
+            members = sample[labels == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+
+    return centroids.astype(np.float32)
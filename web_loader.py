@@ -0,0 +1,283 @@
+"""
+このファイルは、RAGの参照先となるWebページを並列に取得し、ディスク上のキャッシュを使って読み込むファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+import httpx
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class WebPageCache:
+    """
+    Webページの本文と、条件付きリクエストに使うETag・Last-Modifiedをディスクに保存するキャッシュ
+    """
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir: キャッシュの保存先フォルダのパス
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_entry(self, url):
+        """
+        URLに対応するキャッシュの情報を取得
+
+        Args:
+            url: WebページのURL
+
+        Returns:
+            ETag・Last-Modified・取得日時・本文のハッシュ値などの辞書（キャッシュがない場合はNone）
+        """
+        entry_path, body_path = self._get_paths(url)
+        if not (os.path.isfile(entry_path) and os.path.isfile(body_path)):
+            return None
+
+        with open(entry_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_body(self, url):
+        """
+        URLに対応するキャッシュ済みの本文を取得
+
+        Args:
+            url: WebページのURL
+
+        Returns:
+            本文のバイト列
+        """
+        _, body_path = self._get_paths(url)
+        with open(body_path, "rb") as f:
+            return f.read()
+
+    def save(self, url, entry, body=None):
+        """
+        キャッシュの情報と本文を保存（本文がNoneの場合は情報のみ更新）
+
+        Args:
+            url: WebページのURL
+            entry: キャッシュの情報
+            body: 本文のバイト列
+        """
+        entry_path, body_path = self._get_paths(url)
+        # 本文を先に置き換えることで、情報と本文の組み合わせが食い違った状態で読まれないようにする
+        if body is not None:
+            write_atomic(body_path, body)
+        write_atomic(entry_path, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def _get_paths(self, url):
+        """
+        URLに対応するキャッシュファイルのパスを取得
+
+        Args:
+            url: WebページのURL
+
+        Returns:
+            (情報のファイルパス, 本文のファイルパス)
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.html")
+
+
+############################################################
+# 関数定義
+############################################################
+
+def refresh_web_pages(urls, force=False, client=None):
+    """
+    複数のWebページを並列に取得し、キャッシュを更新
+    - 前回の取得から更新間隔（WEB_REFRESH_INTERVAL_SECONDS）が経っていないページは取得しない
+    - キャッシュがあるページは条件付きリクエストを送り、変更がなければ本文を取得しない
+    - 取得に失敗したページは、キャッシュがあればそれを使う
+
+    Args:
+        urls: WebページのURLのリスト
+        force: 更新間隔によらず取得するかどうか
+        client: 取得に使うHTTPクライアント（Noneの場合は新しく作成）
+
+    Returns:
+        URL → {"hash": 本文のハッシュ値（取得できず、キャッシュもない場合はNone）, "status": 取得結果, "error": エラー内容}
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    if not urls:
+        return {}
+
+    start_time = time.perf_counter()
+    cache = WebPageCache(ct.WEB_CACHE_DIR_PATH)
+    owns_client = client is None
+    if owns_client:
+        client = create_http_client()
+
+    try:
+        # 1ページの待ち時間が他のページの取得を止めないよう、同時に取得するページ数を上限までに抑えて並列に取得
+        with ThreadPoolExecutor(max_workers=min(ct.WEB_LOAD_MAX_CONCURRENCY, len(urls))) as executor:
+            results = list(executor.map(lambda url: fetch_web_page(client, cache, url, force), urls))
+    finally:
+        if owns_client:
+            client.close()
+
+    statuses = [result["status"] for result in results]
+    logger.info({
+        "message": "Webページのキャッシュを更新しました。",
+        "urls": len(urls),
+        **{status: statuses.count(status) for status in dict.fromkeys(statuses)},
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3)
+    })
+
+    return dict(zip(urls, results))
+
+
+def fetch_web_page(client, cache, url, force=False):
+    """
+    1つのWebページを取得し、キャッシュを更新
+    取得に失敗しても例外を送出せず、他のページの取得を継続できるようにする
+
+    Args:
+        client: HTTPクライアント
+        cache: Webページのキャッシュ
+        url: WebページのURL
+        force: 更新間隔によらず取得するかどうか
+
+    Returns:
+        取得結果の辞書
+        - 「hash」: 本文から取り出したテキストのハッシュ値（取得できず、キャッシュもない場合はNone）
+        - 「status」: "fresh"（取得不要）、"not_modified"（変更なし）、"updated"（取得）、"stale"（失敗したためキャッシュを使用）、"failed"（失敗）
+        - 「error」: 失敗した場合のエラー内容（成功した場合はNone）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    entry = cache.get_entry(url)
+
+    # 更新間隔が経っていなければ、リクエストを送らずにキャッシュを使う
+    if entry and not force and time.time() - entry["fetched_at"] < ct.WEB_REFRESH_INTERVAL_SECONDS:
+        return {"hash": entry["hash"], "status": "fresh", "error": None}
+
+    # 前回の取得結果のETag・Last-Modifiedを付けて、変更がない場合は本文を受け取らない
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        response = client.get(url, headers=headers)
+        if response.status_code == 304 and entry:
+            cache.save(url, {**entry, "fetched_at": time.time()})
+            return {"hash": entry["hash"], "status": "not_modified", "error": None}
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.error({"message": "Webページの取得に失敗しました。", "url": url, "error": error, "cached": entry is not None})
+        # 取得に失敗しても、キャッシュがあれば前回の内容で読み込めるようにする
+        if entry:
+            return {"hash": entry["hash"], "status": "stale", "error": error}
+        return {"hash": None, "status": "failed", "error": error}
+
+    # 広告・日時などの違いで再読み込みが起きないよう、本文から取り出したテキストで変更を判定する
+    body = response.content
+    text_hash = hashlib.sha256(parse_html(body, url)[0].page_content.encode("utf-8")).hexdigest()
+    cache.save(url, {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+        "hash": text_hash
+    }, body)
+
+    return {"hash": text_hash, "status": "updated", "error": None}
+
+
+def load_web_page(url):
+    """
+    1つのWebページを、キャッシュ済みの本文から読み込み
+    読み込みに失敗しても例外を送出せず、他のデータソースの読み込みを継続できるようにする
+
+    Args:
+        url: WebページのURL
+
+    Returns:
+        読み込み結果の辞書（形式は「initialize.load_file_safely」と同じ）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start_time = time.perf_counter()
+    docs = []
+    error = None
+    try:
+        docs = parse_html(WebPageCache(ct.WEB_CACHE_DIR_PATH).get_body(url), url)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.error({"message": "Webページの読み込みに失敗しました。", "url": url, "error": error})
+
+    return {
+        "source": url,
+        "docs": docs,
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+        "error": error
+    }
+
+
+def parse_html(body, url):
+    """
+    HTMLからテキストとメタデータを取り出し、ドキュメントを作成（WebBaseLoaderと同じ形式）
+
+    Args:
+        body: HTMLのバイト列
+        url: WebページのURL
+
+    Returns:
+        ドキュメントのリスト
+    """
+    soup = BeautifulSoup(body, "html.parser")
+
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html := soup.find("html"):
+        metadata["language"] = html.get("lang", "No language found.")
+
+    return [Document(page_content=soup.get_text(), metadata=metadata)]
+
+
+def create_http_client():
+    """
+    Webページの取得に使うHTTPクライアントを作成
+
+    Returns:
+        HTTPクライアント
+    """
+    return httpx.Client(
+        timeout=httpx.Timeout(ct.WEB_LOAD_TIMEOUT_SECONDS),
+        limits=httpx.Limits(max_connections=ct.WEB_LOAD_MAX_CONCURRENCY),
+        headers={"User-Agent": os.environ.get("USER_AGENT", ct.WEB_LOAD_USER_AGENT)},
+        follow_redirects=True
+    )
+
+
+def write_atomic(path, data):
+    """
+    書き込み途中のファイルが読まれないよう、一時ファイルに書き込んでから置き換える
+
+    Args:
+        path: 書き込み先のファイルパス
+        data: 書き込むバイト列
+    """
+    tmp_file_path = f"{path}.{uuid4().hex}.tmp"
+    with open(tmp_file_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file_path, path)